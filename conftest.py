@@ -9,7 +9,7 @@ if src_path not in sys.path:
 import pytest
 import logging
 from playwright.sync_api import Page, expect, Browser
-from intelli_test.utilities import config
+from intelli_test.utilities import authSession, authStatus, config, identityStore
 
 def pytest_configure(config):
     """
@@ -32,8 +32,11 @@ def pytest_configure(config):
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
     # Add a file handler to log to a file.
+    # Parallel shards of the same run each get their own log file.
+    shard = os.getenv("INTELLI_TEST_SHARD")
+    log_filename = f"test_run-shard{shard}.log" if shard else 'test_run.log'
     file_handler = logging.FileHandler(
-        filename=os.path.join(logs_folder, 'test_run.log'),
+        filename=os.path.join(logs_folder, log_filename),
         mode='w'
     )
     file_handler.setFormatter(formatter)
@@ -44,25 +47,77 @@ def pytest_configure(config):
     stream_handler.setFormatter(formatter)
     root_logger.addHandler(stream_handler)
 
+    config.addinivalue_line(
+        "markers",
+        "isolated_context: give the test a brand-new authenticated browser context instead of the reused one."
+    )
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """Keeps each phase's report on the test item, so fixtures can tell in teardown whether the test failed."""
+    outcome = yield
+    report = outcome.get_result()
+    setattr(item, f"rep_{report.when}", report)
+
+@pytest.fixture(scope="session")
+def auth_context_pool(browser: Browser):
+    """
+    Loads the saved authentication state once per test session and reuses a context created from it.
+    An expired session fails every authenticated test immediately instead of each one timing out.
+    With AUTH_IDENTITY_BASE_URL set, each pytest process (e.g. each shard) leases a named identity
+    of that site instead of sharing auth_state.json with the others.
+    """
+    auth_file = config.AUTH_STATE_PATH
+    identity = None
+    if config.AUTH_IDENTITY_BASE_URL:
+        holder = f"pytest-{os.getpid()}-shard{os.getenv('INTELLI_TEST_SHARD', '0')}"
+        try:
+            identity = identityStore.lease(config.AUTH_IDENTITY_BASE_URL, holder=holder)
+        except (LookupError, TimeoutError, ValueError) as e:
+            pytest.fail(str(e))
+        if identity:
+            auth_file = identity["state_path"]
+            logging.getLogger(__name__).info(f"Using identity '{identity['name']}' for authenticated tests.")
+
+    # The lease is renewed in the background for as long as the session runs, however long that is.
+    with identityStore.keep_alive(identity):
+        if not os.path.exists(auth_file):
+            pytest.fail(
+                f"Authentication state file not found at '{auth_file}'. "
+                "Please run 'python -m utilities.create_auth_state' to generate it."
+            )
+        try:
+            storage_state = authStatus.load_state(auth_file)
+        except ValueError as e:
+            pytest.fail(str(e))
+        problem = authSession.expiry_problem(storage_state)
+        if problem:
+            pytest.fail(problem)
+
+        pool = authSession.AuthContextPool(browser, storage_state)
+        yield pool
+        pool.close()
+
 @pytest.fixture(scope="function")
-def logged_in_page(browser: Browser) -> Page:
+def logged_in_page(request, auth_context_pool: authSession.AuthContextPool) -> Page:
     """
     A fixture that provides a pre-authenticated page object by loading
     the saved authentication state
 
-    It creates a new browser context for isolation.
+    The page opens in a reused context that earlier tests may have used; its pages are closed and
+    cookies restored in between. Mark a test with `isolated_context`, or set AUTH_CONTEXT_ISOLATION,
+    to give it a new context of its own.
     """
-    auth_file = config.AUTH_STATE_PATH
-    if not os.path.exists(auth_file):
-        pytest.fail(
-            f"Authentication state file not found at '{auth_file}'. "
-            "Please run 'python -m utilities.create_auth_state' to generate it."
-        )
-
-    context = browser.new_context(storage_state=auth_file)
+    isolated = config.AUTH_CONTEXT_ISOLATION or request.node.get_closest_marker("isolated_context") is not None
+    context = auth_context_pool.new_context() if isolated else auth_context_pool.acquire()
     page = context.new_page()
 
     yield page
 
-    # Clean up the context to ensure no state leaks between tests.
-    context.close()
+    if isolated:
+        context.close()
+        return
+    # A context a failing test used may be in an unexpected state, so it isn't reused.
+    reports = (getattr(request.node, f"rep_{when}", None) for when in ("setup", "call"))
+    failed = any(report is not None and report.failed for report in reports)
+    auth_context_pool.release(context, discard=failed)
@@ -39,6 +39,16 @@ export const useDashboardData = (addToast) => {
         fetchData();
     }, [fetchData]);
 
+    // Keep the auth status current as auth_state.json changes or expires, without polling.
+    useEffect(() => {
+        const source = api.watchAuthState((status) => {
+            if (!status.error) {
+                setAuthState(status);
+            }
+        });
+        return () => source.close();
+    }, []);
+
     // 👇 ADD 'reports' to the return object 👇
     return { tests, fingerprints, authState, reports, loading, error, fetchData };
 };
\ No newline at end of file
@@ -75,6 +75,14 @@ export const runTest = (filename) => {
     }).then(handleResponse);
 };
 
+// Pushes the auth state status on connect and whenever it changes, instead of polling /files/auth-state.
+// Returns the EventSource; call .close() on it to stop watching.
+export const watchAuthState = (onStatus) => {
+    const source = new EventSource(`${API_BASE_URL}/files/auth-state/stream`);
+    source.addEventListener('status', (e) => onStatus(JSON.parse(e.data)));
+    return source;
+};
+
 export const fetchReports = () => {
     return fetch(`${API_BASE_URL}/files/reports`).then(handleResponse);
 };
@@ -1,21 +1,47 @@
 # api/main.py
 import logging
 import os
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 # Import the router objects from your new files
-from .routers import generation, auth, files, tests, settings
+from .routers import generation, auth, files, tests, settings, visual, reports
+from intelli_test import authRefresh, jobs
+from intelli_test.utilities import authStatus, browserPool, reportHistory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts long-lived resources when the API boots and tears them down on shutdown."""
+    # Warm browsers for fingerprint and auth jobs, so each job skips Chromium startup.
+    browserPool.start_pool()
+    # Run queued background jobs on a bounded pool of workers.
+    jobs.start_worker_pool()
+    # Pick up report files written while the API was down; the history store ignores ones it already has.
+    threading.Thread(target=reportHistory.backfill, name="report-history-backfill", daemon=True).start()
+    # Refresh the saved login before it expires, so test runs don't start with a dead session.
+    authRefresh.start_scheduler()
+    # Keep the auth status summary cached and push changes to dashboards.
+    authStatus.start_watcher()
+    yield
+    authStatus.stop_watcher()
+    authRefresh.stop_scheduler()
+    jobs.stop_worker_pool()
+    browserPool.stop_pool()
+
+
 app = FastAPI(
     title="SynapseQA API",
     description="API for orchestrating AI-powered web testing.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- Middleware Configuration ---
@@ -33,6 +59,8 @@ app.include_router(auth.router)
 app.include_router(files.router)
 app.include_router(tests.router)
 app.include_router(settings.router)
+app.include_router(visual.router)
+app.include_router(reports.router)
 
 
 # --- Static Files Mount (for Production) ---
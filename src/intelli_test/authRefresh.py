@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from intelli_test import jobs
+from intelli_test.tasks import AUTOMATED_AUTH_JOB
+from intelli_test.utilities import authStatus, config
+
+logger = logging.getLogger(__name__)
+
+# Settings saved by /authentication/auth_state/automated that go into the refresh job's payload.
+# The job reads the username and password from the saved settings itself, so they stay out of the queue.
+_LOGIN_FIELDS = ("login_url", "login_instructions", "fingerprint_filename")
+
+
+class AuthRefreshScheduler(threading.Thread):
+    """
+    Re-runs the automated login `margin` seconds before the saved session expires, using the
+    settings of the last automated login request, so test runs never start with a dead session.
+    The refresh goes through the job queue like a manual one; it's skipped while an automated auth
+    job is already queued or running. A failed refresh is retried after `retry_interval` seconds,
+    doubling with each further failure, and given up after `max_failures` in a row. A refresh that
+    succeeds but leaves the state due again (the expiry didn't move, or the site's cookies last less
+    than the margin) isn't repeated. Either way, refreshing resumes once the state's expiry changes.
+    """
+
+    def __init__(self, margin: float | None = None, check_interval: float | None = None, retry_interval: float | None = None,
+                 max_failures: int | None = None):
+        super().__init__(name="auth-refresh", daemon=True)
+        self.margin = config.AUTH_REFRESH_MARGIN if margin is None else margin
+        self.check_interval = check_interval or config.AUTH_REFRESH_CHECK_INTERVAL
+        self.retry_interval = retry_interval or config.AUTH_REFRESH_RETRY_INTERVAL
+        self.max_failures = max(1, max_failures or config.AUTH_REFRESH_MAX_FAILURES)
+        self._stop_event = threading.Event()
+        self.last_check: float | None = None
+        self.next_check: float | None = None
+        self.refresh_at: float | None = None
+        self.last_job_id: str | None = None
+        self.failures = 0
+        self.paused_reason: str | None = None
+        self._expires_at: float | None = None  # Expiry of the state the current refresh attempts are for
+        self._pending_job_id: str | None = None
+        self._retry_at = 0.0
+        self._warned_no_settings = False
+
+    def run(self):
+        logger.info(f"Auth refresh scheduler started (refreshing {self.margin:.0f}s before expiry).")
+        while True:
+            try:
+                delay = self.check()
+            except Exception as e:
+                logger.error(f"Auth refresh check failed: {e}", exc_info=True)
+                delay = self.retry_interval
+            self.next_check = time.time() + delay
+            if self._stop_event.wait(delay):
+                break
+        logger.info("Auth refresh scheduler stopped.")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self.join(timeout=timeout)
+
+    def check(self) -> float:
+        """Queues a refresh if one is due. Returns how many seconds to wait before checking again."""
+        now = time.time()
+        self.last_check = now
+        try:
+            status = authStatus.read_status()
+        except ValueError as e:
+            logger.warning(f"Auth refresh skipped: {e}")
+            self.refresh_at = None
+            return self.check_interval
+
+        if not status["exists"] or status["expires_at"] is None:
+            # Nothing to refresh, or no cookie expiry to schedule against.
+            self.refresh_at = None
+            return self.check_interval
+
+        outcome = None
+        if self._pending_job_id:
+            job = jobs.get_job(self._pending_job_id)
+            if job and job['status'] in (jobs.PENDING, jobs.RUNNING):
+                return self.check_interval
+            outcome = job['status'] if job else jobs.FAILED
+            self._pending_job_id = None
+
+        changed = status["expires_at"] != self._expires_at
+        if changed:
+            # A new state (from a refresh or anything else) starts the refresh bookkeeping over.
+            self._expires_at = status["expires_at"]
+            self.failures = 0
+            self.paused_reason = None
+            self._retry_at = 0.0
+
+        self.refresh_at = status["expires_at"] - self.margin
+        if now < self.refresh_at:
+            # Wake up at the refresh time, but keep checking in case the file is replaced meanwhile.
+            return min(self.check_interval, self.refresh_at - now)
+
+        if outcome == jobs.COMPLETE:
+            # The state is still due right after a successful refresh, so refreshing again won't help.
+            self.paused_reason = (
+                f"the refreshed state expires within the {self.margin:.0f}s margin" if changed
+                else "the refreshed state has the same expiry"
+            )
+            logger.warning(
+                f"Auth refresh succeeded, but {self.paused_reason} ({time.ctime(status['expires_at'])}; the soonest "
+                f"cookie expiry may belong to a short-lived cookie). Not refreshing again until the expiry changes; "
+                f"consider lowering AUTH_REFRESH_MARGIN."
+            )
+        elif outcome == jobs.FAILED and not changed:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.paused_reason = f"{self.failures} refreshes in a row failed"
+                logger.error(f"Auth refresh gave up: {self.paused_reason}. It resumes once the auth state changes.")
+            else:
+                backoff = self.retry_interval * 2 ** (self.failures - 1)
+                self._retry_at = now + backoff
+                logger.warning(f"Auth refresh failed ({self.failures}/{self.max_failures}). Retrying in {backoff:.0f}s.")
+
+        if self.paused_reason:
+            return self.check_interval
+        if now < self._retry_at:
+            return min(self.check_interval, self._retry_at - now)
+
+        settings = authStatus.load_settings()
+        if not settings or not settings.get("login_url") or not settings.get("login_instructions"):
+            if not self._warned_no_settings:
+                logger.warning("The auth state is about to expire, but there are no saved automated login settings to refresh it with.")
+                self._warned_no_settings = True
+            return self.check_interval
+        self._warned_no_settings = False
+
+        payload = {field: settings.get(field) for field in _LOGIN_FIELDS}
+        payload.update(headless=True, bypass_cache=False)
+        job_id, queued = jobs.submit_unless_active(AUTOMATED_AUTH_JOB, payload)
+        self.last_job_id = self._pending_job_id = job_id
+        if queued:
+            logger.info(f"Auth state expires at {time.ctime(status['expires_at'])}. Queued refresh job {job_id}.")
+        else:
+            logger.info(f"Auth state refresh is due, but automated auth job {job_id} is already active. Waiting for it.")
+        return self.check_interval
+
+    def get_status(self) -> dict:
+        return {
+            "running": self.is_alive(),
+            "margin": self.margin,
+            "refresh_at": self.refresh_at,
+            "last_check": self.last_check,
+            "next_check": self.next_check,
+            "last_job_id": self.last_job_id,
+            "consecutive_failures": self.failures,
+            "paused_reason": self.paused_reason
+        }
+
+
+# --- Application-wide Scheduler ---
+# Started and stopped by the FastAPI lifespan in api.py.
+_scheduler: AuthRefreshScheduler | None = None
+
+
+def start_scheduler() -> AuthRefreshScheduler | None:
+    """Starts the auth refresh scheduler unless it's disabled or already running."""
+    global _scheduler
+    if not config.AUTH_REFRESH_ENABLED:
+        logger.info("Auth refresh scheduler is disabled.")
+        return None
+    if _scheduler is None:
+        _scheduler = AuthRefreshScheduler()
+        _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    """Stops the auth refresh scheduler."""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+def get_scheduler() -> AuthRefreshScheduler | None:
+    """Returns the running scheduler, or None if it hasn't been started."""
+    return _scheduler
@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from intelli_test.utilities import config, sqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Job statuses. 'complete' and 'failed' are terminal and are what the dashboard polls for.
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, created_at);
+"""
+
+
+@dataclass
+class JobType:
+    name: str
+    handler: callable
+    concurrency: int
+    reports_progress: bool = False
+
+
+# How often each worker pool deletes finished jobs past their retention period, in seconds.
+_PRUNE_INTERVAL = 3600
+
+# Registered job handlers, keyed by job type name. Populated by intelli_test.tasks.
+_JOB_TYPES: dict[str, JobType] = {}
+
+
+def register_job_type(name: str, handler, concurrency: int = 1, reports_progress: bool = False):
+    """
+    Registers a handler for a job type. `concurrency` caps how many jobs of this type run
+    at once across every process sharing the jobs database. Handlers that report progress
+    receive an `on_progress(key, entry)` keyword argument.
+    """
+    _JOB_TYPES[name] = JobType(name, handler, max(1, concurrency), reports_progress)
+
+
+_db = sqliteStore.SQLiteStore(lambda: config.JOBS_DB_PATH, _SCHEMA, row_factory=sqlite3.Row)
+_connect = _db.connect
+
+
+def init_db():
+    """Creates the jobs table if needed. WAL mode lets status reads proceed while workers write."""
+    _db.init()
+
+
+def submit(job_type: str, payload: dict, priority: int = 0, progress: dict | None = None) -> str:
+    """
+    Persists a new pending job and returns its id. Higher priorities are claimed first.
+    `payload` is passed to the handler as keyword arguments, so it must be JSON-serialisable.
+    """
+    if job_type not in _JOB_TYPES:
+        raise ValueError(f"Unknown job type: '{job_type}'")
+    job_id = str(uuid.uuid4())
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, job_type, priority, status, payload, progress, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, job_type, priority, PENDING, json.dumps(payload),
+             json.dumps(progress) if progress is not None else None, time.time())
+        )
+    logger.info(f"Queued {job_type} job {job_id} with priority {priority}")
+    _wake_pool()
+    return job_id
+
+
+def submit_unless_active(job_type: str, payload: dict, priority: int = 0) -> tuple[str, bool]:
+    """
+    Queues a job unless one of the same type is already pending or running, checked and inserted in
+    one transaction so concurrent callers (e.g. schedulers in several API processes) queue it once.
+    Returns the id of the new or already active job, and whether a new one was queued.
+    """
+    if job_type not in _JOB_TYPES:
+        raise ValueError(f"Unknown job type: '{job_type}'")
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE job_type = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (job_type, PENDING, RUNNING)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row['id'], False
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO jobs (id, job_type, priority, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, priority, PENDING, json.dumps(payload), time.time())
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    logger.info(f"Queued {job_type} job {job_id} with priority {priority}")
+    _wake_pool()
+    return job_id, True
+
+
+def get_job(job_id: str) -> dict | None:
+    """Returns a job's state, or None if it doesn't exist."""
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job.pop('payload')
+    for field in ('progress', 'result'):
+        job[field] = json.loads(job[field]) if job[field] is not None else None
+    return job
+
+
+def update_progress(job_id: str, key: str, entry):
+    """Merges a single progress entry into a job's progress map."""
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        progress = json.loads(row['progress']) if row and row['progress'] else {}
+        progress[key] = entry
+        conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+        conn.execute("COMMIT")
+
+
+def _requeue_stale_jobs(conn: sqlite3.Connection, now: float):
+    """
+    Returns jobs whose worker stopped heartbeating (e.g. the process was killed) to the queue,
+    or fails them once they have used up their attempts. Must run inside a write transaction.
+    """
+    cutoff = now - config.JOB_STALE_SECONDS
+    conn.execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, error = 'Worker stopped responding.' "
+        "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+        (FAILED, now, RUNNING, cutoff, config.JOB_MAX_ATTEMPTS)
+    )
+    requeued = conn.execute(
+        "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+        (PENDING, RUNNING, cutoff)
+    ).rowcount
+    if requeued:
+        logger.warning(f"Requeued {requeued} job(s) from unresponsive workers.")
+
+
+def _claim_next(worker_id: str) -> sqlite3.Row | None:
+    """
+    Atomically claims the highest-priority pending job whose type still has spare capacity.
+    BEGIN IMMEDIATE serialises claims across processes, so per-type limits hold globally.
+    """
+    if not _JOB_TYPES:
+        return None
+    now = time.time()
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _requeue_stale_jobs(conn, now)
+            running = dict(conn.execute(
+                "SELECT job_type, COUNT(*) FROM jobs WHERE status = ? GROUP BY job_type", (RUNNING,)
+            ).fetchall())
+            available = [name for name, jt in _JOB_TYPES.items() if running.get(name, 0) < jt.concurrency]
+            if not available:
+                conn.execute("COMMIT")
+                return None
+            placeholders = ", ".join("?" for _ in available)
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND job_type IN ({placeholders}) "
+                "ORDER BY priority DESC, created_at LIMIT 1",
+                (PENDING, *available)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, worker_id, now, now, row['id'])
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _finish(job_id: str, status: str, result=None, error: str | None = None):
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+
+
+def prune_finished(now: float | None = None) -> int:
+    """Deletes completed and failed jobs that finished more than JOB_RETENTION_SECONDS ago. Returns how many."""
+    if config.JOB_RETENTION_SECONDS <= 0:
+        return 0
+    cutoff = (now or time.time()) - config.JOB_RETENTION_SECONDS
+    with _connect() as conn:
+        deleted = conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (COMPLETE, FAILED, cutoff)
+        ).rowcount
+    if deleted:
+        logger.info(f"Deleted {deleted} finished job(s) older than {config.JOB_RETENTION_SECONDS:.0f}s.")
+    return deleted
+
+
+class JobWorkerPool:
+    """
+    Claims jobs from the shared database and runs them on a bounded set of threads.
+    Every API process runs one pool; the database enforces per-type limits between them.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor: ThreadPoolExecutor | None = None
+        self._slots = threading.Semaphore(self.max_workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running_ids: set[str] = set()
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        init_db()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job-worker")
+        for target, name in ((self._dispatch_loop, "job-dispatcher"), (self._heartbeat_loop, "job-heartbeat")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job worker pool {self.worker_id} started with {self.max_workers} worker(s).")
+
+    def stop(self, timeout: float = 10.0):
+        """Stops claiming new jobs and waits for the dispatcher to exit. Running jobs finish in the background."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        logger.info(f"Job worker pool {self.worker_id} stopped.")
+
+    def wake(self):
+        self._wake.set()
+
+    def _dispatch_loop(self):
+        next_prune = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + _PRUNE_INTERVAL
+                try:
+                    prune_finished()
+                except Exception as e:
+                    logger.warning(f"Could not delete old jobs: {e}")
+            if not self._slots.acquire(timeout=config.JOB_POLL_INTERVAL):
+                continue
+            try:
+                row = _claim_next(self.worker_id)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}", exc_info=True)
+                row = None
+            if row is None:
+                self._slots.release()
+                self._wake.wait(timeout=config.JOB_POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            with self._lock:
+                self._running_ids.add(row['id'])
+            self._executor.submit(self._run_job, row)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(timeout=config.JOB_HEARTBEAT_INTERVAL):
+            with self._lock:
+                running_ids = list(self._running_ids)
+            if not running_ids:
+                continue
+            placeholders = ", ".join("?" for _ in running_ids)
+            try:
+                with _connect() as conn:
+                    conn.execute(
+                        f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({placeholders})",
+                        (time.time(), *running_ids)
+                    )
+            except Exception as e:
+                logger.warning(f"Could not record job heartbeat: {e}")
+
+    def _run_job(self, row: sqlite3.Row):
+        job_id = row['id']
+        job_type = _JOB_TYPES.get(row['job_type'])
+        try:
+            if job_type is None:
+                raise ValueError(f"No handler registered for job type '{row['job_type']}'")
+            kwargs = json.loads(row['payload'])
+            if job_type.reports_progress:
+                kwargs['on_progress'] = lambda key, entry: update_progress(job_id, key, entry)
+            logger.info(f"Starting {row['job_type']} job {job_id}")
+            result = job_type.handler(**kwargs)
+            _finish(job_id, COMPLETE, result=result)
+            logger.info(f"Job {job_id} complete")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            _finish(job_id, FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._running_ids.discard(job_id)
+            self._slots.release()
+            self._wake.set()
+
+
+# --- Application-wide Pool ---
+# Started and stopped by the FastAPI lifespan in api.py.
+_pool: JobWorkerPool | None = None
+
+
+def start_worker_pool(max_workers: int | None = None) -> JobWorkerPool:
+    """Creates and starts this process's job worker pool if it isn't running yet."""
+    global _pool
+    if _pool is None:
+        _pool = JobWorkerPool(max_workers or config.JOB_WORKERS)
+        _pool.start()
+    return _pool
+
+
+def stop_worker_pool():
+    """Stops this process's job worker pool."""
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+def _wake_pool():
+    # Jobs submitted in this process are picked up immediately rather than on the next poll.
+    if _pool is not None:
+        _pool.wake()
@@ -2,10 +2,12 @@ import os
 import logging
 import json
 from fastapi import APIRouter, HTTPException
-from intelli_test.utilities import config
-from intelli_test.schemas import AuthStateRequest, AutomatedAuthStateRequest
-from intelli_test.tasks import run_create_auth_state, run_automated_auth_creation
+from intelli_test.utilities import config, identityStore
+from intelli_test.schemas import AuthStateRequest, AutomatedAuthStateRequest, IdentityBulkRequest, IdentityRefreshRequest
+from intelli_test import authRefresh, jobs
+from intelli_test.tasks import run_create_auth_state, AUTOMATED_AUTH_JOB, IDENTITY_AUTH_JOB
 from fastapi import BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +18,18 @@ router = APIRouter(
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
+
+def _validate_login_request(login_url: str, fingerprint_filename: str | None):
+    if not login_url.startswith("http"):
+        raise HTTPException(status_code=400, detail="Invalid login_url provided. Must start with http or https.")
+    if fingerprint_filename:
+        if not fingerprint_filename.endswith(".json"):
+            raise HTTPException(status_code=400, detail="fingerprint_filename must end with .json")
+        if "/" in fingerprint_filename or "\\" in fingerprint_filename:
+            raise HTTPException(
+                status_code=400, detail="fingerprint_filename cannot contain path separators."
+            )
+
 @router.post("/auth_state/manual", status_code=202)
 async def create_auth_state(request: AuthStateRequest, background_tasks: BackgroundTasks):
     """
@@ -32,10 +46,11 @@ async def create_auth_state(request: AuthStateRequest, background_tasks: Backgro
 
 
 @router.post("/auth_state/automated", status_code=202)
-async def create_automated_auth_state(request: AutomatedAuthStateRequest, background_tasks: BackgroundTasks):
+async def create_automated_auth_state(request: AutomatedAuthStateRequest):
     """
     Triggers an AI-driven process to log in and save the authentication state.
-    It also saves the request details to pre-fill the form on subsequent visits.
+    It also saves the request details to pre-fill the form on subsequent visits. The job reads the
+    username and password back from those settings, so they never sit in the job queue.
     """
     # Save the request data for future use
     try:
@@ -43,30 +58,16 @@ async def create_automated_auth_state(request: AutomatedAuthStateRequest, backgr
             json.dump(request.dict(), f, indent=2)
         logger.info(f"Saved automated auth settings to {config.AUTH_SETTINGS_PATH}")
     except Exception as e:
-        # Log the error but don't fail the request, as saving is a convenience feature.
         logger.warning(f"Could not save automated auth settings: {e}", exc_info=True)
+        # Without the settings file the job has no way to get the credentials.
+        if request.username or request.password:
+            raise HTTPException(status_code=500, detail="Could not save the login credentials for the background job.")
 
-    if not request.login_url.startswith("http"):
-        raise HTTPException(status_code=400, detail="Invalid login_url provided. Must start with http or https.")
-    if request.fingerprint_filename:
-        if not request.fingerprint_filename.endswith(".json"):
-            raise HTTPException(status_code=400, detail="fingerprint_filename must end with .json")
-        if "/" in request.fingerprint_filename or "\\" in request.fingerprint_filename:
-            raise HTTPException(
-                status_code=400, detail="fingerprint_filename cannot contain path separators."
-            )
+    _validate_login_request(request.login_url, request.fingerprint_filename)
 
     logger.info(f"Received automated auth state request for URL: {request.login_url}")
-    background_tasks.add_task(
-        run_automated_auth_creation,
-        request.login_url,
-        request.login_instructions,
-        request.fingerprint_filename,
-        request.headless,
-        request.username,
-        request.password
-    )
-    return {"message": "Automated authentication state creation has been started in the background."}
+    task_id = await run_in_threadpool(jobs.submit, AUTOMATED_AUTH_JOB, request.dict(exclude={"username", "password"}))
+    return {"message": "Automated authentication state creation has been started in the background.", "task_id": task_id}
 
 
 @router.get("/auth_state/automated/settings")
@@ -85,3 +86,97 @@ async def get_automated_auth_settings():
         logger.error(f"Could not read or parse automated auth settings file: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Could not read automated auth settings file.")
 
+
+@router.get("/auth_state/refresh")
+async def get_auth_refresh_status():
+    """
+    Returns the state of the background auth refresh: when the next refresh is due,
+    when it last checked, and the id of the last refresh job it queued.
+    """
+    scheduler = authRefresh.get_scheduler()
+    if scheduler is None:
+        return {"running": False, "enabled": config.AUTH_REFRESH_ENABLED}
+    return {"enabled": True, **scheduler.get_status()}
+
+
+def _submit_identity_logins(base_url: str, names: list[str], bypass_cache: bool, priority: int) -> dict[str, str]:
+    # One job per identity; they log in side by side, up to JOB_CONCURRENCY_IDENTITY_AUTH at once.
+    return {
+        name: jobs.submit(IDENTITY_AUTH_JOB, {"base_url": base_url, "name": name, "bypass_cache": bypass_cache}, priority=priority)
+        for name in names
+    }
+
+
+@router.post("/identities", status_code=202)
+async def create_identities(request: IdentityBulkRequest):
+    """
+    Registers (or updates) named login identities for a site, each with its own credentials and
+    auth state, so parallel test workers can each lease a session of their own. With `refresh`
+    (the default) every identity is logged in right away by concurrent background jobs.
+    """
+    _validate_login_request(request.login_url, request.fingerprint_filename)
+    names = [identity.name for identity in request.identities]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Identity names must be unique.")
+
+    def register():
+        return [
+            identityStore.upsert_identity(
+                request.base_url, identity.name, identity.username, identity.password,
+                request.login_url, request.login_instructions, request.fingerprint_filename
+            )
+            for identity in request.identities
+        ]
+
+    try:
+        identities = await run_in_threadpool(register)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    base_url = identities[0]["base_url"] if identities else request.base_url
+    logger.info(f"Registered {len(identities)} identit{'y' if len(identities) == 1 else 'ies'} for {base_url}.")
+
+    task_ids = {}
+    if request.refresh and names:
+        task_ids = await run_in_threadpool(_submit_identity_logins, base_url, names, False, request.priority)
+    return {"base_url": base_url, "identities": names, "task_ids": task_ids}
+
+
+@router.post("/identities/refresh", status_code=202)
+async def refresh_identities(request: IdentityRefreshRequest):
+    """Logs identities in again, all of a site's by default, and saves their new auth states."""
+    try:
+        identities = await run_in_threadpool(identityStore.list_identities, request.base_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    known = {identity["name"] for identity in identities}
+    names = request.names if request.names is not None else sorted(known)
+    missing = [name for name in names if name not in known]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown identities: {', '.join(missing)}")
+    if not names:
+        raise HTTPException(status_code=404, detail=f"No identities registered for {request.base_url}.")
+
+    base_url = identityStore.normalize_base_url(request.base_url)
+    task_ids = await run_in_threadpool(_submit_identity_logins, base_url, names, request.bypass_cache, request.priority)
+    return {"base_url": base_url, "task_ids": task_ids}
+
+
+@router.get("/identities")
+async def list_identities(base_url: str | None = None):
+    """Lists registered identities (without passwords), with their expiry and active lease count."""
+    try:
+        return await run_in_threadpool(identityStore.list_identities, base_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/identities/{name}")
+async def delete_identity(name: str, base_url: str):
+    """Removes an identity along with its saved auth state."""
+    try:
+        removed = await run_in_threadpool(identityStore.remove_identity, base_url, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=404, detail="Identity not found")
+    return {"message": f"Identity '{name}' removed."}
@@ -1,9 +1,14 @@
+import asyncio
+import hashlib
 import os
 import logging
 import json
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from datetime import datetime
-from intelli_test.utilities import config
+from intelli_test.utilities import authStatus, config, fingerprintIndex, healJournal
+from ..schemas import HealPromotionRequest
 from ..security import get_secure_path, get_secure_path_for_delete
 
 logger = logging.getLogger(__name__)
@@ -18,17 +23,57 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 @router.get("/fingerprints")
 async def list_fingerprint_files():
     """Returns a list of available fingerprint JSON files."""
-    # Use the project_root defined at the top of this file for reliability
-    elements_dir = os.path.join(project_root, 'elements')
-    if not os.path.isdir(elements_dir):
-        logger.warning(f"Fingerprints directory not found at '{elements_dir}'. Returning empty list.")
-        return [] # Return empty list if directory doesn't exist
     try:
-        return [f for f in os.listdir(elements_dir) if f.endswith('.json')]
+        categories = await run_in_threadpool(fingerprintIndex.list_categories)
+        return [f"{category}.json" for category in categories]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/heals")
+async def list_heals(
+    fingerprint_filename: str | None = Query(None, description="Only show heals for this fingerprint file, e.g. 'loginPage.json'")
+):
+    """Returns selectors healed at test time that haven't been promoted into their fingerprint files yet."""
+    category = fingerprint_filename.removesuffix('.json') if fingerprint_filename else None
+    try:
+        return await run_in_threadpool(healJournal.list_heals, category)
+    except Exception as e:
+        logger.error(f"Could not read the heal journal: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not read the heal journal.")
+
+
+@router.post("/heals/promote")
+async def promote_heals(request: HealPromotionRequest):
+    """Writes journaled heals into the fingerprint file as the new primary selectors."""
+    secure_path = get_secure_path("fingerprint", request.fingerprint_filename)
+    category = request.fingerprint_filename.removesuffix('.json')
+    try:
+        result = await run_in_threadpool(healJournal.promote, category, str(secure_path), request.element_keys)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail=f"'{request.fingerprint_filename}' is not a valid JSON file.")
+    except Exception as e:
+        logger.error(f"Could not promote heals for '{request.fingerprint_filename}': {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not promote healed selectors.")
+    logger.info(f"Promoted heals for '{request.fingerprint_filename}': {result}")
+    return result
+
+
+@router.delete("/heals")
+async def discard_heals(
+    fingerprint_filename: str = Query(..., description="The fingerprint file the heals belong to"),
+    element_key: str | None = Query(None, description="Only discard the heal for this element")
+):
+    """Discards journaled heals, e.g. when a heal picked the wrong element."""
+    category = fingerprint_filename.removesuffix('.json')
+    try:
+        removed = await run_in_threadpool(healJournal.discard, category, element_key)
+    except Exception as e:
+        logger.error(f"Could not discard heals for '{fingerprint_filename}': {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not update the heal journal.")
+    return {"message": f"Discarded {removed} heal(s) for '{fingerprint_filename}'."}
+
+
 @router.get("/tests")
 async def list_test_files():
     """Returns a list of available test Python files."""
@@ -47,52 +92,77 @@ async def list_test_files():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _format_auth_status(status: dict) -> dict:
+    status = dict(status)
+    for field in ("last_modified", "expires_at"):
+        if status.get(field) is not None:
+            status[field] = datetime.fromtimestamp(status[field]).isoformat()
+    return status
+
+
+async def _current_auth_status() -> dict:
+    # While the watcher runs the cached status is in memory; otherwise reading it stats and parses the file.
+    if authStatus.is_watching():
+        return _format_auth_status(authStatus.cached_status())
+    return _format_auth_status(await run_in_threadpool(authStatus.cached_status))
+
+
 @router.get("/auth-state")
-async def get_auth_state_status():
+async def get_auth_state_status(if_none_match: str | None = Header(None)):
     """
     Checks for the existence, modification time, and expiration status of the auth_state.json file.
+    The parsed status is cached and served with an ETag; a request whose If-None-Match matches
+    gets an empty 304. Subscribe to /files/auth-state/stream to be pushed changes instead of polling.
     """
-    auth_path = config.AUTH_STATE_PATH
-    if os.path.exists(auth_path):
+    try:
+        status = await _current_auth_status()
+    except ValueError as e:
+        logger.error(f"Could not parse auth file at '{config.AUTH_STATE_PATH}': {e}")
+        raise HTTPException(status_code=500, detail="Could not parse auth file.")
+    except Exception as e:
+        logger.error(f"Could not read auth file metadata from '{config.AUTH_STATE_PATH}': {e}")
+        raise HTTPException(status_code=500, detail="Could not read auth file metadata.")
+
+    etag = '"' + hashlib.blake2b(json.dumps(status, sort_keys=True).encode("utf-8"), digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    if not status["exists"]:
+        logger.warning(f"Auth state file not found at '{config.AUTH_STATE_PATH}'.")
+    return JSONResponse(content=status, headers=headers)
+
+
+async def _auth_status_events(request: Request):
+    queue = authStatus.subscribe()
+    try:
         try:
-            with open(auth_path, 'r', encoding='utf-8') as f:
-                auth_data = json.load(f)
-
-            last_modified_timestamp = os.path.getmtime(auth_path)
-            last_modified_dt = datetime.fromtimestamp(last_modified_timestamp)
-
-            cookies = auth_data.get("cookies", [])
-            if not cookies:
-                logger.warning(f"Auth state file at '{auth_path}' contains no cookies. Treating as expired.")
-                return {"exists": True, "last_modified": last_modified_dt.isoformat(), "expires_at": None, "is_expired": True}
-
-            # Find the expiration timestamp from the cookies. A session is invalid if any of its cookies expire.
-            # We look for the soonest expiration time. Timestamps of -1 mean it's a session cookie.
-            expirations = [
-                cookie.get("expires")
-                for cookie in cookies
-                if cookie.get("expires") and cookie.get("expires") != -1
-            ]
-
-            if not expirations:
-                logger.info(f"Auth state file at '{auth_path}' contains no expiring cookies. Cannot determine exact expiration time.")
-                return {"exists": True, "last_modified": last_modified_dt.isoformat(), "expires_at": None, "is_expired": False}
-
-            # The session expires when the first cookie expires.
-            soonest_expiration_ts = min(expirations)
-            expires_at_dt = datetime.fromtimestamp(soonest_expiration_ts)
-            is_expired = datetime.now() > expires_at_dt
-
-            return {"exists": True, "last_modified": last_modified_dt.isoformat(), "expires_at": expires_at_dt.isoformat(), "is_expired": is_expired}
-        except (json.JSONDecodeError, KeyError) as e:
-            logger.error(f"Could not parse auth file at '{auth_path}': {e}")
-            raise HTTPException(status_code=500, detail="Could not parse auth file.")
-        except Exception as e:
-            logger.error(f"Could not read auth file metadata from '{auth_path}': {e}")
-            raise HTTPException(status_code=500, detail="Could not read auth file metadata.")
-    else:
-        logger.warning(f"Auth state file not found at '{auth_path}'.")
-        return {"exists": False, "last_modified": None, "expires_at": None, "is_expired": True}
+            current = await _current_auth_status()
+        except ValueError as e:
+            current = {"error": str(e)}
+        yield f"event: status\ndata: {json.dumps(current)}\n\n"
+        while not await request.is_disconnected():
+            try:
+                status = await asyncio.wait_for(queue.get(), timeout=15)
+            except asyncio.TimeoutError:
+                # Comment lines keep proxies from closing an idle stream.
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: status\ndata: {json.dumps(_format_auth_status(status))}\n\n"
+    finally:
+        authStatus.unsubscribe(queue)
+
+
+@router.get("/auth-state/stream")
+async def stream_auth_state_status(request: Request):
+    """
+    Pushes the auth state status as server-sent `status` events: the current status on connect,
+    then again whenever auth_state.json changes or the session expires.
+    """
+    return StreamingResponse(
+        _auth_status_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/content")
 async def get_file_content(
@@ -118,20 +188,26 @@ async def get_file_content(
         logger.error(f"Error reading file '{filename}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Could not read the file.")
 
-@router.get("/reports")
-async def list_report_files():
-    """Returns a sorted list of available test report JSON files."""
+def _list_report_names() -> list[str]:
     reports_dir = config.PROJECT_ROOT.parent / "reports"
     logger.info(f"Looking for reports in: {reports_dir}")
     if not reports_dir.is_dir():
         logger.warning(f"Reports directory not found at '{reports_dir}'. Returning empty list.")
         return []
+    # Get all json files and sort them by modification time (newest first)
+    sorted_files = sorted(reports_dir.glob("*.json"), key=os.path.getmtime, reverse=True)
+    logger.info(f"Found {len(sorted_files)} report files.")
+    return [f.name for f in sorted_files]
+
+
+@router.get("/reports")
+async def list_report_files():
+    """
+    Returns the test report JSON files currently on disk, newest first.
+    Past runs, including those of deleted or overwritten reports, are in the history under /reports.
+    """
     try:
-        # Get all json files and sort them by modification time (newest first)
-        files = reports_dir.glob("*.json")
-        sorted_files = sorted(files, key=os.path.getmtime, reverse=True)
-        logger.info(f"Found {len(sorted_files)} report files.")
-        return [f.name for f in sorted_files]
+        return await run_in_threadpool(_list_report_names)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
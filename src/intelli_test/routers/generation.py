@@ -1,8 +1,9 @@
 import logging
-import uuid
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from intelli_test.schemas import FingerprintRequest, TestGenerationRequest
-from intelli_test.tasks import run_fingerprint_generation, run_test_generation
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from intelli_test import jobs
+from intelli_test.schemas import FingerprintRequest, TestGenerationRequest, BatchFingerprintRequest
+from intelli_test.tasks import FINGERPRINT_JOB, TEST_GENERATION_JOB, BATCH_FINGERPRINT_JOB
 
 logger = logging.getLogger(__name__)
 router = APIRouter(
@@ -10,24 +11,8 @@ router = APIRouter(
     tags=["Generation"]  # Groups endpoints in the API docs
 )
 
-# Dictionary to store running tasks
-# TODO: Repace with Redis or another persistent store for production
-tasks = {}
-
-def run_task_wrapper(task_id:str, func, *args, **kwargs):
-    """
-    Wrapper to run a task in the background with a unique ID.
-    """
-    logger.info(f"Starting task {task_id} with args: {args}, kwargs: {kwargs}")
-    try:
-        func(*args, **kwargs)
-        tasks[task_id]['status'] = 'complete'
-    except Exception as e:
-        logger.error(f"Task {task_id} failed: {e}")
-        tasks[task_id]['status'] = 'failed'
-
 @router.post("/test", status_code=202)
-async def create_test_file(request: TestGenerationRequest, background_tasks: BackgroundTasks):
+async def create_test_file(request: TestGenerationRequest):
     """
     Accepts a natural language description and generates a new Python test file.
     """
@@ -53,28 +38,28 @@ async def create_test_file(request: TestGenerationRequest, background_tasks: Bac
                 status_code=400, detail="fingerprint_filename cannot contain path separators."
             )
 
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {'status': 'pending'}
-
-    logger.info(f"Starting test generation for file: {file_name} with task_id: {task_id}")
-    
-    # Add wrapper function to background tasks
-    background_tasks.add_task(
-        run_task_wrapper,
-        task_id,
-        run_test_generation,
-        request.description,
-        request.file_name,
-        request.fingerprint_filename,
-        request.requires_login
+    # Queue the job; a worker from the bounded pool picks it up.
+    task_id = await run_in_threadpool(
+        jobs.submit,
+        TEST_GENERATION_JOB,
+        {
+            "description": request.description,
+            "file_name": request.file_name,
+            "fingerprint_filename": request.fingerprint_filename,
+            "requires_login": request.requires_login,
+            "bypass_cache": request.bypass_cache
+        },
+        priority=request.priority
     )
+
+    logger.info(f"Queued test generation for file: {file_name} with task_id: {task_id}")
     
     # Return the task_id to the client
     return {"message": f"Test file generation for '{file_name}' has started.", "task_id": task_id}
 
 
 @router.post("/fingerprint", status_code=202)
-async def create_fingerprint(request: FingerprintRequest, background_tasks: BackgroundTasks):
+async def create_fingerprint(request: FingerprintRequest):
     """
     Accepts a URL and triggers the AI-powered element fingerprinting process
     in the background.
@@ -82,32 +67,74 @@ async def create_fingerprint(request: FingerprintRequest, background_tasks: Back
     if not request.url.startswith("http"):
         raise HTTPException(status_code=400, detail="Invalid URL provided. Must start with http or https.")
 
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {'status': 'pending'}
-
-    logger.info(f"Starting fingerprint request for URL: {request.url} with task_id: {task_id}")
-    
-    # Add wrapper function to background tasks
-    background_tasks.add_task(
-        run_task_wrapper,
-        task_id,
-        run_fingerprint_generation,
-        request.url,
-        request.output_filename,
-        request.use_authentication,
-        request.allow_redirects
+    # Queue the job; a worker from the bounded pool picks it up.
+    task_id = await run_in_threadpool(
+        jobs.submit,
+        FINGERPRINT_JOB,
+        {
+            "url": request.url,
+            "output_filename": request.output_filename,
+            "use_authentication": request.use_authentication,
+            "allow_redirects": request.allow_redirects,
+            "bypass_cache": request.bypass_cache,
+            "incremental": request.incremental
+        },
+        priority=request.priority
     )
+
+    logger.info(f"Queued fingerprint request for URL: {request.url} with task_id: {task_id}")
     
     # Return the task_id to the client
     return {"message": "Fingerprint generation has started.", "task_id": task_id}
 
+@router.post("/fingerprint/batch", status_code=202)
+async def create_fingerprint_batch(request: BatchFingerprintRequest):
+    """
+    Accepts a list of fingerprint requests and processes them concurrently in the background.
+    Poll /generate/status/{task_id} for per-URL progress.
+    """
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="At least one fingerprint request must be provided.")
+    for item in request.requests:
+        if not item.url.startswith("http"):
+            raise HTTPException(status_code=400, detail=f"Invalid URL provided: '{item.url}'. Must start with http or https.")
+    output_filenames = [item.output_filename for item in request.requests]
+    if len(set(output_filenames)) != len(output_filenames):
+        raise HTTPException(status_code=400, detail="Each request in a batch must have a unique output_filename.")
+    for limit in (request.max_concurrent_pages, request.max_concurrent_llm_calls):
+        if limit is not None and limit < 1:
+            raise HTTPException(status_code=400, detail="Concurrency limits must be at least 1.")
+
+    task_id = await run_in_threadpool(
+        jobs.submit,
+        BATCH_FINGERPRINT_JOB,
+        {
+            "requests": [item.dict() for item in request.requests],
+            "max_concurrent_pages": request.max_concurrent_pages,
+            "max_concurrent_llm_calls": request.max_concurrent_llm_calls
+        },
+        priority=request.priority,
+        progress={item.output_filename: {"url": item.url, "status": "queued", "error": None} for item in request.requests}
+    )
+
+    logger.info(f"Queued batch fingerprint request for {len(request.requests)} URL(s) with task_id: {task_id}")
+
+    return {"message": f"Batch fingerprint generation for {len(request.requests)} URL(s) has started.", "task_id": task_id}
+
 @router.get("/status/{task_id}")
 async def get_task_status(task_id: str):
     """
     Poll this endpoint with a task_id to check the status of a background job.
     """
-    task = tasks.get(task_id)
+    task = await run_in_threadpool(jobs.get_job, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return {"task_id": task_id, "status": task['status']}
\ No newline at end of file
+    response = {"task_id": task_id, "status": task['status']}
+    if task['progress'] is not None:
+        response['progress'] = task['progress']
+    if task['error']:
+        response['error'] = task['error']
+    if task['result'] is not None:
+        response['result'] = task['result']
+    return response
\ No newline at end of file
@@ -0,0 +1,94 @@
+import logging
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from intelli_test.utilities import durationAnalytics, reportHistory
+
+logger = logging.getLogger(__name__)
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"]
+)
+
+
+@router.get("/runs")
+async def list_runs(
+    source: str | None = Query(None, description="Only runs from this report file, e.g. 'report-all-tests.json'"),
+    since: float | None = Query(None, description="Only runs created at or after this Unix timestamp"),
+    until: float | None = Query(None, description="Only runs created before this Unix timestamp"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None, description="The next_cursor of the previous page")
+):
+    """Returns run summaries, newest first, one page at a time."""
+    try:
+        return await run_in_threadpool(reportHistory.list_runs, source, since, until, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: int):
+    """Returns a run's summary together with its full original report."""
+    run = await run_in_threadpool(reportHistory.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.get("/tests")
+async def list_test_results(
+    nodeid: str | None = Query(None, description="Only results for this pytest node id"),
+    outcome: str | None = Query(None, description="Only results with this outcome, e.g. 'failed'"),
+    since: float | None = Query(None, description="Only results from runs created at or after this Unix timestamp"),
+    until: float | None = Query(None, description="Only results from runs created before this Unix timestamp"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None, description="The next_cursor of the previous page")
+):
+    """Returns individual test results across all stored runs, newest first, one page at a time."""
+    try:
+        return await run_in_threadpool(reportHistory.list_test_results, nodeid, outcome, since, until, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/ingest")
+async def ingest_reports():
+    """Ingests any report files in the reports folder that aren't in the history store yet."""
+    try:
+        added = await run_in_threadpool(reportHistory.backfill)
+    except Exception as e:
+        logger.error(f"Report history backfill failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not ingest reports.")
+    return {"message": f"Ingested {added} new run(s)."}
+
+
+@router.get("/analytics/durations")
+async def get_duration_stats(
+    nodeid: str | None = Query(None, description="Only this pytest node id"),
+    since: float | None = Query(None, description="Only runs created at or after this Unix timestamp"),
+    until: float | None = Query(None, description="Only runs created before this Unix timestamp"),
+    min_runs: int = Query(1, ge=1, description="Skip tests with fewer recorded runs")
+):
+    """Returns p50/p95/mean/max duration per test and its mean setup/call/teardown split, slowest first."""
+    return await run_in_threadpool(durationAnalytics.duration_stats, since, until, nodeid, min_runs)
+
+
+@router.get("/analytics/slowest")
+async def get_slowest_tests(
+    limit: int = Query(20, ge=1, le=500),
+    since: float | None = Query(None, description="Only runs created at or after this Unix timestamp"),
+    until: float | None = Query(None, description="Only runs created before this Unix timestamp")
+):
+    """Returns the tests with the highest p95 duration."""
+    return await run_in_threadpool(durationAnalytics.slowest_tests, limit, since, until)
+
+
+@router.get("/analytics/regressions")
+async def get_duration_regressions(
+    baseline_runs: int | None = Query(None, ge=2, description="Runs in the rolling baseline. Defaults to DURATION_BASELINE_RUNS"),
+    recent_runs: int | None = Query(None, ge=1, description="Recent runs compared against it. Defaults to DURATION_RECENT_RUNS"),
+    min_ratio: float | None = Query(None, gt=1, description="Minimum slowdown factor. Defaults to DURATION_REGRESSION_RATIO"),
+    min_increase: float | None = Query(None, ge=0, description="Minimum slowdown in seconds. Defaults to DURATION_REGRESSION_MIN_SECONDS"),
+    since: float | None = Query(None, description="Only consider runs created at or after this Unix timestamp")
+):
+    """Returns tests whose recent runs are markedly slower than their rolling baseline, largest jump first."""
+    return await run_in_threadpool(durationAnalytics.detect_regressions, baseline_runs, recent_runs, min_ratio, min_increase, since)
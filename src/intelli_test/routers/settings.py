@@ -1,8 +1,9 @@
 import logging
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from dotenv import set_key, find_dotenv
-from intelli_test.utilities import config
+from intelli_test.utilities import config, llmCache, loginScriptCache
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/settings", tags=["Settings"])
@@ -36,4 +37,42 @@ async def save_api_key(request: ApiKeyRequest):
         return {"message": "API Key saved successfully."}
     except Exception as e:
         logger.error(f"Failed to save API Key to .env file: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Could not save the API key.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Could not save the API key.")
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats():
+    """Returns hit/miss counters and the size of the LLM response cache."""
+    try:
+        return await run_in_threadpool(llmCache.get_stats)
+    except Exception as e:
+        logger.error(f"Failed to read LLM cache stats: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not read LLM cache stats.")
+
+@router.delete("/llm-cache")
+async def clear_llm_cache():
+    """Deletes every cached LLM response."""
+    try:
+        await run_in_threadpool(llmCache.clear)
+        return {"message": "LLM response cache cleared."}
+    except Exception as e:
+        logger.error(f"Failed to clear LLM cache: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not clear the LLM cache.")
+
+@router.get("/login-scripts")
+async def list_login_scripts():
+    """Lists the cached login scripts (URL, model and usage, not the scripts themselves)."""
+    try:
+        return await run_in_threadpool(loginScriptCache.list_scripts)
+    except Exception as e:
+        logger.error(f"Failed to read the login script cache: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not read the login script cache.")
+
+@router.delete("/login-scripts")
+async def clear_login_scripts():
+    """Deletes every cached login script, so the next automated login asks the model again."""
+    try:
+        await run_in_threadpool(loginScriptCache.clear)
+        return {"message": "Login script cache cleared."}
+    except Exception as e:
+        logger.error(f"Failed to clear the login script cache: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not clear the login script cache.")
@@ -1,100 +1,235 @@
-import subprocess
+import asyncio
 import json
 import logging
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from intelli_test import security
-from intelli_test.utilities import config
-from pathlib import Path
+import os
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from intelli_test import jobs, security
+from intelli_test.utilities import config, reportHistory, resultStream, testDependencies
+from ..schemas import TestRunRequest
+from ..tasks import TEST_AFFECTED_JOB, TEST_RUN_JOB, TEST_SUITE_JOB
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/tests", tags=["Tests"])
 
-class TestRunRequest(BaseModel):
-    filename: str
+# Caps concurrent streamed runs; each one is a live pytest process.
+_stream_slots = asyncio.Semaphore(config.TEST_STREAM_MAX_CONCURRENT)
 
 
-def run_all_tests_background():
-    """Runs the entire pytest suite in the background."""
-    logger.info("Background task started for running all tests.")
-    report_dir = config.PROJECT_ROOT.parent / "reports"
-    report_dir.mkdir(parents=True, exist_ok=True)
-    report_path = report_dir / f"report-all-tests.json"
-    project_root = config.PROJECT_ROOT.parent
-    try:
-        command = [
-            "pytest",
-            f"{project_root}/tests/", # Target the whole tests directory
-            "--json-report",
-            f"--json-report-file={report_path}",
-            "--tb=short",
-        ]
-        subprocess.run(
-            command,
-            cwd=config.PROJECT_ROOT,
-            timeout=600 # Longer timeout for the full suite
-        )
-        logger.info("Background task for running all tests finished.")
-    except Exception as e:
-        logger.error(f"Error during 'run all' background task: {e}", exc_info=True)
 @router.post("/run-all", status_code=202)
-async def run_all_tests_endpoint(background_tasks: BackgroundTasks):
+async def run_all_tests_endpoint(shards: int | None = Query(None, ge=1, description="Number of parallel pytest processes. Defaults to TEST_SHARDS.")):
     """
-    Triggers a background task to run the entire test suite.
+    Queues a run of the entire test suite. Suite runs go through the job queue one at a time,
+    so concurrent requests wait for each other instead of overwriting each other's shard reports.
+    Tests are split into shards balanced by their historical durations; each shard has its own
+    timeout, and the shard reports are merged into report-all-tests.json.
+    Poll /generate/status/{task_id} for the run's summary.
     """
     logger.info("Received request to run all tests.")
-    background_tasks.add_task(run_all_tests_background)
-    return {"message": "Test suite run has been started in the background."}
+    task_id = await run_in_threadpool(jobs.submit, TEST_SUITE_JOB, {"shards": shards})
+    logger.info(f"Queued full test suite run with task_id: {task_id}")
+    return {"message": "Test suite run has been queued.", "task_id": task_id}
+
+
+@router.post("/run-affected", status_code=202)
+async def run_affected_tests_endpoint(
+    categories: list[str] | None = Query(None, description="Fingerprint files (without .json) to treat as changed. Defaults to changes since the last affected run."),
+    shards: int | None = Query(None, ge=1, description="Number of parallel pytest processes. Defaults to TEST_SHARDS."),
+    dry_run: bool = Query(False, description="Only return the selection without running it.")
+):
+    """
+    Queues a run of only the test files that use changed fingerprints, found by statically parsing
+    the tests for find_element_smart calls. Changes are measured against a snapshot of the element
+    fingerprints taken at the previous clean affected run; without one, every test is selected.
+    Affected runs go through the job queue one at a time and plan their selection when they start,
+    so queued runs don't overwrite each other's reports or snapshot. The merged report is written
+    to report-affected-tests.json. Poll /generate/status/{task_id} for the selection and summary.
+    """
+    if dry_run:
+        try:
+            selection = await run_in_threadpool(testDependencies.plan_affected, categories)
+        except OSError as e:
+            logger.error(f"Could not select affected tests: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Could not select affected tests: {e}")
+        return selection.to_dict()
+
+    logger.info("Received request to run affected tests.")
+    task_id = await run_in_threadpool(jobs.submit, TEST_AFFECTED_JOB, {"categories": categories, "shards": shards})
+    logger.info(f"Queued affected test run with task_id: {task_id}")
+    return {"message": "Affected test run has been queued.", "task_id": task_id}
+
+
+@router.get("/dependencies")
+async def get_test_dependencies():
+    """Returns the fingerprint categories and element keys each test file uses."""
+    index = await run_in_threadpool(testDependencies.dependency_index)
+    return {test_file: dependencies.to_dict() for test_file, dependencies in index.items()}
+
+
+async def _wait_for_job(job_id: str, timeout: float) -> dict:
+    """Polls a job without blocking the event loop until it finishes or `timeout` seconds pass."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await run_in_threadpool(jobs.get_job, job_id)
+        if job['status'] in (jobs.COMPLETE, jobs.FAILED) or asyncio.get_running_loop().time() >= deadline:
+            return job
+        await asyncio.sleep(config.JOB_POLL_INTERVAL)
+
+
+def _run_response(job: dict):
+    """Returns the report of a finished run, or a 202 with the run id while it's still queued or running."""
+    if job['status'] == jobs.COMPLETE:
+        return job['result']
+    if job['status'] == jobs.FAILED:
+        logger.error(f"Test run {job['id']} failed: {job['error']}")
+        raise HTTPException(status_code=500, detail=f"Test run failed: {job['error']}")
+    return JSONResponse(status_code=202, content={"run_id": job['id'], "status": job['status']})
 
 
 @router.post("/run")
 async def run_test_endpoint(request: TestRunRequest):
     """
-    Runs a specific test file using pytest and returns the results as JSON.
+    Queues a run of a specific test file. Runs execute in the job workers, with at most
+    JOB_CONCURRENCY_TEST_RUN at once, so the API stays responsive while tests run.
+    With `wait` (the default) the pytest JSON report is returned once the run finishes;
+    if it takes longer than `timeout`, or without `wait`, a 202 with a run_id is returned
+    instead. Poll /tests/runs/{run_id} for the result.
     """
     logger.info(f"Received request to run test: {request.filename}")
 
-    report_dir = config.PROJECT_ROOT.parent / "reports"
-    report_dir.mkdir(parents=True, exist_ok=True)
-    report_path = report_dir / f"report-{request.filename.removesuffix('.py').removeprefix('test_')}.json"
+    # Validate the filename before queueing, so bad requests fail fast.
+    security.get_secure_path("test", request.filename)
+
+    run_id = await run_in_threadpool(jobs.submit, TEST_RUN_JOB, {"filename": request.filename}, priority=request.priority)
+    logger.info(f"Queued test run for '{request.filename}' with run_id: {run_id}")
+    if not request.wait:
+        return JSONResponse(status_code=202, content={"run_id": run_id, "status": jobs.PENDING})
+
+    timeout = request.timeout if request.timeout is not None else config.TEST_RUN_WAIT_TIMEOUT
+    return _run_response(await _wait_for_job(run_id, timeout))
 
-    try:
-        # 1. Validate and get the full path to the test file
-        test_file_path = security.get_secure_path("test", request.filename)
 
-        # 2. Construct the pytest command
+@router.get("/runs/{run_id}")
+async def get_test_run(run_id: str):
+    """Returns the report of a finished test run, or a 202 with its status while it's still queued or running."""
+    job = await run_in_threadpool(jobs.get_job, run_id)
+    if not job or job['job_type'] != TEST_RUN_JOB:
+        raise HTTPException(status_code=404, detail="Test run not found")
+    return _run_response(job)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_test_events(target: str, report_name: str, maxfail: int | None, release_slot):
+    """
+    Runs pytest with the result-stream plugin and relays its events as server-sent events.
+    If the client disconnects, the generator is closed and the pytest process is terminated.
+    The run writes its own report, which replaces `report_name` once pytest exits.
+    """
+    try:
+        report_path = reportHistory.run_report_path(report_name)
+        read_fd, write_fd = os.pipe()
+        pipe = os.fdopen(read_fd, 'rb')
+        env = {
+            **os.environ,
+            resultStream.EVENT_FD_ENV_VAR: str(write_fd),
+            # The plugin is loaded before the root conftest puts src/ on the path.
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(config.PROJECT_ROOT), os.environ.get("PYTHONPATH")]))
+        }
         command = [
-            "pytest",
-            str(test_file_path),
-            "--json-report",
-            f"--json-report-file={report_path}",
+            "pytest", target,
+            "-p", "intelli_test.utilities.resultStream",
+            "--json-report", f"--json-report-file={report_path}",
             "--tb=short"
         ]
-        
-        # 3. Execute the command
-        logger.info(f"Running command: {' '.join(command)} at {config.PROJECT_ROOT.parent}") 
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            cwd=config.PROJECT_ROOT.parent, 
-            timeout=120
-        )
-
-        # 4. Check for errors during the run
-        if not report_path.is_file():
-            logger.error(f"Pytest did not create the report file at {report_path}.")
-            raise HTTPException(status_code=500, detail="Test run failed to produce a report file.")
-        
-        # 5. Read the JSON report from the file
-        report_content = report_path.read_text(encoding="utf-8")
-        report = json.loads(report_content)
-        return report
-
-    except Exception as e:
-        # Re-raise known HTTP exceptions
-        if isinstance(e, HTTPException):
-            raise e
-        logger.error(f"An unexpected error occurred while running test '{request.filename}': {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="An internal error occurred while running the test.")
+        if maxfail:
+            command.append(f"--maxfail={maxfail}")
+
+        process = None
+        transport = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, cwd=config.PROJECT_ROOT.parent, env=env, pass_fds=(write_fd,),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            # Only the child keeps the write end open, so EOF on the read end means pytest has exited.
+            os.close(write_fd)
+            write_fd = None
+
+            reader = asyncio.StreamReader(limit=2 ** 20)
+            transport, _ = await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+            while line := await reader.readline():
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield _sse(event.pop("event", "message"), event)
+
+            returncode = await process.wait()
+            # A fresh report path means a report here was written by this run, never a stale one.
+            published = report_path.is_file()
+            run_id = await run_in_threadpool(reportHistory.publish_run_report, report_path, report_name) if published else None
+            yield _sse("end", {"returncode": returncode, "report": report_name if published else None, "run_id": run_id})
+        finally:
+            if transport is not None:
+                transport.close()
+            else:
+                pipe.close()
+            if write_fd is not None:
+                os.close(write_fd)
+            if process is not None and process.returncode is None:
+                logger.info(f"Test stream for '{target}' closed early. Terminating pytest (pid {process.pid}).")
+                process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    process.kill()
+            # A cancelled run's report (if any) isn't published.
+            report_path.unlink(missing_ok=True)
+    finally:
+        release_slot()
+
+
+@router.get("/stream")
+async def stream_test_run(
+    filename: str | None = Query(None, description="Test file to run. Runs the whole suite when omitted."),
+    maxfail: int | None = Query(None, ge=1, description="Stop the run after this many failures.")
+):
+    """
+    Runs tests and streams per-test events as they happen (server-sent events):
+    `collected`, `started`, `result` (outcome, duration, short traceback), `finished`, then `end`.
+    Closing the connection cancels the run.
+    """
+    project_root = config.PROJECT_ROOT.parent
+    if filename:
+        target = str(security.get_secure_path("test", filename))
+        report_name = f"report-{filename.removesuffix('.py').removeprefix('test_')}.json"
+    else:
+        target = str(project_root / "tests")
+        report_name = "report-all-tests.json"
+
+    if _stream_slots.locked():
+        raise HTTPException(status_code=429, detail="Too many streamed test runs in progress. Try again shortly.")
+    # Taken now rather than when streaming starts, so concurrent requests can't all pass the check.
+    # A free slot is acquired without suspending, so nothing can take it in between.
+    await _stream_slots.acquire()
+    released = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            _stream_slots.release()
 
+    logger.info(f"Streaming test run for '{filename or 'all tests'}'.")
+    return StreamingResponse(
+        _stream_test_events(target, report_name, maxfail, release_slot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the client disconnects before the stream starts.
+        background=BackgroundTask(release_slot)
+    )
@@ -0,0 +1,66 @@
+import logging
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from intelli_test import jobs
+from intelli_test.utilities import baselineStore
+from ..schemas import VisualBatchRequest
+from ..tasks import VISUAL_BATCH_JOB
+
+logger = logging.getLogger(__name__)
+router = APIRouter(
+    prefix="/visual",
+    tags=["Visual Regression"]
+)
+
+
+@router.post("/batch", status_code=202)
+async def start_visual_batch(request: VisualBatchRequest):
+    """
+    Queues a re-check of every baseline/current pair across a process pool.
+    Poll /generate/status/{task_id} for progress; the result holds the summary and the report path.
+    """
+    if request.threshold is not None and not 0 <= request.threshold <= 1:
+        raise HTTPException(status_code=400, detail="Threshold must be between 0 and 1.")
+    if request.max_workers is not None and request.max_workers < 1:
+        raise HTTPException(status_code=400, detail="max_workers must be at least 1.")
+
+    task_id = await run_in_threadpool(
+        jobs.submit,
+        VISUAL_BATCH_JOB,
+        {"threshold": request.threshold, "max_workers": request.max_workers},
+        priority=request.priority
+    )
+    logger.info(f"Queued visual batch comparison with task_id: {task_id}")
+    return {"message": "Visual batch comparison has started.", "task_id": task_id}
+
+
+@router.get("/baselines")
+async def list_baselines():
+    """Returns every test's baseline and, if its last run didn't match, the mismatching screenshot."""
+    try:
+        manifest = await run_in_threadpool(baselineStore.load_manifest)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return manifest["tests"]
+
+
+@router.post("/baselines/{test_name}/promote")
+async def promote_baseline(test_name: str):
+    """Accepts a test's last mismatching screenshot as its new baseline."""
+    try:
+        baseline = await run_in_threadpool(baselineStore.promote_current, test_name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return {"message": f"Baseline for '{test_name}' updated.", "baseline": baseline}
+
+
+@router.post("/gc")
+async def collect_unreferenced_images():
+    """Migrates legacy baseline files into the store, then deletes stored images no test references."""
+    try:
+        migrated = await run_in_threadpool(baselineStore.migrate_legacy)
+        removed = await run_in_threadpool(baselineStore.gc)
+    except Exception as e:
+        logger.error(f"Baseline store cleanup failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not clean up the baseline store.")
+    return {"migrated": migrated, "removed": removed}
@@ -5,12 +5,23 @@ class FingerprintRequest(BaseModel):
     output_filename: str  # e.g., "loginPage"
     use_authentication: bool = False
     allow_redirects: bool = False
+    priority: int = 0 # Higher priority jobs are picked up first
+    bypass_cache: bool = False # Force a fresh LLM response instead of a cached one
+    incremental: bool = True # Only re-query page regions that changed since the last fingerprint
+
+class BatchFingerprintRequest(BaseModel):
+    requests: list[FingerprintRequest]
+    max_concurrent_pages: int | None = None # Defaults to config.BATCH_MAX_CONCURRENT_PAGES
+    max_concurrent_llm_calls: int | None = None # Defaults to config.BATCH_MAX_CONCURRENT_LLM_CALLS
+    priority: int = 0
 
 class TestGenerationRequest(BaseModel):
     description: str
     file_name: str
     fingerprint_filename: str | None = None
     requires_login: bool = False
+    priority: int = 0
+    bypass_cache: bool = False
 
 class AuthStateRequest(BaseModel):
     url: str # Base site URL ex. www.google.com
@@ -23,10 +34,39 @@ class AutomatedAuthStateRequest(BaseModel):
     headless: bool = True
     username: str | None = None
     password: str | None = None
+    bypass_cache: bool = False
 
 class TestRunRequest(BaseModel):
     filename: str
+    wait: bool = True # Wait for the report; otherwise return a run id to poll straight away
+    timeout: float | None = None # Seconds to wait before returning a run id. Defaults to config.TEST_RUN_WAIT_TIMEOUT
+    priority: int = 0
+
+class HealPromotionRequest(BaseModel):
+    fingerprint_filename: str # e.g., "loginPage.json"
+    element_keys: list[str] | None = None # Promote every journaled heal for the file when omitted
 
+class VisualBatchRequest(BaseModel):
+    threshold: float | None = None # Defaults to config.VISUAL_BATCH_THRESHOLD
+    max_workers: int | None = None # Defaults to config.VISUAL_BATCH_WORKERS, or one per CPU core
+    priority: int = 0
 
+class IdentityCredentials(BaseModel):
+    name: str # e.g., "qa-user-1"; letters, digits, '.', '_' or '-'
+    username: str
+    password: str
 
+class IdentityBulkRequest(BaseModel):
+    base_url: str # Site the identities log in to, e.g., "https://app.example.com"
+    login_url: str
+    login_instructions: str
+    fingerprint_filename: str | None = None
+    identities: list[IdentityCredentials]
+    refresh: bool = True # Log every identity in straight away
+    priority: int = 0
 
+class IdentityRefreshRequest(BaseModel):
+    base_url: str
+    names: list[str] | None = None # Refresh every identity of the site when omitted
+    bypass_cache: bool = False
+    priority: int = 0
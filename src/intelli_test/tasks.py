@@ -1,53 +1,85 @@
+import asyncio
+import json
 import logging
 import os
+import subprocess
+from contextlib import nullcontext
 
-from intelli_test.utilities import generateFingerprintFiles, create_auth_state, automatedLogin, config, testFileGenerator
+from intelli_test import jobs
+from intelli_test.utilities import authStatus, batchFingerprinter, generateFingerprintFiles, create_auth_state, automatedLogin, config, identityStore, reportHistory, testDependencies, testFileGenerator, testSharding, visualBatch
 
 logger = logging.getLogger(__name__)
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 
-def run_fingerprint_generation(url: str, output_filename: str, use_authentication: bool, allow_redirects: bool):
+def run_fingerprint_generation(url: str, output_filename: str, use_authentication: bool, allow_redirects: bool, bypass_cache: bool = False, incremental: bool = True):
     """
     A wrapper function to be run in the background.
     It handles the Playwright context management.
     """
     logger.info(f"Background task started for fingerprinting: {url}")
-    
-    auth_path = None
-    if use_authentication: # Check for auth file existence before starting the long-running task.
-        auth_path = config.AUTH_STATE_PATH
-        if not os.path.exists(auth_path):
-            logger.error(f"Authentication requested, but auth file not found at: {auth_path}")
-            logger.error(f"Please run 'python -m utilities.create_auth_state' to generate it.")
-            return  # Stop the background task
-        logger.info(f"Using authentication file: {auth_path}")
-    else:
-        logger.info("Authentication not requested.")
 
     # Use the project_root to construct a reliable, absolute path.
     output_path = os.path.join(project_root, 'elements', f"{output_filename}.json")
 
     try:
-        generateFingerprintFiles.generate_fingerprint_file(
-            target_url=url, 
-            output_file=output_path, 
-            use_authentication=use_authentication, 
-            allow_redirects=allow_redirects
-        )
+        # Sites with named identities get one leased for this job; others use auth_state.json.
+        with identityStore.leased_state_path(url, holder="fingerprint") if use_authentication else nullcontext() as auth_path:
+            if use_authentication: # Check for auth file existence before starting the long-running task.
+                if not os.path.exists(auth_path):
+                    logger.error(f"Authentication requested, but auth file not found at: {auth_path}")
+                    logger.error(f"Please run 'python -m utilities.create_auth_state' to generate it.")
+                    raise FileNotFoundError(f"Authentication requested, but auth file not found at: {auth_path}")
+                logger.info(f"Using authentication file: {auth_path}")
+            else:
+                logger.info("Authentication not requested.")
+
+            generateFingerprintFiles.generate_fingerprint_file(
+                target_url=url,
+                output_file=output_path,
+                use_authentication=use_authentication,
+                allow_redirects=allow_redirects,
+                bypass_cache=bypass_cache,
+                incremental=incremental,
+                auth_path=auth_path
+            )
         logger.info(f"Background task finished for fingerprinting: {url}")
     except Exception as e:
         logger.error(f"Error during background fingerprint generation for {url}: {e}", exc_info=True)
+        raise
+
+
+def run_batch_fingerprint_generation(requests: list[dict], max_concurrent_pages: int | None = None,
+                                     max_concurrent_llm_calls: int | None = None, on_progress=None) -> dict:
+    """
+    Background task wrapper for fingerprinting many pages concurrently.
+    Returns the per-page progress; raises if every page in the batch failed.
+    """
+    logger.info(f"Background task started for batch fingerprinting of {len(requests)} page(s)")
+    output_dir = os.path.join(project_root, 'elements')
+    progress = asyncio.run(batchFingerprinter.generate_fingerprint_files_batch(
+        requests,
+        output_dir,
+        max_concurrent_pages=max_concurrent_pages,
+        max_concurrent_llm_calls=max_concurrent_llm_calls,
+        on_progress=on_progress
+    ))
+    failed = [name for name, entry in progress.items() if entry["status"] == "failed"]
+    logger.info(f"Background task finished for batch fingerprinting: {len(progress) - len(failed)} succeeded, {len(failed)} failed")
+    if progress and len(failed) == len(progress):
+        raise RuntimeError("Every page in the fingerprint batch failed.")
+    return progress
 
 
-def run_test_generation(description: str, file_name: str, fingerprint_filename: str | None = None, requires_login: bool = False):
+def run_test_generation(description: str, file_name: str, fingerprint_filename: str | None = None, requires_login: bool = False, bypass_cache: bool = False):
     """Background task wrapper for generating a test file."""
     logger.info(f"Background task started for test generation: {file_name}")
     try:
-        testFileGenerator.generate_test_file(description, file_name, fingerprint_filename=fingerprint_filename, requires_login=requires_login)
+        testFileGenerator.generate_test_file(description, file_name, fingerprint_filename=fingerprint_filename, requires_login=requires_login, bypass_cache=bypass_cache)
         logger.info(f"Background task finished for test generation: {file_name}")
     except Exception as e:
         logger.error(f"Error during background test generation for {file_name}: {e}", exc_info=True)
+        raise
 
 
 def run_create_auth_state(url: str, login_path: str):
@@ -63,18 +95,164 @@ def run_create_auth_state(url: str, login_path: str):
         logger.error(f"Error during authentication state creation for {url}: {e}", exc_info=True)
 
 
-def run_automated_auth_creation(login_url: str, login_instructions: str, fingerprint_filename: str | None = None, headless: bool = True, username: str | None = None, password: str | None = None):
-    """Background task for automated auth state creation."""
+def run_identity_auth(base_url: str, name: str, headless: bool = True, bypass_cache: bool = False):
+    """
+    Background task for logging in one named identity and saving its auth state.
+    Credentials are read from the identity store, so they never sit in the job queue.
+    """
+    identity = identityStore.get_identity(base_url, name, with_credentials=True)
+    if identity is None:
+        raise LookupError(f"Identity '{name}' for {base_url} does not exist.")
+    logger.info(f"Background task started for identity login: {name} ({base_url})")
+    try:
+        automatedLogin.create_automated_auth_state(
+            login_url=identity["login_url"],
+            login_instructions=identity["login_instructions"],
+            fingerprint_filename=identity["fingerprint_filename"],
+            headless=headless,
+            username=identity["username"],
+            password=identity["password"],
+            bypass_cache=bypass_cache,
+            state_path=identity["state_path"]
+        )
+        identityStore.mark_refreshed(base_url, name)
+        logger.info(f"Background task finished for identity login: {name} ({base_url})")
+    except Exception as e:
+        logger.error(f"Error during identity login for {name} ({base_url}): {e}", exc_info=True)
+        raise
+
+
+def run_automated_auth_creation(login_url: str, login_instructions: str, fingerprint_filename: str | None = None, headless: bool = True, username: str | None = None, password: str | None = None, bypass_cache: bool = False):
+    """
+    Background task for automated auth state creation. Unless they're passed in, the username and
+    password are read from the saved automated auth settings when the job runs, so they never sit
+    in the job queue. They're only used if the settings are for the same login URL.
+    """
     logger.info(f"Background task started for automated auth state creation for: {login_url}")
     try:
+        if username is None and password is None:
+            settings = authStatus.load_settings() or {}
+            if settings.get("login_url") == login_url:
+                username, password = settings.get("username"), settings.get("password")
+            else:
+                logger.warning(f"No saved automated auth settings for {login_url}. Logging in without credentials.")
         automatedLogin.create_automated_auth_state(
             login_url=login_url,
             login_instructions=login_instructions,
             fingerprint_filename=fingerprint_filename,
             headless=headless,
             username=username,
-            password=password
+            password=password,
+            bypass_cache=bypass_cache
         )
         logger.info(f"Background task finished for automated auth state creation for: {login_url}")
     except Exception as e:
         logger.error(f"Error during background automated auth state creation for {login_url}: {e}", exc_info=True)
+        raise
+
+
+def run_test_suite(shards: int | None = None) -> dict:
+    """
+    Background task wrapper for running the entire suite as balanced, parallel shards.
+    Returns the merged report's summary; the full report is written to report-all-tests.json.
+    """
+    logger.info("Background task started for running all tests.")
+    try:
+        report = testSharding.run_sharded(shard_count=shards)
+    except Exception as e:
+        logger.error(f"Error during 'run all' background task: {e}", exc_info=True)
+        raise
+    logger.info(f"Background task finished for running all tests: {report['summary']}")
+    return {key: report[key] for key in ("created", "duration", "exitcode", "summary", "shards")}
+
+
+def run_affected_tests(categories: list[str] | None = None, shards: int | None = None) -> dict:
+    """
+    Background task wrapper for running the tests affected by fingerprint changes. The selection is
+    planned here rather than when the job was queued, so it's measured against the current snapshot.
+    Returns the selection, its summary and whether the snapshot moved forward; the full report is
+    written to report-affected-tests.json.
+    """
+    logger.info("Background task started for running affected tests.")
+    try:
+        selection = testDependencies.plan_affected(categories)
+        logger.info(f"Running {len(selection.tests)} affected test file(s).")
+        result = testDependencies.run_affected(selection, shard_count=shards)
+    except Exception as e:
+        logger.error(f"Error during 'run affected' background task: {e}", exc_info=True)
+        raise
+    logger.info(f"Background task finished for running affected tests: {result['summary']}")
+    return result
+
+
+def run_visual_batch(threshold: float | None = None, max_workers: int | None = None, on_progress=None) -> dict:
+    """Background task wrapper for re-checking every visual baseline/current pair. Returns the report summary."""
+    logger.info("Background task started for visual batch comparison")
+    try:
+        report = visualBatch.run_batch(threshold=threshold, max_workers=max_workers, on_progress=on_progress)
+    except Exception as e:
+        logger.error(f"Error during visual batch comparison: {e}", exc_info=True)
+        raise
+    logger.info(f"Background task finished for visual batch comparison: {report['passed']}/{report['total']} passed")
+    # The full per-pair results live in the report file; keep the job record small.
+    return {key: value for key, value in report.items() if key != "results"}
+
+
+def run_test_file(filename: str) -> dict:
+    """
+    Background task wrapper for running one test file with pytest.
+    Returns the pytest JSON report; failing tests are a normal result, not a job failure.
+    """
+    logger.info(f"Background task started for test run: {filename}")
+    report_name = f"report-{filename.removesuffix('.py').removeprefix('test_')}.json"
+    # Each run writes its own report; two runs of the same file may be in flight at once.
+    run_report_path = reportHistory.run_report_path(report_name)
+    test_file_path = os.path.join(project_root, 'tests', filename)
+
+    command = [
+        "pytest",
+        test_file_path,
+        "--json-report",
+        f"--json-report-file={run_report_path}",
+        "--tb=short"
+    ]
+    logger.info(f"Running command: {' '.join(command)} at {config.PROJECT_ROOT.parent}")
+    subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+        cwd=config.PROJECT_ROOT.parent,
+        timeout=config.TEST_RUN_TIMEOUT
+    )
+
+    if not run_report_path.is_file():
+        raise RuntimeError(f"Pytest did not create the report file at {run_report_path}.")
+    report = json.loads(run_report_path.read_text(encoding="utf-8"))
+    reportHistory.publish_run_report(run_report_path, report_name)
+    logger.info(f"Background task finished for test run: {filename} ({report.get('summary')})")
+    return report
+
+
+# --- Job Types ---
+# Job type names used when submitting to the persistent queue in intelli_test.jobs.
+FINGERPRINT_JOB = "fingerprint"
+BATCH_FINGERPRINT_JOB = "batch_fingerprint"
+TEST_GENERATION_JOB = "test_generation"
+AUTOMATED_AUTH_JOB = "automated_auth"
+VISUAL_BATCH_JOB = "visual_batch"
+TEST_RUN_JOB = "test_run"
+IDENTITY_AUTH_JOB = "identity_auth"
+TEST_SUITE_JOB = "test_suite"
+TEST_AFFECTED_JOB = "test_affected"
+
+jobs.register_job_type(FINGERPRINT_JOB, run_fingerprint_generation, concurrency=config.JOB_CONCURRENCY_FINGERPRINT)
+jobs.register_job_type(BATCH_FINGERPRINT_JOB, run_batch_fingerprint_generation, concurrency=config.JOB_CONCURRENCY_BATCH_FINGERPRINT, reports_progress=True)
+jobs.register_job_type(TEST_GENERATION_JOB, run_test_generation, concurrency=config.JOB_CONCURRENCY_TEST_GENERATION)
+jobs.register_job_type(AUTOMATED_AUTH_JOB, run_automated_auth_creation, concurrency=config.JOB_CONCURRENCY_AUTOMATED_AUTH)
+jobs.register_job_type(VISUAL_BATCH_JOB, run_visual_batch, concurrency=config.JOB_CONCURRENCY_VISUAL_BATCH, reports_progress=True)
+jobs.register_job_type(TEST_RUN_JOB, run_test_file, concurrency=config.JOB_CONCURRENCY_TEST_RUN)
+jobs.register_job_type(IDENTITY_AUTH_JOB, run_identity_auth, concurrency=config.JOB_CONCURRENCY_IDENTITY_AUTH)
+# Suite runs share their shard report folder, so only one may run at a time.
+jobs.register_job_type(TEST_SUITE_JOB, run_test_suite, concurrency=1)
+# Likewise for affected runs, which also read and move the fingerprint snapshot forward.
+jobs.register_job_type(TEST_AFFECTED_JOB, run_affected_tests, concurrency=1)
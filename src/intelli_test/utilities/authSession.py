@@ -0,0 +1,87 @@
+import logging
+import time
+from playwright.sync_api import Browser, BrowserContext, Error as PlaywrightError
+from . import authStatus, config
+
+logger = logging.getLogger(__name__)
+
+
+def expiry_problem(state: dict, margin: float | None = None) -> str | None:
+    """Explains why a storage state can't be used, or returns None if it looks valid for at least `margin` seconds."""
+    margin = config.AUTH_EXPIRY_MARGIN if margin is None else margin
+    expires_at = authStatus.soonest_expiry(state)
+    if expires_at is None:
+        return None
+    remaining = expires_at - time.time()
+    if remaining <= margin:
+        when = "has expired" if remaining <= 0 else f"expires in {remaining:.0f}s"
+        return f"The saved authentication session {when}. Regenerate auth_state.json before running authenticated tests."
+    return None
+
+
+class AuthContextPool:
+    """
+    Hands out pre-authenticated browser contexts for the `logged_in_page` fixture.
+    The storage state is read once and kept in memory. A pytest process runs one test at a time,
+    so a single context is kept and reused: after each test its pages are closed and its cookies
+    are put back to the saved state, so its HTTP cache stays warm and no test pays for creating
+    and seeding a context. The context is retired after `max_uses` tests or when a test using it
+    fails. Parallelism comes from running several pytest processes (shards), each with its own.
+    """
+
+    def __init__(self, browser: Browser, storage_state: dict, max_uses: int | None = None):
+        self.browser = browser
+        self.storage_state = storage_state
+        self.max_uses = max(1, max_uses or config.AUTH_CONTEXT_MAX_USES)
+        self._idle: tuple[BrowserContext, int] | None = None
+        self._uses: dict[int, int] = {}
+
+    def new_context(self) -> BrowserContext:
+        """Creates a fresh context from the in-memory storage state (no reuse)."""
+        return self.browser.new_context(storage_state=self.storage_state)
+
+    def acquire(self) -> BrowserContext:
+        """Returns the kept context, or a new one if there is none (or it's already in use)."""
+        idle, self._idle = self._idle, None
+        if idle is not None and self.browser.is_connected():
+            context, uses = idle
+            self._uses[id(context)] = uses
+            return context
+        context = self.new_context()
+        self._uses[id(context)] = 0
+        return context
+
+    def release(self, context: BrowserContext, discard: bool = False):
+        """Resets a context and keeps it for the next test, or closes it if it's spent, failed or one is already kept."""
+        uses = self._uses.pop(id(context), 0) + 1
+        if not discard and uses < self.max_uses and self._idle is None:
+            try:
+                self._reset(context)
+                self._idle = (context, uses)
+                return
+            except PlaywrightError as e:
+                logger.warning(f"Could not reset a reused browser context ({e}). Discarding it.")
+        self._close(context)
+
+    def close(self):
+        """Closes the kept context."""
+        if self._idle is not None:
+            self._close(self._idle[0])
+            self._idle = None
+
+    def _reset(self, context: BrowserContext):
+        # sessionStorage lives with the page, so closing the pages clears it too.
+        for page in list(context.pages):
+            page.close()
+        if config.AUTH_CONTEXT_RESET_COOKIES:
+            # Undo logouts or cookie changes made by the test without reloading the app.
+            context.clear_cookies()
+            if self.storage_state["cookies"]:
+                context.add_cookies(self.storage_state["cookies"])
+
+    @staticmethod
+    def _close(context: BrowserContext):
+        try:
+            context.close()
+        except PlaywrightError:
+            pass
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from . import config
+
+try:
+    import watchfiles
+except ImportError:  # Optional (installed with uvicorn[standard]); without it the watcher polls the file's stat.
+    watchfiles = None
+
+logger = logging.getLogger(__name__)
+
+
+def load_state(path: str | None = None) -> dict:
+    """
+    Reads a Playwright storage state file (auth_state.json by default).
+    Raises FileNotFoundError if it's missing and ValueError if it isn't valid JSON.
+    """
+    path = path or config.AUTH_STATE_PATH
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"The authentication state at {path} is not a valid JSON file.") from e
+    state.setdefault("cookies", [])
+    state.setdefault("origins", [])
+    return state
+
+
+def soonest_expiry(state: dict) -> float | None:
+    """
+    Returns when the saved session expires: a session is invalid once any of its cookies expire, so
+    this is the soonest cookie expiry. Timestamps of -1 mean session cookies; if every cookie is one,
+    the expiry can't be determined and None is returned.
+    """
+    expirations = [cookie.get("expires") for cookie in state.get("cookies", []) if cookie.get("expires") and cookie.get("expires") != -1]
+    return min(expirations) if expirations else None
+
+
+def read_status(path: str | None = None) -> dict:
+    """
+    Returns whether the auth state exists, when it was last written, when it expires and whether it
+    already has (all as Unix timestamps). A state without cookies is treated as expired.
+    Raises ValueError if the file isn't valid JSON.
+    """
+    path = path or config.AUTH_STATE_PATH
+    try:
+        last_modified = os.path.getmtime(path)
+        state = load_state(path)
+    except FileNotFoundError:
+        return {"exists": False, "last_modified": None, "expires_at": None, "is_expired": True}
+
+    if not state["cookies"]:
+        logger.warning(f"Auth state file at '{path}' contains no cookies. Treating as expired.")
+        return {"exists": True, "last_modified": last_modified, "expires_at": None, "is_expired": True}
+
+    expires_at = soonest_expiry(state)
+    return {
+        "exists": True,
+        "last_modified": last_modified,
+        "expires_at": expires_at,
+        "is_expired": expires_at is not None and time.time() > expires_at
+    }
+
+
+def write_state(state: dict, path: str | None = None):
+    """
+    Writes a storage state atomically (temp file, then rename), so tests and jobs reading the auth
+    state while it's refreshed see either the old file or the new one, never a partial write.
+    """
+    path = path or config.AUTH_STATE_PATH
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-auth-")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"Authentication state saved to {path}")
+
+
+def load_settings() -> dict | None:
+    """Returns the settings of the last automated login request, or None if there are none (or they're unreadable)."""
+    try:
+        with open(config.AUTH_SETTINGS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Could not read automated auth settings at {config.AUTH_SETTINGS_PATH}: {e}")
+        return None
+
+
+# --- Cached Status ---
+# Dashboards poll the auth status often, and the state file can be hundreds of KB of localStorage.
+# The parsed summary is cached and only recomputed when the file's stat changes. While the watcher
+# runs it keeps the cache current and pushes changes to subscribers, so reads don't even stat.
+_cache_lock = threading.Lock()
+_cached: tuple | None = None  # (stat key, status, error)
+_subscribers_lock = threading.Lock()
+_subscribers: set = set()
+_watcher = None
+
+
+def _stat_key(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _refresh_cache() -> bool:
+    """Re-reads the auth state if its stat changed since the cached copy. Returns whether it did."""
+    global _cached
+    path = config.AUTH_STATE_PATH
+    key = _stat_key(path)
+    with _cache_lock:
+        if _cached is not None and _cached[0] == key:
+            return False
+    status, error = None, None
+    try:
+        status = read_status(path)
+    except (ValueError, OSError) as e:
+        error = str(e)
+    with _cache_lock:
+        _cached = (key, status, error)
+    return True
+
+
+def is_watching() -> bool:
+    """Whether the watcher keeps the cache current, so `cached_status` won't touch the disk."""
+    return _cached is not None and _watcher is not None and _watcher.is_alive()
+
+
+def cached_status() -> dict:
+    """
+    Same result as read_status, but auth_state.json is only parsed again after it changes.
+    `is_expired` is re-evaluated on every call, since time passes without the file changing.
+    Unless `is_watching()`, this stats (and may parse) the file, so don't call it on the event loop then.
+    Raises ValueError if the file couldn't be parsed.
+    """
+    if not is_watching():
+        _refresh_cache()
+    _, status, error = _cached
+    if error is not None:
+        raise ValueError(error)
+    status = dict(status)
+    if status["expires_at"] is not None:
+        status["is_expired"] = time.time() > status["expires_at"]
+    return status
+
+
+def subscribe() -> asyncio.Queue:
+    """
+    Returns a queue on the running event loop that receives the status (or {"error": ...}) each
+    time it changes. Pass it to `unsubscribe` when done.
+    """
+    queue = asyncio.Queue(maxsize=16)
+    with _subscribers_lock:
+        _subscribers.add((asyncio.get_running_loop(), queue))
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    with _subscribers_lock:
+        for entry in [entry for entry in _subscribers if entry[1] is queue]:
+            _subscribers.discard(entry)
+
+
+def _offer(queue: asyncio.Queue, status: dict):
+    # A slow subscriber only needs the newest status, so drop the oldest one rather than block.
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(status)
+
+
+def _publish(status: dict):
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(_offer, queue, status)
+        except RuntimeError:  # The subscriber's loop has closed.
+            unsubscribe(queue)
+
+
+class _AuthStateWatcher(threading.Thread):
+    """
+    Keeps the cached status current: reacts to file system events for auth_state.json when
+    watchfiles is available, and otherwise polls its stat every `interval` seconds. Either way it
+    also wakes every `interval` seconds to notice the session expiring without the file changing.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="auth-state-watcher", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._last = None
+
+    def run(self):
+        self._check()
+        if watchfiles is not None:
+            path = os.path.abspath(config.AUTH_STATE_PATH)
+            try:
+                for _ in watchfiles.watch(
+                    os.path.dirname(path),
+                    watch_filter=lambda change, changed_path: os.path.abspath(changed_path) == path,
+                    debounce=100,
+                    rust_timeout=int(self.interval * 1000),
+                    yield_on_timeout=True,
+                    stop_event=self._stop_event,
+                    recursive=False
+                ):
+                    self._check()
+                return
+            except Exception as e:
+                logger.warning(f"Watching {path} for changes failed ({e}). Polling it instead.")
+        while not self._stop_event.wait(self.interval):
+            self._check()
+
+    def _check(self):
+        try:
+            _refresh_cache()
+            current = cached_status()
+        except ValueError as e:
+            current = {"error": str(e)}
+        if current != self._last:
+            self._last = current
+            _publish(current)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self.join(timeout=timeout)
+
+
+def start_watcher(interval: float | None = None):
+    """Starts watching auth_state.json so cached_status never touches the disk and subscribers hear about changes."""
+    global _watcher
+    if _watcher is None:
+        _watcher = _AuthStateWatcher(interval or config.AUTH_STATUS_POLL_INTERVAL)
+        _watcher.start()
+        logger.info(f"Watching {config.AUTH_STATE_PATH} for changes ({'file events' if watchfiles else 'polling'}).")
+
+
+def stop_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
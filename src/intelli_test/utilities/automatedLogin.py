@@ -2,9 +2,9 @@ import google.generativeai as genai
 import logging
 import os
 import json
-from playwright.sync_api import sync_playwright, Page
+from playwright.sync_api import BrowserContext
 import textwrap
-from . import config
+from . import authStatus, browserPool, config, llmCache, loginScriptCache
 
 # Configure the generative AI model
 genai.configure(api_key=config.API_KEY)
@@ -28,13 +28,18 @@ def perform_login(page: Page):
     logger.info("Dynamic login script finished.")
 """
 
-def build_login_script_prompt(login_url: str, login_instructions: str, fingerprint_json: dict | None = None, username: str | None = None, password: str | None = None) -> str:
-    """Constructs the prompt for generating a Playwright login script."""
-    
+def _prompt_elements(fingerprint_json: dict | None) -> dict:
+    """Returns the fingerprint elements as the model sees them."""
     elements = {}
     if fingerprint_json:
         elements = fingerprint_json.get("elements", {})
-    elements_str = json.dumps(elements, indent=2)
+    # Healing signals are only for the in-page fallback; they'd just add noise to the prompt.
+    return {key: {k: v for k, v in value.items() if k != "signals"} if isinstance(value, dict) else value for key, value in elements.items()}
+
+def build_login_script_prompt(login_url: str, login_instructions: str, fingerprint_json: dict | None = None, username: str | None = None, password: str | None = None) -> str:
+    """Constructs the prompt for generating a Playwright login script."""
+    
+    elements_str = json.dumps(_prompt_elements(fingerprint_json), indent=2)
     
     if username and password:
         # Escape quotes in username/password to be safe inside the f-string prompt
@@ -66,9 +71,40 @@ You are an expert Python test automation engineer specializing in Playwright. Yo
 **Generated Python Code (function body only):**
 """
 
-def create_automated_auth_state(login_url: str, login_instructions: str, fingerprint_filename: str | None = None, headless: bool = True, username: str | None = None, password: str | None = None):
+def _run_login_script(login_script_body: str, login_url: str, headless: bool, state_path: str | None = None):
+    """Wraps a generated function body in the login template, runs it against the login page and saves the auth state."""
+    # Indent the AI-generated script body to fit inside the function template.
+    indented_script_body = textwrap.indent(login_script_body, ' ' * 4)
+
+    # Create the full script by formatting the template.
+    full_script = _SCRIPT_TEMPLATE.format(script_body=indented_script_body)
+
+    logger.info(f"Login script to be executed:\n{full_script}")
+
+    script_namespace = {}
+    exec(full_script, globals(), script_namespace)
+    perform_login_func = script_namespace['perform_login']
+
+    def login_in_context(context: BrowserContext):
+        page = context.new_page()
+        page.goto(login_url)
+        perform_login_func(page)
+        # Tests may be reading the current state, so it's replaced in one step.
+        authStatus.write_state(context.storage_state(), state_path)
+        if not headless:
+            page.wait_for_timeout(3000) # Give user a moment to see the result
+
+    # Headless logins reuse a warm browser from the shared pool; headed ones get their own window.
+    browserPool.run_in_context(login_in_context, headless=headless)
+
+def create_automated_auth_state(login_url: str, login_instructions: str, fingerprint_filename: str | None = None, headless: bool = True, username: str | None = None, password: str | None = None, bypass_cache: bool = False,
+                                state_path: str | None = None):
     """
     Generates a login script using AI, executes it to log in, and saves the auth state.
+    A script that logged in before for the same URL, instructions, fingerprint, model and credentials
+    is replayed without asking the model; if the replay fails, a fresh script is generated.
+    Set `bypass_cache` to force a fresh script from the model even if the prompt was seen before.
+    The state is saved to `state_path` (e.g. a named identity's file) or to auth_state.json.
     """
     if fingerprint_filename is None:
         logger.info(f"Starting automated auth state creation for {login_url} using no fingerprint file.")
@@ -85,36 +121,33 @@ def create_automated_auth_state(login_url: str, login_instructions: str, fingerp
         with open(fingerprint_path, 'r', encoding='utf-8') as f:
             fingerprint_data = json.load(f)
 
-    # 2. Build the prompt and get the script from AI
+    # 2. Replay the script that worked last time, if nothing that shaped it has changed
+    script_key = loginScriptCache.script_key(login_url, login_instructions, _prompt_elements(fingerprint_data), model.model_name, username, password)
+    cached_script = loginScriptCache.lookup(script_key) if config.LOGIN_SCRIPT_CACHE_ENABLED and not bypass_cache else None
+    if cached_script is not None:
+        logger.info(f"Replaying cached login script ({script_key[:12]}). Skipping model request.")
+        try:
+            _run_login_script(cached_script, login_url, headless, state_path)
+            loginScriptCache.record_use(script_key)
+            return
+        except Exception as e:
+            logger.warning(f"Cached login script failed ({e}). Generating a new one.")
+            loginScriptCache.discard(script_key)
+            # The LLM cache most likely holds the same script, so go to the model.
+            bypass_cache = True
+
+    # 3. Build the prompt and get the script from AI
     prompt = build_login_script_prompt(login_url, login_instructions, fingerprint_data, username=username, password=password)
     
     try:
         logger.info("Sending request to generative AI for login script...")
-        response = model.generate_content(prompt)
-        login_script_body = response.text.strip().removeprefix("```python").removesuffix("```").strip()
-
-        # Indent the AI-generated script body to fit inside the function template.
-        indented_script_body = textwrap.indent(login_script_body, ' ' * 4)
-
-        # Create the full script by formatting the template.
-        full_script = _SCRIPT_TEMPLATE.format(script_body=indented_script_body)
-
-        logger.info(f"Generated login script to be executed:\n{full_script}")
-
-        script_namespace = {}
-        exec(full_script, globals(), script_namespace)
-        perform_login_func = script_namespace['perform_login']
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=headless)
-            context = browser.new_context()
-            page = context.new_page()
-            page.goto(login_url)
-            perform_login_func(page)
-            context.storage_state(path=config.AUTH_STATE_PATH)
-            logger.info(f"Authentication state saved to {config.AUTH_STATE_PATH}")
-            page.wait_for_timeout(3000) # Give user a moment to see the result
-            browser.close()
+        login_script_body = llmCache.generate_text(model, prompt, bypass_cache=bypass_cache).strip().removeprefix("```python").removesuffix("```").strip()
+        _run_login_script(login_script_body, login_url, headless, state_path)
     except Exception as e:
         logger.error(f"Failed to create automated auth state: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        # A script that didn't log in shouldn't be served from the cache next time.
+        llmCache.discard(model, prompt)
+        raise
+
+    if config.LOGIN_SCRIPT_CACHE_ENABLED:
+        loginScriptCache.store(script_key, login_url, model.model_name, login_script_body)
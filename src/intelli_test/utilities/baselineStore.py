@@ -0,0 +1,255 @@
+import cv2
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from . import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates fall back to last-writer-wins.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Baselines are stored once per distinct image under images/store/<hash>.<ext>, named by a SHA-256
+# of their decoded pixels, so the same screenshot taken by several tests takes up space once.
+# images/manifest.json maps each test name to the hash of its baseline and, when the last run
+# didn't match, of the screenshot it produced.
+_MANIFEST_VERSION = 1
+
+
+def _store_dir() -> str:
+    return os.path.join(config.IMAGES_PATH, "store")
+
+
+def _manifest_path() -> str:
+    return os.path.join(config.IMAGES_PATH, "manifest.json")
+
+
+def pixel_hash(pixels: np.ndarray) -> str:
+    """Content address of an image: covers its shape as well as its pixels."""
+    digest = hashlib.sha256(repr(pixels.shape).encode("ascii"))
+    digest.update(np.ascontiguousarray(pixels).data)
+    return digest.hexdigest()
+
+
+def decode(encoded: bytes) -> np.ndarray:
+    """Decodes an in-memory screenshot (e.g. from `page.screenshot()`) into BGR pixels."""
+    pixels = cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if pixels is None:
+        raise ValueError("Could not decode screenshot bytes.")
+    return pixels
+
+
+def _encode(pixels: np.ndarray) -> tuple[bytes, str]:
+    """Encodes losslessly, as WebP when this OpenCV build supports it and PNG otherwise."""
+    if config.BASELINE_FORMAT == "webp":
+        try:
+            # OpenCV treats a WebP quality above 100 as lossless.
+            ok, buffer = cv2.imencode(".webp", pixels, [cv2.IMWRITE_WEBP_QUALITY, 101])
+            if ok:
+                return buffer.tobytes(), "webp"
+        except cv2.error as e:
+            logger.warning(f"WebP encoding unavailable ({e}). Storing baselines as PNG.")
+    ok, buffer = cv2.imencode(".png", pixels, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    if not ok:
+        raise ValueError("Could not encode image.")
+    return buffer.tobytes(), "png"
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def _manifest_lock():
+    """Serialises manifest read-modify-write cycles across test processes."""
+    os.makedirs(config.IMAGES_PATH, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(config.IMAGES_PATH, ".manifest.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_manifest() -> dict:
+    """Returns the manifest, or an empty one if it doesn't exist yet."""
+    try:
+        with open(_manifest_path(), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": _MANIFEST_VERSION, "tests": {}}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"The baseline manifest at {_manifest_path()} is not a valid JSON file.") from e
+    manifest.setdefault("tests", {})
+    return manifest
+
+
+def _save_manifest(manifest: dict):
+    _write_atomic(_manifest_path(), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def _object_path(digest: str, fmt: str) -> str:
+    return os.path.join(_store_dir(), f"{digest}.{fmt}")
+
+
+def _stored_format(digest: str) -> str | None:
+    for fmt in ("webp", "png"):
+        if os.path.exists(_object_path(digest, fmt)):
+            return fmt
+    return None
+
+
+def _prepare(pixels: np.ndarray, digest: str | None = None) -> tuple[str, tuple[bytes, str] | None]:
+    """Hashes an image and, unless it's already stored, encodes it, so `put` does little work under the lock."""
+    digest = digest or pixel_hash(pixels)
+    return digest, None if _stored_format(digest) else _encode(pixels)
+
+
+def put(pixels: np.ndarray, digest: str | None = None, encoded: tuple[bytes, str] | None = None) -> dict:
+    """
+    Stores an image if it isn't stored yet. Returns its manifest entry (hash, format and size).
+    Call it with the manifest lock held and record the entry before releasing it; otherwise a
+    concurrent `gc` may delete the image before the manifest references it.
+    """
+    digest = digest or pixel_hash(pixels)
+    os.makedirs(_store_dir(), exist_ok=True)
+    fmt = _stored_format(digest)
+    if fmt is None:
+        data, fmt = encoded or _encode(pixels)
+        _write_atomic(_object_path(digest, fmt), data)
+    return {"hash": digest, "format": fmt, "width": int(pixels.shape[1]), "height": int(pixels.shape[0])}
+
+
+def object_path(image: dict) -> str:
+    """Returns the path of a stored image from its manifest entry."""
+    return _object_path(image["hash"], image["format"])
+
+
+def get(image: dict) -> np.ndarray:
+    """Decodes a stored image from its manifest entry."""
+    path = object_path(image)
+    pixels = cv2.imread(path, cv2.IMREAD_COLOR)
+    if pixels is None:
+        raise FileNotFoundError(f"Stored image not found or unreadable: {path}")
+    return pixels
+
+
+def get_entry(test_name: str) -> dict | None:
+    """Returns the manifest entry for a test (with its `baseline` and optional `current` image), if any."""
+    return load_manifest()["tests"].get(test_name)
+
+
+def set_baseline(test_name: str, pixels: np.ndarray, digest: str | None = None) -> dict:
+    """Stores `pixels` as the test's baseline and clears any recorded mismatching screenshot."""
+    digest, encoded = _prepare(pixels, digest)
+    with _manifest_lock():
+        image = put(pixels, digest, encoded)
+        manifest = load_manifest()
+        manifest["tests"][test_name] = {"baseline": image, "current": None, "updated_at": time.time()}
+        _save_manifest(manifest)
+    logger.info(f"Baseline for '{test_name}' set to {image['hash'][:12]}.")
+    return image
+
+
+def record_current(test_name: str, pixels: np.ndarray | None, digest: str | None = None):
+    """
+    Records the latest screenshot for a test when it differs from the baseline (for review or
+    promotion), or clears it when `pixels` is None because the run matched.
+    """
+    encoded = None
+    if pixels is not None:
+        digest, encoded = _prepare(pixels, digest)
+    with _manifest_lock():
+        manifest = load_manifest()
+        entry = manifest["tests"].get(test_name)
+        if entry is None:
+            return
+        image = put(pixels, digest, encoded) if pixels is not None else None
+        if entry.get("current") == image:
+            return
+        entry["current"] = image
+        entry["updated_at"] = time.time()
+        _save_manifest(manifest)
+
+
+def promote_current(test_name: str) -> dict:
+    """Makes the test's last mismatching screenshot its new baseline."""
+    with _manifest_lock():
+        manifest = load_manifest()
+        entry = manifest["tests"].get(test_name)
+        if not entry or not entry.get("current"):
+            raise KeyError(f"No mismatching screenshot recorded for '{test_name}'.")
+        entry["baseline"], entry["current"] = entry["current"], None
+        entry["updated_at"] = time.time()
+        _save_manifest(manifest)
+    logger.info(f"Promoted the current screenshot of '{test_name}' to baseline.")
+    return entry["baseline"]
+
+
+def migrate_legacy(test_name: str | None = None) -> list[str]:
+    """
+    Moves `{test_name}_baseline.png` files from the images folder into the store and deletes them,
+    along with stale `{test_name}_current.png` files. With `test_name`, only that test is migrated.
+    """
+    images_dir = config.IMAGES_PATH
+    if not os.path.isdir(images_dir):
+        return []
+    suffix = "_baseline.png"
+    names = [test_name] if test_name else [f.removesuffix(suffix) for f in os.listdir(images_dir) if f.endswith(suffix)]
+    migrated = []
+    for name in names:
+        legacy_path = os.path.join(images_dir, f"{name}{suffix}")
+        if not os.path.exists(legacy_path):
+            continue
+        if get_entry(name) is None:
+            pixels = cv2.imread(legacy_path, cv2.IMREAD_COLOR)
+            if pixels is None:
+                logger.warning(f"Skipping unreadable legacy baseline: {legacy_path}")
+                continue
+            set_baseline(name, pixels)
+            migrated.append(name)
+        os.remove(legacy_path)
+        stale_current = os.path.join(images_dir, f"{name}_current.png")
+        if os.path.exists(stale_current):
+            os.remove(stale_current)
+    if migrated:
+        logger.info(f"Migrated {len(migrated)} legacy baseline(s) into the content-addressed store.")
+    return migrated
+
+
+def gc() -> int:
+    """Deletes stored images no test references any more. Returns how many were removed."""
+    store_dir = _store_dir()
+    if not os.path.isdir(store_dir):
+        return 0
+    with _manifest_lock():
+        referenced = set()
+        for entry in load_manifest()["tests"].values():
+            for image in (entry.get("baseline"), entry.get("current")):
+                if image:
+                    referenced.add(f"{image['hash']}.{image['format']}")
+        removed = 0
+        for name in os.listdir(store_dir):
+            if name not in referenced and not name.startswith(".tmp-"):
+                os.remove(os.path.join(store_dir, name))
+                removed += 1
+    logger.info(f"Baseline store gc removed {removed} unreferenced image(s).")
+    return removed
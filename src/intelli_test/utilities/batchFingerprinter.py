@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from intelli_test.utilities import config, htmlSimplifier, generateFingerprintFiles, identityStore
+
+logger = logging.getLogger(__name__)
+
+
+async def _open_page(browser: Browser, url: str, auth_path: str | None, allow_redirects: bool) -> tuple[BrowserContext, Page]:
+    """Opens `url` in a fresh context. The caller closes the context."""
+    context = await browser.new_context(storage_state=auth_path)
+    try:
+        page = await context.new_page()
+        logger.info(f"Navigating to {url}...")
+        await page.goto(url)
+        await page.wait_for_load_state('domcontentloaded')
+        generateFingerprintFiles.check_redirect(url, page.url, allow_redirects)
+    except BaseException:
+        await context.close()
+        raise
+    return context, page
+
+
+async def _fingerprint_one(browser: Browser, request: dict, output_dir: str, page_slots: asyncio.Semaphore,
+                           llm_slots: asyncio.Semaphore, report):
+    """
+    Fingerprints a single page. Browser work is bounded by `page_slots` and model calls by
+    `llm_slots`. The page is closed and its slot released while the model runs, then reopened
+    briefly to check the new selectors, so navigation for one URL overlaps with model latency for another.
+    """
+    url = request["url"]
+    output_filename = request["output_filename"]
+    output_path = os.path.join(output_dir, f"{output_filename}.json")
+    allow_redirects = request.get("allow_redirects", False)
+
+    auth_path = None
+    if request.get("use_authentication"):
+        # Spread the batch's pages over the site's named identities, if it has any.
+        auth_path = config.AUTH_STATE_PATH
+        lease = await asyncio.to_thread(identityStore.lease, url, identityStore.ROUND_ROBIN)
+        if lease:
+            auth_path = lease["state_path"]
+        if not os.path.exists(auth_path):
+            raise RuntimeError(f"Authentication requested, but auth file not found at: {auth_path}")
+
+    async with page_slots:
+        report(output_filename, "navigating")
+        context, page = await _open_page(browser, url, auth_path, allow_redirects)
+        try:
+            report(output_filename, "simplifying")
+            regions, hashes = await htmlSimplifier.extract_page_regions_async(page)
+            if not regions:
+                raise RuntimeError("HTML simplification returned an empty string. Cannot proceed.")
+            plan = await generateFingerprintFiles.plan_locator_refresh_async(
+                page, output_path, hashes, incremental=request.get("incremental", True)
+            )
+        finally:
+            await context.close()
+
+    if plan is None:
+        logger.info(f"Fingerprint file at {output_path} is already up to date.")
+        return
+
+    report(output_filename, "generating")
+    new_locators = await generateFingerprintFiles.generate_planned_locators_async(
+        plan, regions, llm_slots, bypass_cache=request.get("bypass_cache", False)
+    )
+
+    async with page_slots:
+        report(output_filename, "verifying")
+        context, page = await _open_page(browser, url, auth_path, allow_redirects)
+        try:
+            locators, region_index = await generateFingerprintFiles.finish_locator_refresh_async(page, plan, new_locators, hashes)
+        finally:
+            await context.close()
+
+    await asyncio.to_thread(generateFingerprintFiles.save_fingerprint_file, output_path, url, locators, region_index)
+
+
+async def generate_fingerprint_files_batch(requests: list[dict], output_dir: str, max_concurrent_pages: int | None = None,
+                                           max_concurrent_llm_calls: int | None = None, on_progress=None) -> dict:
+    """
+    Fingerprints many pages concurrently with a single async Chromium instance.
+    `requests` are FingerprintRequest-shaped dicts. `on_progress(output_filename, entry)` is called
+    whenever a page changes state. Returns the final per-page progress keyed by output_filename.
+    """
+    max_concurrent_pages = max_concurrent_pages or config.BATCH_MAX_CONCURRENT_PAGES
+    max_concurrent_llm_calls = max_concurrent_llm_calls or config.BATCH_MAX_CONCURRENT_LLM_CALLS
+    page_slots = asyncio.Semaphore(max_concurrent_pages)
+    llm_slots = asyncio.Semaphore(max_concurrent_llm_calls)
+
+    progress = {r["output_filename"]: {"url": r["url"], "status": "queued", "error": None} for r in requests}
+
+    def report(output_filename: str, status: str, error: str | None = None):
+        progress[output_filename]["status"] = status
+        progress[output_filename]["error"] = error
+        if on_progress:
+            on_progress(output_filename, dict(progress[output_filename]))
+
+    async def run_one(browser: Browser, request: dict):
+        output_filename = request["output_filename"]
+        try:
+            await _fingerprint_one(browser, request, output_dir, page_slots, llm_slots, report)
+            report(output_filename, "complete")
+            logger.info(f"Batch fingerprint complete for {request['url']}")
+        except Exception as e:
+            # One bad page shouldn't sink the rest of the batch.
+            logger.error(f"Batch fingerprint failed for {request['url']}: {e}", exc_info=True)
+            report(output_filename, "failed", str(e))
+
+    logger.info(
+        f"Starting batch fingerprinting of {len(requests)} page(s) "
+        f"({max_concurrent_pages} concurrent pages, {max_concurrent_llm_calls} concurrent LLM calls)."
+    )
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            await asyncio.gather(*(run_one(browser, r) for r in requests))
+        finally:
+            await browser.close()
+
+    return progress
@@ -0,0 +1,188 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from playwright.sync_api import sync_playwright, Browser, BrowserContext, Error as PlaywrightError
+from intelli_test.utilities import config
+
+logger = logging.getLogger(__name__)
+
+# Sentinel placed on the job queue to tell a worker thread to shut down.
+_STOP = object()
+
+
+class _BrowserWorker(threading.Thread):
+    """
+    Owns a single Chromium instance for its whole lifetime.
+    Playwright's sync API is bound to the thread that started it, so every
+    browser in the pool lives on its own dedicated thread and only ever
+    touches jobs pulled from the shared queue.
+    """
+
+    def __init__(self, index: int, jobs: queue.Queue, max_uses: int, headless: bool):
+        super().__init__(name=f"browser-pool-{index}", daemon=True)
+        self.jobs = jobs
+        self.max_uses = max_uses
+        self.headless = headless
+        self.browser: Browser | None = None
+        self.uses = 0
+
+    def _launch(self, playwright):
+        logger.info(f"[{self.name}] Launching Chromium (headless={self.headless}).")
+        self.browser = playwright.chromium.launch(headless=self.headless)
+        self.uses = 0
+
+    def _recycle(self, reason: str):
+        logger.info(f"[{self.name}] Recycling browser: {reason}")
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception as e:
+                logger.warning(f"[{self.name}] Error while closing browser during recycle: {e}")
+        self.browser = None
+
+    def run(self):
+        with sync_playwright() as p:
+            # Warm the browser up front so the first job doesn't pay the startup cost.
+            try:
+                self._launch(p)
+            except Exception as e:
+                logger.error(f"[{self.name}] Could not launch Chromium on startup: {e}")
+
+            while True:
+                job = self.jobs.get()
+                if job is _STOP:
+                    break
+                func, context_options, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                context: BrowserContext | None = None
+                try:
+                    if self.browser is None or not self.browser.is_connected():
+                        if self.browser is not None:
+                            self._recycle("browser disconnected")
+                        self._launch(p)
+                    context = self.browser.new_context(**context_options)
+                    future.set_result(func(context))
+                except BaseException as e:
+                    future.set_exception(e)
+                    # A Playwright error with a dead browser means it crashed; start fresh next time.
+                    if isinstance(e, PlaywrightError) and (self.browser is None or not self.browser.is_connected()):
+                        self._recycle("browser crashed")
+                finally:
+                    if context is not None:
+                        try:
+                            context.close()
+                        except Exception:
+                            pass
+                    self.uses += 1
+                    if self.browser is not None and self.uses >= self.max_uses:
+                        self._recycle(f"reached {self.max_uses} uses")
+
+            self._recycle("pool shutting down")
+
+
+class BrowserPool:
+    """
+    A size-bounded pool of long-lived Chromium browsers.
+    Each job gets a fresh, isolated BrowserContext that is closed when the job ends.
+    Browsers are recycled after `max_uses` jobs or when they crash.
+    """
+
+    def __init__(self, size: int, max_uses: int, headless: bool = True):
+        if size < 1:
+            raise ValueError("Browser pool size must be at least 1.")
+        self.size = size
+        self.max_uses = max(1, max_uses)
+        self.headless = headless
+        self._jobs: queue.Queue = queue.Queue()
+        self._workers: list[_BrowserWorker] = []
+
+    def start(self):
+        """Starts the worker threads. Each one launches its browser immediately."""
+        for i in range(self.size):
+            worker = _BrowserWorker(i, self._jobs, self.max_uses, self.headless)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Browser pool started with {self.size} browser(s), recycling after {self.max_uses} uses.")
+
+    def stop(self, timeout: float = 10.0):
+        """Signals every worker to close its browser and waits for them to exit."""
+        for _ in self._workers:
+            self._jobs.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers.clear()
+        logger.info("Browser pool stopped.")
+
+    def submit(self, func, storage_state: str | None = None, **context_options) -> Future:
+        """
+        Queues `func(context)` to run on the next free browser and returns a Future.
+        `storage_state` pre-seeds the context, e.g. with config.AUTH_STATE_PATH.
+        """
+        if not self._workers:
+            raise RuntimeError("Browser pool is not running.")
+        if storage_state is not None:
+            context_options['storage_state'] = storage_state
+        future = Future()
+        self._jobs.put((func, context_options, future))
+        return future
+
+    def run(self, func, storage_state: str | None = None, timeout: float | None = None, **context_options):
+        """Runs `func(context)` on a pooled browser and blocks until it returns."""
+        return self.submit(func, storage_state=storage_state, **context_options).result(timeout=timeout)
+
+
+# --- Application-wide Pool ---
+# Started and stopped by the FastAPI lifespan in api.py.
+_pool: BrowserPool | None = None
+
+
+def start_pool(size: int | None = None, max_uses: int | None = None) -> BrowserPool:
+    """Creates and starts the shared browser pool if it isn't running yet."""
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool(
+            size=size or config.BROWSER_POOL_SIZE,
+            max_uses=max_uses or config.BROWSER_POOL_MAX_USES,
+        )
+        _pool.start()
+    return _pool
+
+
+def stop_pool():
+    """Stops the shared browser pool, closing all of its browsers."""
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+def get_pool() -> BrowserPool | None:
+    """Returns the shared browser pool, or None if it hasn't been started."""
+    return _pool
+
+
+def run_in_context(func, storage_state: str | None = None, headless: bool = True, **context_options):
+    """
+    Runs `func(context)` in a fresh browser context and returns its result.
+    Uses the warm shared pool when it is running and a headless browser is wanted;
+    otherwise falls back to launching a one-off browser (e.g. CLI use or headed runs).
+    """
+    pool = get_pool()
+    if pool is not None and headless:
+        return pool.run(func, storage_state=storage_state, **context_options)
+
+    if storage_state is not None:
+        context_options['storage_state'] = storage_state
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        try:
+            context = browser.new_context(**context_options)
+            try:
+                return func(context)
+            finally:
+                context.close()
+        finally:
+            browser.close()
@@ -23,3 +23,156 @@ AUTH_SETTINGS_PATH = os.path.join(PROJECT_ROOT.parent, "auth_creation_settings.j
 API_KEY = os.getenv("GENAI_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "gemini-2.0-flash") # Default model TODO: Make this configurable via the UI
 # TODO: Add greater config options for the model, like other providers, local models, etc.
+
+# --- Authenticated Test Contexts ---
+# The logged_in_page fixture reuses one context per pytest process for at most AUTH_CONTEXT_MAX_USES tests.
+# AUTH_CONTEXT_ISOLATION gives every test a brand-new context instead; the isolated_context marker does so per test.
+AUTH_CONTEXT_MAX_USES = int(os.getenv("AUTH_CONTEXT_MAX_USES", "50"))
+AUTH_CONTEXT_ISOLATION = os.getenv("AUTH_CONTEXT_ISOLATION", "false").lower() in ("1", "true", "yes")
+# Restore the saved cookies between tests that share a context.
+AUTH_CONTEXT_RESET_COOKIES = os.getenv("AUTH_CONTEXT_RESET_COOKIES", "true").lower() in ("1", "true", "yes")
+# Authenticated runs fail up front when the saved session expires within this many seconds.
+AUTH_EXPIRY_MARGIN = int(os.getenv("AUTH_EXPIRY_MARGIN", "60"))
+
+# --- Auth Identities ---
+# Named login identities per site, so parallel workers each get their own session. Leases are "exclusive"
+# (one holder at a time) or "round_robin" (handed out in turn). Test runs lease an identity for AUTH_IDENTITY_BASE_URL when set.
+AUTH_IDENTITIES_PATH = os.path.join(PROJECT_ROOT.parent, "auth_states")
+AUTH_IDENTITY_BASE_URL = os.getenv("AUTH_IDENTITY_BASE_URL")
+AUTH_IDENTITY_LEASE_MODE = os.getenv("AUTH_IDENTITY_LEASE_MODE", "exclusive").lower()
+# Seconds an exclusive lease lasts once its holder stops renewing it (holders renew every third of this, so
+# only a crashed worker lets it lapse), and how long to wait for a free identity.
+AUTH_IDENTITY_LEASE_TTL = float(os.getenv("AUTH_IDENTITY_LEASE_TTL", "3600"))
+AUTH_IDENTITY_LEASE_TIMEOUT = float(os.getenv("AUTH_IDENTITY_LEASE_TIMEOUT", "300"))
+
+# --- Auth Status ---
+# How often (seconds) the API re-checks auth_state.json when file events aren't available, and how often it
+# checks whether the session has expired.
+AUTH_STATUS_POLL_INTERVAL = float(os.getenv("AUTH_STATUS_POLL_INTERVAL", "1.0"))
+
+# --- Auth Refresh ---
+# The API re-runs the saved automated login AUTH_REFRESH_MARGIN seconds before auth_state.json expires,
+# checking every AUTH_REFRESH_CHECK_INTERVAL seconds. A failed refresh is retried after AUTH_REFRESH_RETRY_INTERVAL,
+# doubling after each further failure; after AUTH_REFRESH_MAX_FAILURES in a row it waits for the state to change.
+AUTH_REFRESH_ENABLED = os.getenv("AUTH_REFRESH_ENABLED", "true").lower() in ("1", "true", "yes")
+AUTH_REFRESH_MARGIN = float(os.getenv("AUTH_REFRESH_MARGIN", "600"))
+AUTH_REFRESH_CHECK_INTERVAL = float(os.getenv("AUTH_REFRESH_CHECK_INTERVAL", "60"))
+AUTH_REFRESH_RETRY_INTERVAL = float(os.getenv("AUTH_REFRESH_RETRY_INTERVAL", "300"))
+AUTH_REFRESH_MAX_FAILURES = int(os.getenv("AUTH_REFRESH_MAX_FAILURES", "5"))
+
+# --- Browser Pool ---
+# Number of warm Chromium instances kept by the API for fingerprint and auth jobs,
+# and how many jobs each browser serves before it is recycled.
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_POOL_MAX_USES = int(os.getenv("BROWSER_POOL_MAX_USES", "50"))
+
+# --- Batch Fingerprinting ---
+# Default limits on how many pages are open and how many LLM calls are in flight at once.
+BATCH_MAX_CONCURRENT_PAGES = int(os.getenv("BATCH_MAX_CONCURRENT_PAGES", "4"))
+BATCH_MAX_CONCURRENT_LLM_CALLS = int(os.getenv("BATCH_MAX_CONCURRENT_LLM_CALLS", "4"))
+
+# --- Job Queue ---
+# Background jobs are persisted in SQLite so status survives restarts and is shared by every API worker process.
+JOBS_DB_PATH = os.path.join(PROJECT_ROOT.parent, "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4")) # Worker threads per API process
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120")) # Running jobs without a heartbeat this long are requeued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "604800")) # Finished jobs older than this are deleted; 0 keeps them forever
+# Per-job-type concurrency limits, enforced across all processes sharing the jobs database.
+JOB_CONCURRENCY_FINGERPRINT = int(os.getenv("JOB_CONCURRENCY_FINGERPRINT", "2"))
+JOB_CONCURRENCY_BATCH_FINGERPRINT = int(os.getenv("JOB_CONCURRENCY_BATCH_FINGERPRINT", "1"))
+JOB_CONCURRENCY_TEST_GENERATION = int(os.getenv("JOB_CONCURRENCY_TEST_GENERATION", "4"))
+JOB_CONCURRENCY_AUTOMATED_AUTH = int(os.getenv("JOB_CONCURRENCY_AUTOMATED_AUTH", "1"))
+JOB_CONCURRENCY_VISUAL_BATCH = int(os.getenv("JOB_CONCURRENCY_VISUAL_BATCH", "1"))
+JOB_CONCURRENCY_TEST_RUN = int(os.getenv("JOB_CONCURRENCY_TEST_RUN", "2"))
+JOB_CONCURRENCY_IDENTITY_AUTH = int(os.getenv("JOB_CONCURRENCY_IDENTITY_AUTH", "2"))
+
+# --- LLM Response Cache ---
+# Identical prompts (same model, generation config and prompt text) are answered from a disk cache.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.path.join(PROJECT_ROOT.parent, ".cache", "llm_cache.db")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# --- Login Script Cache ---
+# Generated login scripts that logged in successfully are replayed for identical logins instead of asking the model again.
+LOGIN_SCRIPT_CACHE_ENABLED = os.getenv("LOGIN_SCRIPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LOGIN_SCRIPT_CACHE_PATH = os.path.join(PROJECT_ROOT.parent, ".cache", "login_scripts.db")
+
+# --- DOM Extraction ---
+# "dom" walks the live DOM in a single in-browser pass; "soup" re-parses page.content() with BeautifulSoup.
+DOM_EXTRACTION_MODE = os.getenv("DOM_EXTRACTION_MODE", "dom")
+DOM_EXTRACTION_MAX_TEXT = int(os.getenv("DOM_EXTRACTION_MAX_TEXT", "200")) # Max characters of own text kept per element
+
+# --- Chunked Fingerprinting ---
+# Large pages are split into region chunks of at most this many estimated tokens, queried concurrently and merged.
+FINGERPRINT_CHUNKING_ENABLED = os.getenv("FINGERPRINT_CHUNKING_ENABLED", "true").lower() in ("1", "true", "yes")
+FINGERPRINT_CHUNK_TOKEN_BUDGET = int(os.getenv("FINGERPRINT_CHUNK_TOKEN_BUDGET", "24000"))
+FINGERPRINT_MAX_CONCURRENT_CHUNKS = int(os.getenv("FINGERPRINT_MAX_CONCURRENT_CHUNKS", "4"))
+FINGERPRINT_CHUNK_RETRIES = int(os.getenv("FINGERPRINT_CHUNK_RETRIES", "2")) # Extra attempts for a failed chunk
+
+# --- Self-Healing ---
+# Minimum in-page score a candidate needs to replace a broken primary selector, and how many candidates are scored.
+HEAL_MIN_SCORE = float(os.getenv("HEAL_MIN_SCORE", "25"))
+HEAL_MAX_CANDIDATES = int(os.getenv("HEAL_MAX_CANDIDATES", "5000"))
+
+# --- Heal Journal ---
+# Selectors healed at test time are stored here and tried first on later runs.
+HEAL_JOURNAL_PATH = os.path.join(PROJECT_ROOT.parent, "elements", "heal_journal.db")
+
+# --- Fingerprint Index ---
+# Precompiled, memory-mapped index of every element in elements/*.json, shared by all test processes.
+FINGERPRINT_INDEX_PATH = os.path.join(PROJECT_ROOT.parent, "elements", ".fingerprint_index")
+
+# --- Change-Impact Selection ---
+# Element hashes as of the last "run affected" run; fingerprint changes are measured against this snapshot.
+TEST_IMPACT_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT.parent, "elements", ".impact_snapshot.json")
+
+# --- Visual Comparison ---
+# SSIM runs on images downscaled by this factor (1.0 keeps full resolution) in tiles of this many pixels (0 disables tiling).
+VISUAL_SSIM_SCALE = float(os.getenv("VISUAL_SSIM_SCALE", "1.0"))
+VISUAL_TILE_SIZE = int(os.getenv("VISUAL_TILE_SIZE", "256"))
+# Per-pixel grayscale difference (0-255) that counts as changed, and the smallest diff box reported, in pixels.
+VISUAL_DIFF_PIXEL_THRESHOLD = int(os.getenv("VISUAL_DIFF_PIXEL_THRESHOLD", "25"))
+VISUAL_MIN_DIFF_AREA = int(os.getenv("VISUAL_MIN_DIFF_AREA", "16"))
+
+# --- Baseline Store ---
+# Visual baselines live in a content-addressed store under images/, encoded losslessly as "webp" (falls back to "png").
+IMAGES_PATH = os.path.join(PROJECT_ROOT.parent, "images")
+BASELINE_FORMAT = os.getenv("BASELINE_FORMAT", "webp").lower()
+
+# --- Visual Batch ---
+# Minimum SSIM score for a pair to pass a batch re-check, worker processes (0 = one per CPU core), and where reports go.
+VISUAL_BATCH_THRESHOLD = float(os.getenv("VISUAL_BATCH_THRESHOLD", "0.95"))
+VISUAL_BATCH_WORKERS = int(os.getenv("VISUAL_BATCH_WORKERS", "0"))
+VISUAL_REPORTS_PATH = os.path.join(PROJECT_ROOT.parent, "reports", "visual")
+
+# --- Test Sharding ---
+# "Run all" splits the suite into this many parallel pytest processes, each with its own timeout in seconds.
+TEST_SHARDS = int(os.getenv("TEST_SHARDS", "4"))
+TEST_SHARD_TIMEOUT = int(os.getenv("TEST_SHARD_TIMEOUT", "600"))
+# Seconds an interrupted shard gets to write its partial report before it's killed.
+TEST_SHARD_INTERRUPT_GRACE = int(os.getenv("TEST_SHARD_INTERRUPT_GRACE", "30"))
+# Assumed duration, in seconds, of tests with no history when no test has any.
+TEST_SHARD_DEFAULT_DURATION = float(os.getenv("TEST_SHARD_DEFAULT_DURATION", "5.0"))
+
+# --- Test Runs ---
+# Timeout in seconds for a single test file run, and how long /tests/run waits for it by default before returning a run id.
+TEST_RUN_TIMEOUT = int(os.getenv("TEST_RUN_TIMEOUT", "120"))
+TEST_RUN_WAIT_TIMEOUT = float(os.getenv("TEST_RUN_WAIT_TIMEOUT", "150"))
+# How many streamed runs (GET /tests/stream) may be live at once.
+TEST_STREAM_MAX_CONCURRENT = int(os.getenv("TEST_STREAM_MAX_CONCURRENT", "2"))
+
+# --- Report History ---
+# Every pytest JSON report is ingested into this SQLite store for paginated history queries.
+REPORT_HISTORY_PATH = os.path.join(PROJECT_ROOT.parent, "reports", "history.db")
+
+# --- Duration Analytics ---
+# A test is flagged as a performance regression when the median of its last DURATION_RECENT_RUNS runs is at least
+# DURATION_REGRESSION_RATIO times, and DURATION_REGRESSION_MIN_SECONDS more than, the median of the DURATION_BASELINE_RUNS before.
+DURATION_BASELINE_RUNS = int(os.getenv("DURATION_BASELINE_RUNS", "20"))
+DURATION_RECENT_RUNS = int(os.getenv("DURATION_RECENT_RUNS", "3"))
+DURATION_REGRESSION_RATIO = float(os.getenv("DURATION_REGRESSION_RATIO", "1.5"))
+DURATION_REGRESSION_MIN_SECONDS = float(os.getenv("DURATION_REGRESSION_MIN_SECONDS", "0.5"))
@@ -2,7 +2,7 @@ import os
 import asyncio
 import argparse
 from playwright.async_api import async_playwright
-from intelli_test.utilities import config
+from intelli_test.utilities import authStatus, config
 
 async def main(url: str = "https://google.com", login_path: str = "/login"):
     """
@@ -32,7 +32,7 @@ async def main(url: str = "https://google.com", login_path: str = "/login"):
         input()  # Wait for user to press Enter
 
         print(f"Saving authentication state to {config.AUTH_STATE_PATH}...")
-        await context.storage_state(path=config.AUTH_STATE_PATH)
+        authStatus.write_state(await context.storage_state())
         
         print(f"Authentication state saved to {config.AUTH_STATE_PATH}. You can now close the browser.")
         await browser.close()
@@ -0,0 +1,120 @@
+import logging
+import numpy as np
+from . import config, reportHistory
+
+logger = logging.getLogger(__name__)
+
+# Column order of the matrix built from reportHistory.duration_rows (after nodeid and created).
+_TOTAL, _SETUP, _CALL, _TEARDOWN = range(4)
+
+
+def _grouped(since: float | None = None, until: float | None = None, nodeid: str | None = None):
+    """
+    Yields (nodeid, created, durations) per test, where `created` is a 1-D array of run timestamps
+    in time order and `durations` an (n, 4) array of total/setup/call/teardown seconds.
+    """
+    rows = reportHistory.duration_rows(since, until, nodeid)
+    if not rows:
+        return
+    nodeids = np.array([row[0] for row in rows], dtype=object)
+    created = np.array([row[1] for row in rows], dtype=float)
+    durations = np.array([row[2:6] for row in rows], dtype=float)
+    # Rows come sorted by nodeid, so each test is one contiguous slice.
+    boundaries = np.flatnonzero(nodeids[1:] != nodeids[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(rows)]))
+    for start, end in zip(starts, ends):
+        yield nodeids[start], created[start:end], durations[start:end]
+
+
+def duration_stats(since: float | None = None, until: float | None = None, nodeid: str | None = None,
+                   min_runs: int = 1) -> list[dict]:
+    """
+    Aggregates each test's recorded durations: run count, p50/p95/mean/max of the total, and the
+    mean setup/call/teardown split. Sorted by p95, slowest first.
+    """
+    stats = []
+    for test_id, _, durations in _grouped(since, until, nodeid):
+        if len(durations) < min_runs:
+            continue
+        total = durations[:, _TOTAL]
+        p50, p95 = np.percentile(total, [50, 95])
+        phase_means = durations[:, [_SETUP, _CALL, _TEARDOWN]].mean(axis=0)
+        stats.append({
+            "nodeid": test_id,
+            "runs": int(len(total)),
+            "p50": float(p50),
+            "p95": float(p95),
+            "mean": float(total.mean()),
+            "max": float(total.max()),
+            "last": float(total[-1]),
+            "phases": {
+                "setup": float(phase_means[0]),
+                "call": float(phase_means[1]),
+                "teardown": float(phase_means[2])
+            }
+        })
+    stats.sort(key=lambda s: s["p95"], reverse=True)
+    return stats
+
+
+def slowest_tests(limit: int = 20, since: float | None = None, until: float | None = None) -> list[dict]:
+    """Returns the tests with the highest p95 duration."""
+    return duration_stats(since, until)[:limit]
+
+
+def detect_regressions(baseline_runs: int | None = None, recent_runs: int | None = None,
+                       min_ratio: float | None = None, min_increase: float | None = None,
+                       since: float | None = None) -> list[dict]:
+    """
+    Flags tests whose recent runs got slower than their rolling baseline.
+    For each test, the last `recent_runs` durations are compared with the `baseline_runs` before
+    them. A test is flagged when its recent median exceeds the baseline median by at least
+    `min_ratio` times and `min_increase` seconds, and sits more than three robust standard
+    deviations (from the median absolute deviation) above the baseline, so normal jitter doesn't trip it.
+    Sorted by the size of the jump, largest first.
+    """
+    baseline_runs = baseline_runs or config.DURATION_BASELINE_RUNS
+    recent_runs = recent_runs or config.DURATION_RECENT_RUNS
+    min_ratio = min_ratio or config.DURATION_REGRESSION_RATIO
+    min_increase = config.DURATION_REGRESSION_MIN_SECONDS if min_increase is None else min_increase
+
+    flagged = []
+    for test_id, created, durations in _grouped(since=since):
+        total = durations[:, _TOTAL]
+        if len(total) < recent_runs + max(3, baseline_runs // 2):
+            continue  # Not enough history for a meaningful baseline.
+        recent = total[-recent_runs:]
+        baseline = total[-(recent_runs + baseline_runs):-recent_runs]
+
+        baseline_median = float(np.median(baseline))
+        recent_median = float(np.median(recent))
+        # 1.4826 scales the MAD to a standard deviation for normally distributed data.
+        robust_std = 1.4826 * float(np.median(np.abs(baseline - baseline_median)))
+        increase = recent_median - baseline_median
+        ratio = recent_median / baseline_median if baseline_median > 0 else float("inf")
+
+        if increase < min_increase or ratio < min_ratio:
+            continue
+        if robust_std > 0 and increase <= 3 * robust_std:
+            continue
+
+        # Point at the phase that grew the most, e.g. a slow fixture (setup) vs. a slow page (call).
+        phase_increase = np.median(durations[-recent_runs:, 1:], axis=0) - np.median(
+            durations[-(recent_runs + baseline_runs):-recent_runs, 1:], axis=0)
+        flagged.append({
+            "nodeid": test_id,
+            "baseline_median": baseline_median,
+            "recent_median": recent_median,
+            "increase": increase,
+            "ratio": ratio,
+            "baseline_runs": int(len(baseline)),
+            "recent_runs": int(len(recent)),
+            "since": float(created[-recent_runs]),
+            "phase": ("setup", "call", "teardown")[int(np.argmax(phase_increase))]
+        })
+
+    flagged.sort(key=lambda r: r["increase"], reverse=True)
+    if flagged:
+        logger.info(f"Detected {len(flagged)} test duration regression(s).")
+    return flagged
@@ -0,0 +1,92 @@
+import logging
+import math
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for English text and markup. Good enough for budgeting;
+# the budget itself should leave headroom below the model's real context limit.
+_CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class Chunk:
+    """A slice of the simplified page small enough to send to the model in one prompt."""
+    regions: list[str] = field(default_factory=list)
+    lines: list[str] = field(default_factory=list)
+    tokens: int = 0
+
+    @property
+    def html(self) -> str:
+        return "\n".join(self.lines)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of model tokens in a piece of text."""
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def plan_chunks(regions: dict[str, list[str]], token_budget: int) -> list[Chunk]:
+    """
+    Packs page regions into chunks of at most `token_budget` estimated tokens.
+    Whole regions are kept together where they fit; a region bigger than the budget
+    is split line by line across several chunks.
+    """
+    chunks: list[Chunk] = []
+    current = Chunk()
+
+    def flush():
+        nonlocal current
+        if current.lines:
+            chunks.append(current)
+        current = Chunk()
+
+    for region, lines in regions.items():
+        region_tokens = sum(estimate_tokens(line) + 1 for line in lines)
+        if current.tokens + region_tokens > token_budget:
+            flush()
+        if region_tokens <= token_budget:
+            current.regions.append(region)
+            current.lines.extend(lines)
+            current.tokens += region_tokens
+            continue
+
+        # Oversized region: split it into as many chunks as it needs.
+        for line in lines:
+            line_tokens = estimate_tokens(line) + 1
+            if current.lines and current.tokens + line_tokens > token_budget:
+                flush()
+            if region not in current.regions:
+                current.regions.append(region)
+            current.lines.append(line)
+            current.tokens += line_tokens
+    flush()
+
+    logger.info(f"Split {len(regions)} region(s) into {len(chunks)} chunk(s) with a budget of {token_budget} tokens.")
+    return chunks
+
+
+def merge_locators(results: list[dict]) -> dict:
+    """
+    Merges the locator dicts returned for each chunk into one.
+    Entries pointing at a selector that's already present are dropped as duplicates.
+    Distinct elements that were given the same key get a numeric suffix (e.g. `submit_button_2`).
+    """
+    merged = {}
+    seen_selectors = set()
+    for locators in results:
+        for key, locator in locators.items():
+            selector = locator.get("primary_selector") if isinstance(locator, dict) else None
+            if selector and selector in seen_selectors:
+                continue
+            unique_key = key
+            suffix = 2
+            while unique_key in merged:
+                unique_key = f"{key}_{suffix}"
+                suffix += 1
+            if unique_key != key:
+                logger.info(f"Locator key '{key}' was generated for more than one element. Renamed to '{unique_key}'.")
+            merged[unique_key] = locator
+            if selector:
+                seen_selectors.add(selector)
+    return merged
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# The index is a single file next to the fingerprints:
+#   magic (8 bytes) | header length (8 bytes, little-endian) | JSON header | record payload
+# The header lists every source file with the mtime/size it was built from and, per element key,
+# the offset and length of that element's JSON record in the payload. Test processes map the file
+# read-only and decode only the records they look up.
+_MAGIC = b"ITFPIDX1"
+_PREFIX = struct.Struct("<8sQ")
+
+
+class _Index:
+    def __init__(self, sources: dict, buffer, payload_start: int, file_stat: tuple | None):
+        self.sources = sources
+        self.buffer = buffer
+        self.payload_start = payload_start
+        self.file_stat = file_stat
+
+    def record(self, offset: int, length: int) -> bytes:
+        start = self.payload_start + offset
+        return self.buffer[start:start + length]
+
+
+_lock = threading.Lock()
+_index: _Index | None = None
+
+
+def _elements_dir() -> str:
+    return os.path.dirname(config.FINGERPRINT_INDEX_PATH)
+
+
+def _stat_key(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _source_files() -> dict[str, str]:
+    """Maps each category to its fingerprint file. Hidden files (e.g. in-flight temp files) are skipped."""
+    elements_dir = _elements_dir()
+    if not os.path.isdir(elements_dir):
+        return {}
+    return {
+        name.removesuffix('.json'): os.path.join(elements_dir, name)
+        for name in os.listdir(elements_dir)
+        if name.endswith('.json') and not name.startswith('.')
+    }
+
+
+def _is_fresh(source: dict | None, path: str) -> bool:
+    return source is not None and _stat_key(path) == (source["mtime_ns"], source["size"])
+
+
+def _open_index() -> _Index | None:
+    """Maps the index file read-only. Returns None if it's missing or unreadable."""
+    path = config.FINGERPRINT_INDEX_PATH
+    try:
+        with open(path, 'rb') as f:
+            file_stat = _stat_key(path)
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    try:
+        magic, header_length = _PREFIX.unpack_from(buffer, 0)
+        if magic != _MAGIC:
+            raise ValueError("bad magic")
+        header = json.loads(buffer[_PREFIX.size:_PREFIX.size + header_length])
+        return _Index(header["sources"], buffer, _PREFIX.size + header_length, file_stat)
+    except (struct.error, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable fingerprint index at {path}: {e}")
+        buffer.close()
+        return None
+
+
+def _build(previous: _Index | None) -> _Index:
+    """
+    Writes a fresh index. Records for sources that haven't changed since `previous` was built are
+    copied over as-is; only new or modified fingerprint files are parsed.
+    """
+    sources = {}
+    payload = bytearray()
+    reparsed = 0
+    for category, path in sorted(_source_files().items()):
+        stat_key = _stat_key(path)
+        if stat_key is None:
+            continue
+        old = previous.sources.get(category) if previous else None
+        if old is not None and (old["mtime_ns"], old["size"]) == stat_key:
+            entries = {key: previous.record(offset, length) for key, (offset, length) in old["keys"].items()}
+            source = {k: v for k, v in old.items() if k != "keys"}
+        else:
+            reparsed += 1
+            source = {"mtime_ns": stat_key[0], "size": stat_key[1], "url": None, "error": None}
+            entries = {}
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                source["url"] = data.get("url")
+                elements = data.get("elements") or {}
+                entries = {key: json.dumps(record, separators=(',', ':')).encode('utf-8') for key, record in elements.items()}
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+                # Keep the source so lookups report the bad file instead of "not found".
+                source["error"] = str(e)
+
+        keys = {}
+        for key, record in entries.items():
+            keys[key] = (len(payload), len(record))
+            payload.extend(record)
+        source["keys"] = keys
+        sources[category] = source
+
+    header = json.dumps({"sources": sources}, separators=(',', ':')).encode('utf-8')
+    content = _PREFIX.pack(_MAGIC, len(header)) + header + payload
+
+    index_path = config.FINGERPRINT_INDEX_PATH
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        # Write-then-rename so concurrent readers always map a complete index.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix=".tmp-index-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, index_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning(f"Could not write fingerprint index to {index_path}: {e}. Using an in-memory index.")
+        return _Index(sources, bytes(content), _PREFIX.size + len(header), None)
+
+    logger.info(f"Rebuilt fingerprint index with {len(sources)} file(s) ({reparsed} re-parsed).")
+    return _open_index() or _Index(sources, bytes(content), _PREFIX.size + len(header), None)
+
+
+def _current(category: str | None = None) -> _Index:
+    """
+    Returns an up-to-date index. With `category`, only that source is checked for freshness;
+    without it, the whole elements directory is.
+    """
+    global _index
+    with _lock:
+        # Another process may have rebuilt the index since we mapped it.
+        if _index is None or _stat_key(config.FINGERPRINT_INDEX_PATH) != _index.file_stat:
+            reopened = _open_index()
+            if reopened is not None:
+                _index = reopened
+
+        if _index is not None:
+            if category is not None:
+                path = os.path.join(_elements_dir(), f"{category}.json")
+                source = _index.sources.get(category)
+                if _is_fresh(source, path) or (source is None and not os.path.exists(path)):
+                    return _index
+            else:
+                files = _source_files()
+                if files.keys() == _index.sources.keys() and all(_is_fresh(_index.sources[c], p) for c, p in files.items()):
+                    return _index
+
+        # Superseded mappings aren't closed explicitly: other threads may still be reading
+        # from them, and they're released once the last reference goes away.
+        _index = _build(_index)
+        return _index
+
+
+def list_categories() -> list[str]:
+    """Returns the names of all fingerprint files (without `.json`), sorted."""
+    return sorted(_current().sources)
+
+
+def get_element(category: str, element_key: str) -> dict:
+    """
+    Returns one element's fingerprint record.
+    Raises FileNotFoundError if the category has no fingerprint file, ValueError if the file
+    isn't valid JSON, and KeyError if the element isn't in it.
+    """
+    index = _current(category)
+    source = index.sources.get(category)
+    if source is None:
+        raise FileNotFoundError(f"The element definition file was not found at: {os.path.join(_elements_dir(), f'{category}.json')}")
+    if source.get("error"):
+        raise ValueError(f"The definition file for '{category}' is not a valid JSON file: {source['error']}")
+    location = source["keys"].get(element_key)
+    if location is None:
+        raise KeyError(element_key)
+    return json.loads(index.record(*location))
+
+
+
+def element_digests() -> dict[str, dict[str, str] | None]:
+    """
+    Returns a content hash of every element record, per category, for change detection.
+    A category whose file isn't valid JSON maps to None.
+    """
+    index = _current()
+    digests = {}
+    for category, source in index.sources.items():
+        if source.get("error"):
+            digests[category] = None
+            continue
+        digests[category] = {
+            key: hashlib.blake2b(index.record(*location), digest_size=16).hexdigest()
+            for key, location in source["keys"].items()
+        }
+    return digests
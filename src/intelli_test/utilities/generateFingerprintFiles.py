@@ -1,9 +1,13 @@
 import google.generativeai as genai
+import asyncio
 import json
 import logging
 import os
-from playwright.sync_api import sync_playwright, Page
-from intelli_test.utilities import config, htmlSimplifier
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from playwright.sync_api import BrowserContext, Page
+from playwright.async_api import Page as AsyncPage
+from intelli_test.utilities import browserPool, config, fingerprintChunker, htmlSimplifier, incrementalFingerprint, llmCache
 
 # Logging is configured at the application entry point (e.g., in api.py or conftest.py).
 logger = logging.getLogger(__name__)
@@ -13,10 +17,17 @@ genai.configure(api_key=config.API_KEY)
 model = genai.GenerativeModel(model_name=config.MODEL_NAME)
 
 
-def build_locator_prompt(simplified_html: str) -> str:
+def build_locator_prompt(simplified_html: str, existing_keys: list[str] | None = None) -> str:
     """
     Constructs the detailed prompt to send to the generative AI.
+    `existing_keys` are names from a previous fingerprint that should be reused for the same elements.
     """
+    existing_keys_instruction = ""
+    if existing_keys:
+        existing_keys_instruction = (
+            "\n    **Existing Keys:** This page was fingerprinted before. If an element matches one of these existing keys, "
+            f"reuse that exact key name so tests that reference it keep working: {', '.join(existing_keys)}\n"
+        )
     return f"""
     You are an expert test automation engineer. Your task is to analyze the provided simplified HTML and generate a JSON object containing stable, unique, and interactable locators for the key elements on the page.
 
@@ -47,6 +58,7 @@ def build_locator_prompt(simplified_html: str) -> str:
       }}
     }}
 
+{existing_keys_instruction}
     **Simplified HTML from the Target Page:**
     ```html
     {simplified_html}
@@ -56,68 +68,315 @@ def build_locator_prompt(simplified_html: str) -> str:
     """
 
 
-def generate_locators_for_page(page: Page, output_path: str, target_url: str):
+def parse_locator_response(raw_text: str) -> dict:
+    """
+    Cleans the raw AI response and parses it into a dictionary of element locators.
+    Raises TypeError if the response isn't a JSON object.
+    """
+    # Clean the response to remove markdown fences and other unwanted characters.
+    cleaned_text = raw_text.strip().removeprefix("```json").removesuffix("```").strip()
+    valid_json_string = cleaned_text.replace("\\\\'", "\'")
+
+    try:
+        parsed_json = json.loads(valid_json_string)
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse JSON from AI response: {e}")
+        logger.error(f"Invalid JSON string received: {valid_json_string}")
+        raise TypeError(e)
+    logger.info("Successfully received and cleaned AI response.")
+
+    # The AI sometimes wraps the response object in a list.
+    # If it's a list with one dictionary inside, we can safely extract it.
+    if isinstance(parsed_json, list) and len(parsed_json) == 1 and isinstance(parsed_json[0], dict):
+        logger.warning("AI returned a list containing a single dictionary. Extracting the dictionary.")
+        return parsed_json[0]
+    elif isinstance(parsed_json, dict):
+        return parsed_json
+
+    # If it's neither a dictionary nor a list with one dictionary, then it's an invalid format.
+    error_msg = (
+        f"AI response was not in the expected format (a JSON object), but was type {type(parsed_json)}. "
+        "The generated fingerprint file will not be saved. Please try again."
+    )
+    logger.error(error_msg)
+    raise TypeError(error_msg)
+
+
+def save_fingerprint_file(output_path: str, target_url: str, locators: dict, regions: dict | None = None):
+    """
+    Writes the element locators and their page URL to a fingerprint file.
+    `regions` maps each page region to its structural hash and locator keys, for incremental refreshes.
+    """
+    # Structure the final JSON to include the URL and the element locators.
+    data_to_save = {
+        "url": target_url,
+        "elements": locators
+    }
+    if regions is not None:
+        data_to_save["regions"] = regions
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    # Save the generated locators to the specified file.
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data_to_save, f, indent=2)
+
+    logger.info(f"Successfully saved locators to {output_path}")
+
+
+def check_redirect(target_url: str, landed_url: str, allow_redirects: bool):
+    """Raises RuntimeError if navigation was redirected away from the target and redirects aren't allowed."""
+    # Verify that we landed on the correct page and were not redirected.
+    if target_url != landed_url and not allow_redirects:
+        error_msg = (
+            f"Fingerprint generation failed. Navigated to '{target_url}' but was redirected to'{landed_url}'. "
+            "Your 'auth_state.json' may be expired or invalid. "
+            "Please regenerate it by running 'python -m utilities.create_auth_state'."
+        )
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    elif allow_redirects and target_url != landed_url:
+        logger.info(f"Allowing redirects. Navigated to '{target_url}' but was redirected to'{landed_url}'.")
+
+
+def query_locators(prompt: str, bypass_cache: bool = False) -> dict:
+    """Sends a locator prompt to the model and returns the parsed locators."""
+    generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
+    response_text = llmCache.generate_text(model, prompt, generation_config=generation_config, bypass_cache=bypass_cache)
+    try:
+        return parse_locator_response(response_text)
+    except TypeError:
+        # Don't let an unparseable answer be replayed from the cache on the next attempt.
+        llmCache.discard(model, prompt, generation_config=generation_config)
+        raise
+
+
+async def query_locators_async(prompt: str, bypass_cache: bool = False) -> dict:
+    """Async counterpart of query_locators."""
+    generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
+    response_text = await llmCache.generate_text_async(model, prompt, generation_config=generation_config, bypass_cache=bypass_cache)
+    try:
+        return parse_locator_response(response_text)
+    except TypeError:
+        await asyncio.to_thread(llmCache.discard, model, prompt, generation_config)
+        raise
+
+
+def _plan_chunks(regions: dict[str, list[str]]) -> list[fingerprintChunker.Chunk]:
+    if not config.FINGERPRINT_CHUNKING_ENABLED:
+        lines = [line for region_lines in regions.values() for line in region_lines]
+        return [fingerprintChunker.Chunk(regions=list(regions), lines=lines)]
+    return fingerprintChunker.plan_chunks(regions, config.FINGERPRINT_CHUNK_TOKEN_BUDGET)
+
+
+def _query_chunk(chunk: fingerprintChunker.Chunk, index: int, total: int, bypass_cache: bool, existing_keys: list[str] | None = None) -> dict:
+    """Queries one chunk, retrying it on its own if the model call or its JSON fails."""
+    prompt = build_locator_prompt(chunk.html, existing_keys)
+    attempts = config.FINGERPRINT_CHUNK_RETRIES + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            return query_locators(prompt, bypass_cache=bypass_cache)
+        except Exception as e:
+            if attempt == attempts:
+                raise RuntimeError(f"Chunk {index + 1}/{total} (regions: {', '.join(chunk.regions)}) failed after {attempts} attempt(s): {e}") from e
+            logger.warning(f"Chunk {index + 1}/{total} failed on attempt {attempt}/{attempts}: {e}. Retrying this chunk.")
+
+
+async def _query_chunk_async(chunk: fingerprintChunker.Chunk, index: int, total: int, bypass_cache: bool, llm_slots: asyncio.Semaphore,
+                             existing_keys: list[str] | None = None) -> dict:
+    """Async counterpart of _query_chunk; `llm_slots` bounds concurrent model calls."""
+    prompt = build_locator_prompt(chunk.html, existing_keys)
+    attempts = config.FINGERPRINT_CHUNK_RETRIES + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            async with llm_slots:
+                return await query_locators_async(prompt, bypass_cache=bypass_cache)
+        except Exception as e:
+            if attempt == attempts:
+                raise RuntimeError(f"Chunk {index + 1}/{total} (regions: {', '.join(chunk.regions)}) failed after {attempts} attempt(s): {e}") from e
+            logger.warning(f"Chunk {index + 1}/{total} failed on attempt {attempt}/{attempts}: {e}. Retrying this chunk.")
+
+
+def generate_locators_for_regions(regions: dict[str, list[str]], bypass_cache: bool = False, existing_keys: list[str] | None = None) -> dict:
+    """
+    Generates locators for the given page regions. Regions are packed into token-budgeted
+    chunks that are sent to the model concurrently, and the results are merged.
+    """
+    chunks = _plan_chunks(regions)
+    if len(chunks) == 1:
+        return _query_chunk(chunks[0], 0, 1, bypass_cache, existing_keys)
+
+    logger.info(f"Sending {len(chunks)} chunks to generative AI concurrently...")
+    with ThreadPoolExecutor(max_workers=config.FINGERPRINT_MAX_CONCURRENT_CHUNKS) as executor:
+        results = list(executor.map(
+            lambda indexed: _query_chunk(indexed[1], indexed[0], len(chunks), bypass_cache, existing_keys),
+            enumerate(chunks)
+        ))
+    return fingerprintChunker.merge_locators(results)
+
+
+async def generate_locators_for_regions_async(regions: dict[str, list[str]], llm_slots: asyncio.Semaphore, bypass_cache: bool = False,
+                                              existing_keys: list[str] | None = None) -> dict:
+    """Async counterpart of generate_locators_for_regions."""
+    chunks = _plan_chunks(regions)
+    results = await asyncio.gather(*(
+        _query_chunk_async(chunk, i, len(chunks), bypass_cache, llm_slots, existing_keys) for i, chunk in enumerate(chunks)
+    ))
+    return results[0] if len(results) == 1 else fingerprintChunker.merge_locators(results)
+
+
+def _attach_signals(locators: dict, checks: list[dict]):
+    """Stores each element's attributes, role and position so self-healing can score candidates against them."""
+    for locator, check in zip(locators.values(), checks):
+        if isinstance(locator, dict) and check.get("signals"):
+            locator["signals"] = check["signals"]
+
+
+@dataclass
+class RefreshPlan:
+    """
+    What a refresh needs from the page before the model is asked: the regions to send, and the
+    previous locators that are kept, broken, or still usable if the model doesn't return them.
+    With no previous fingerprint, every region is sent and nothing is carried over.
+    """
+    previous: dict | None
+    changed: set[str]
+    kept: dict = field(default_factory=dict)
+    broken: dict = field(default_factory=dict)
+    reusable: dict = field(default_factory=dict)
+
+
+def _checked_plan(plan: RefreshPlan, hashes: dict[str, str]) -> RefreshPlan | None:
+    removed_regions = set(plan.previous["regions"]) - set(hashes) - {incrementalFingerprint.UNASSIGNED_REGION}
+    if not plan.changed and not removed_regions:
+        logger.info("No page regions changed since the last fingerprint. Skipping the AI request.")
+        return None
+    logger.info(f"{len(plan.changed)} of {len(hashes)} region(s) changed; keeping {len(plan.kept)} existing locator(s).")
+    return plan
+
+
+def plan_locator_refresh(page: Page, output_path: str, hashes: dict[str, str], incremental: bool = True) -> RefreshPlan | None:
+    """
+    Decides what to send to the model. With `incremental`, and a previous fingerprint file that has
+    region hashes, only new or changed regions are sent; locators from unchanged regions are kept
+    after a cheap in-page selector check, and keys from changed regions are checked too so they
+    survive if the model doesn't return them. Returns None when nothing changed.
+    """
+    previous = incrementalFingerprint.load_previous(output_path) if incremental else None
+    if previous is None:
+        return RefreshPlan(None, set(hashes))
+    changed, candidates = incrementalFingerprint.plan_refresh(previous, hashes)
+    checks = htmlSimplifier.locate_selectors(page, incrementalFingerprint.candidate_selectors(candidates))
+    kept, broken = incrementalFingerprint.keep_verified(candidates, checks, changed, hashes)
+    stale = incrementalFingerprint.changed_region_keys(previous, changed, candidates)
+    reusable = incrementalFingerprint.still_unique(stale, htmlSimplifier.locate_selectors(page, incrementalFingerprint.selectors_for(stale)))
+    return _checked_plan(RefreshPlan(previous, changed, kept, broken, reusable), hashes)
+
+
+async def plan_locator_refresh_async(page: AsyncPage, output_path: str, hashes: dict[str, str], incremental: bool = True) -> RefreshPlan | None:
+    """Async counterpart of plan_locator_refresh."""
+    previous = await asyncio.to_thread(incrementalFingerprint.load_previous, output_path) if incremental else None
+    if previous is None:
+        return RefreshPlan(None, set(hashes))
+    changed, candidates = incrementalFingerprint.plan_refresh(previous, hashes)
+    checks = await htmlSimplifier.locate_selectors_async(page, incrementalFingerprint.candidate_selectors(candidates))
+    kept, broken = incrementalFingerprint.keep_verified(candidates, checks, changed, hashes)
+    stale = incrementalFingerprint.changed_region_keys(previous, changed, candidates)
+    reusable = incrementalFingerprint.still_unique(stale, await htmlSimplifier.locate_selectors_async(page, incrementalFingerprint.selectors_for(stale)))
+    return _checked_plan(RefreshPlan(previous, changed, kept, broken, reusable), hashes)
+
+
+def _planned_regions(plan: RefreshPlan, regions: dict[str, list[str]]) -> dict[str, list[str]]:
+    if plan.previous is None:
+        return regions
+    return {region: regions[region] for region in regions if region in plan.changed}
+
+
+def _planned_keys(plan: RefreshPlan) -> list[str] | None:
+    if plan.previous is None:
+        return None
+    return incrementalFingerprint.previous_keys(plan.previous, plan.changed, plan.broken)
+
+
+def generate_planned_locators(plan: RefreshPlan, regions: dict[str, list[str]], bypass_cache: bool = False) -> dict:
+    """Asks the model for locators for the regions the plan sends. Needs no page."""
+    planned = _planned_regions(plan, regions)
+    if not planned:
+        return {}
+    return generate_locators_for_regions(planned, bypass_cache=bypass_cache, existing_keys=_planned_keys(plan))
+
+
+async def generate_planned_locators_async(plan: RefreshPlan, regions: dict[str, list[str]], llm_slots: asyncio.Semaphore,
+                                          bypass_cache: bool = False) -> dict:
+    """Async counterpart of generate_planned_locators."""
+    planned = _planned_regions(plan, regions)
+    if not planned:
+        return {}
+    return await generate_locators_for_regions_async(planned, llm_slots, bypass_cache=bypass_cache, existing_keys=_planned_keys(plan))
+
+
+def _merge_planned(plan: RefreshPlan, new_locators: dict, hashes: dict[str, str]) -> dict:
+    if plan.previous is None:
+        return new_locators
+    locators = incrementalFingerprint.restore_missing(fingerprintChunker.merge_locators([plan.kept, new_locators]), plan.broken)
+    locators = incrementalFingerprint.restore_reusable(locators, plan.reusable)
+    incrementalFingerprint.warn_dropped(plan.previous, locators, hashes)
+    return locators
+
+
+def finish_locator_refresh(page: Page, plan: RefreshPlan, new_locators: dict, hashes: dict[str, str]) -> tuple[dict, dict]:
+    """Merges the model's locators with the carried-over ones and checks them all in-page for the region index."""
+    locators = _merge_planned(plan, new_locators, hashes)
+    checks = htmlSimplifier.locate_selectors(page, incrementalFingerprint.selectors_for(locators))
+    _attach_signals(locators, checks)
+    return locators, incrementalFingerprint.build_region_index(locators, checks, hashes)
+
+
+async def finish_locator_refresh_async(page: AsyncPage, plan: RefreshPlan, new_locators: dict, hashes: dict[str, str]) -> tuple[dict, dict]:
+    """Async counterpart of finish_locator_refresh."""
+    locators = _merge_planned(plan, new_locators, hashes)
+    checks = await htmlSimplifier.locate_selectors_async(page, incrementalFingerprint.selectors_for(locators))
+    _attach_signals(locators, checks)
+    return locators, incrementalFingerprint.build_region_index(locators, checks, hashes)
+
+
+def refresh_locators(page: Page, output_path: str, regions: dict[str, list[str]], hashes: dict[str, str],
+                     bypass_cache: bool = False, incremental: bool = True) -> tuple[dict, dict] | None:
+    """
+    Produces the locators and region index for a page: plans the refresh, queries the model, and
+    checks the result in-page. Returns None when nothing changed, so the existing file can be left
+    untouched. Every key the refreshed fingerprint drops is logged.
+    """
+    plan = plan_locator_refresh(page, output_path, hashes, incremental=incremental)
+    if plan is None:
+        return None
+    new_locators = generate_planned_locators(plan, regions, bypass_cache=bypass_cache)
+    return finish_locator_refresh(page, plan, new_locators, hashes)
+
+
+def generate_locators_for_page(page: Page, output_path: str, target_url: str, bypass_cache: bool = False, incremental: bool = True):
     """
     Orchestrates the process: simplifies HTML, queries the AI, and saves the result.
+    Set `bypass_cache` to force a fresh model response even if the prompt was seen before.
+    With `incremental`, an existing fingerprint file is refreshed region by region.
     """
     logger.info(f"Starting locator generation for page: {page.title()}")
     
     # Wait for the page to be fully loaded to ensure all dynamic content is present.
     page.wait_for_load_state('domcontentloaded', timeout=50000)
     
-    simplified_html = htmlSimplifier.simplify_html(page)
-    if not simplified_html:
+    regions, hashes = htmlSimplifier.extract_page_regions(page)
+    if not regions:
         logger.error("HTML simplification returned an empty string. Cannot proceed.")
         return
 
-    prompt = build_locator_prompt(simplified_html)
-
     try:
         logger.info("Sending request to generative AI. This may take a moment...")
-        generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
-        response = model.generate_content(prompt, generation_config=generation_config)
-        raw_text = response.text
-
-        # Clean the response to remove markdown fences and other unwanted characters.
-        cleaned_text = raw_text.strip().removeprefix("```json").removesuffix("```").strip()
-        valid_json_string = cleaned_text.replace("\\\\'", "\'")
-
-        parsed_json = json.loads(valid_json_string)
-        logger.info("Successfully received and cleaned AI response.")
-
-        # The AI sometimes wraps the response object in a list.
-        # If it's a list with one dictionary inside, we can safely extract it.
-        if isinstance(parsed_json, list) and len(parsed_json) == 1 and isinstance(parsed_json[0], dict):
-            logger.warning("AI returned a list containing a single dictionary. Extracting the dictionary.")
-            locators = parsed_json[0]
-        elif isinstance(parsed_json, dict):
-            locators = parsed_json
-        else:
-            # If it's neither a dictionary nor a list with one dictionary, then it's an invalid format.
-            error_msg = (
-                f"AI response was not in the expected format (a JSON object), but was type {type(parsed_json)}. "
-                "The generated fingerprint file will not be saved. Please try again."
-            )
-            logger.error(error_msg)
-            raise TypeError(error_msg)
-
-        # Structure the final JSON to include the URL and the element locators.
-        data_to_save = {
-            "url": target_url,
-            "elements": locators
-        }
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        # Save the generated locators to the specified file.
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, indent=2)
-        
-        logger.info(f"Successfully saved locators to {output_path}")
-
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON from AI response: {e}")
-        logger.error(f"Invalid JSON string received: {valid_json_string}")
-        raise TypeError(e)
+        refreshed = refresh_locators(page, output_path, regions, hashes, bypass_cache=bypass_cache, incremental=incremental)
+        if refreshed is None:
+            logger.info(f"Fingerprint file at {output_path} is already up to date.")
+            return
+        locators, region_index = refreshed
+        save_fingerprint_file(output_path, target_url, locators, regions=region_index)
     except Exception as e:
         logger.error(f"An unexpected error occurred during AI query or file saving: {e}")
         raise e
@@ -125,48 +384,34 @@ def generate_locators_for_page(page: Page, output_path: str, target_url: str):
 
 
 
-def generate_fingerprint_file(target_url: str, output_file: str, use_authentication: bool = False, allow_redirects: bool = False):
+def generate_fingerprint_file(target_url: str, output_file: str, use_authentication: bool = False, allow_redirects: bool = False, bypass_cache: bool = False,
+                              incremental: bool = True, auth_path: str | None = None):
     """
-    Generate fingerprint file for a specified page, optionally using saved authentication state.
-    This function manages its own Playwright instance.
+    Generate fingerprint file for a specified page, optionally using saved authentication state
+    (`auth_path`, or auth_state.json by default).
+    Runs in a fresh context from the shared browser pool, or a one-off browser if the pool isn't running.
     """
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-
-        # Use authentication state if provided to create a pre-authenticated context.
-        context_options = {}
+    auth_path = auth_path or config.AUTH_STATE_PATH
 
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..','..'))
-        auth_path = os.path.join(project_root, 'auth_state.json')
+    # Use authentication state if provided to create a pre-authenticated context.
+    storage_state = None
+    if use_authentication and os.path.exists(auth_path):
+        storage_state = auth_path
+        logger.info(f"Loading authentication state from: {auth_path}")
+    elif use_authentication and not os.path.exists(auth_path):
+        raise RuntimeError(f"Authentication requested, but auth file not found at: {auth_path}")
+    else:
+        logger.warning("No authentication state provided or file not found. Proceeding without authentication.")
 
-        if use_authentication and os.path.exists(auth_path):
-            context_options['storage_state'] = auth_path
-            logger.info(f"Loading authentication state from: {auth_path}")
-        elif use_authentication and not os.path.exists(auth_path):
-            raise RuntimeError(f"Authentication requested, but auth file not found at: {auth_path}")
-        else:
-            logger.warning("No authentication state provided or file not found. Proceeding without authentication.")
-        
-        context = browser.new_context(**context_options)
+    def fingerprint_in_context(context: BrowserContext):
         page = context.new_page()
-        
+
         logger.info(f"Navigating to {target_url}...")
         page.goto(target_url)
         page.wait_for_load_state('domcontentloaded')
 
-        # Verify that we landed on the correct page and were not redirected.
-        if target_url != page.url and not allow_redirects:
-            error_msg = (
-                f"Fingerprint generation failed. Navigated to '{target_url}' but was redirected to'{page.url}'. "
-                "Your 'auth_state.json' may be expired or invalid. "
-                "Please regenerate it by running 'python -m utilities.create_auth_state'."
-            )
-            logger.error(error_msg)
-            browser.close()
-            raise RuntimeError(error_msg)
-        elif allow_redirects and target_url != page.url:
-            logger.info(f"Allowing redirects. Navigated to '{target_url}' but was redirected to'{page.url}'.")
-        
-        generate_locators_for_page(page, output_file, target_url)
-        
-        browser.close()
+        check_redirect(target_url, page.url, allow_redirects)
+
+        generate_locators_for_page(page, output_file, target_url, bypass_cache=bypass_cache, incremental=incremental)
+
+    browserPool.run_in_context(fingerprint_in_context, storage_state=storage_state)
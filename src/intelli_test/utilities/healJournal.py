@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from . import config, sqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Selectors healed at test time are journaled here so later runs can go straight to the healed
+# selector instead of waiting out the broken primary one. Test processes may run in parallel,
+# so this is a small SQLite DB rather than a sidecar JSON file.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS heals (
+    category TEXT NOT NULL,
+    element_key TEXT NOT NULL,
+    original_selector TEXT NOT NULL,
+    healed_selector TEXT NOT NULL,
+    score REAL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    first_healed_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (category, element_key)
+);
+"""
+
+_db = sqliteStore.SQLiteStore(lambda: config.HEAL_JOURNAL_PATH, _SCHEMA, row_factory=sqlite3.Row)
+_connect = _db.connect
+
+
+def lookup(category: str, element_key: str, primary_selector: str) -> str | None:
+    """
+    Returns the healed selector for an element, or None.
+    A heal only applies while the fingerprint still carries the selector it replaced;
+    once the fingerprint has been regenerated or promoted, the entry is ignored.
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT original_selector, healed_selector FROM heals WHERE category = ? AND element_key = ?",
+            (category, element_key)
+        ).fetchone()
+    if row is None or row["original_selector"] != primary_selector:
+        return None
+    return row["healed_selector"]
+
+
+def record(category: str, element_key: str, original_selector: str, healed_selector: str, score: float | None = None):
+    """Journals a freshly healed selector, replacing any earlier heal for the same element."""
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO heals (category, element_key, original_selector, healed_selector, score, hits, first_healed_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+            ON CONFLICT(category, element_key) DO UPDATE SET
+                original_selector = excluded.original_selector,
+                healed_selector = excluded.healed_selector,
+                score = excluded.score,
+                hits = 0,
+                first_healed_at = excluded.first_healed_at,
+                last_used_at = excluded.last_used_at
+            """,
+            (category, element_key, original_selector, healed_selector, score, now, now)
+        )
+    logger.info(f"Journaled healed selector for '{category}.{element_key}': {healed_selector}")
+
+
+def record_hit(category: str, element_key: str):
+    """Counts a run that was served by a journaled heal."""
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE heals SET hits = hits + 1, last_used_at = ? WHERE category = ? AND element_key = ?",
+            (time.time(), category, element_key)
+        )
+
+
+def discard(category: str, element_key: str | None = None) -> int:
+    """Removes the heal for one element, or every heal in a category. Returns how many were removed."""
+    with _connect() as conn:
+        if element_key is None:
+            cursor = conn.execute("DELETE FROM heals WHERE category = ?", (category,))
+        else:
+            cursor = conn.execute("DELETE FROM heals WHERE category = ? AND element_key = ?", (category, element_key))
+        return cursor.rowcount
+
+
+def list_heals(category: str | None = None) -> list[dict]:
+    """Returns journaled heals, most recently used first."""
+    query = "SELECT * FROM heals"
+    params = ()
+    if category is not None:
+        query += " WHERE category = ?"
+        params = (category,)
+    with _connect() as conn:
+        rows = conn.execute(query + " ORDER BY last_used_at DESC", params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _write_json_atomic(path: str, data: dict):
+    """Writes JSON to a temp file in the same directory and swaps it in, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def promote(category: str, fingerprint_path: str, element_keys: list[str] | None = None) -> dict:
+    """
+    Writes journaled heals into the category's fingerprint file as the new primary selectors and
+    removes them from the journal. Heals whose original selector no longer matches the file are
+    stale and are skipped. Returns the promoted and skipped element keys.
+    """
+    with open(fingerprint_path, 'r', encoding='utf-8') as f:
+        fingerprint = json.load(f)
+    elements = fingerprint.get("elements", {})
+
+    heals = list_heals(category)
+    if element_keys is not None:
+        wanted = set(element_keys)
+        heals = [heal for heal in heals if heal["element_key"] in wanted]
+
+    promoted, skipped = [], []
+    for heal in heals:
+        key = heal["element_key"]
+        element = elements.get(key)
+        if not isinstance(element, dict) or element.get("primary_selector") != heal["original_selector"]:
+            skipped.append(key)
+            continue
+        element["primary_selector"] = heal["healed_selector"]
+        promoted.append(key)
+
+    if promoted:
+        _write_json_atomic(fingerprint_path, fingerprint)
+        for key in promoted:
+            discard(category, key)
+        logger.info(f"Promoted {len(promoted)} healed selector(s) into {fingerprint_path}.")
+    return {"promoted": promoted, "skipped": skipped}
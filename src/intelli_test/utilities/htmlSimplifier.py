@@ -1,16 +1,159 @@
 from bs4 import BeautifulSoup
 from playwright.sync_api import Page
+from playwright.async_api import Page as AsyncPage
+import asyncio
+import hashlib
+import json
 import logging
+from intelli_test.utilities import config
 
 logger = logging.getLogger(__name__)
 
-def simplify_html(page: Page) -> str:
+# Attributes kept for each element, in the order they're rendered into the prompt.
+_RECORD_ATTRS = ["id", "class", "name", "placeholder", "aria-label", "data-testid", "role", "type", "href"]
+
+# Shared by every in-page script: names each landmark element (header, nav, main, form, dialog, ...)
+# so records and selectors can be attributed to the same page region. Elements outside any
+# landmark belong to the "page" region.
+REGION_JS = """
+    const LANDMARKS = "header, nav, main, aside, footer, form, section, dialog, [role=banner], [role=navigation], " +
+        "[role=main], [role=complementary], [role=contentinfo], [role=dialog], [role=form], [role=region]";
+    const regionIds = new Map();
+    const ordinals = {};
+    for (const lm of document.querySelectorAll(LANDMARKS)) {
+        const tag = lm.tagName.toLowerCase();
+        let id;
+        if (lm.id) id = `${tag}#${lm.id}`;
+        else if (lm.getAttribute("data-testid")) id = `${tag}[data-testid=${lm.getAttribute("data-testid")}]`;
+        else {
+            ordinals[tag] = (ordinals[tag] || 0) + 1;
+            id = `${tag}:${ordinals[tag]}`;
+        }
+        regionIds.set(lm, id);
+    }
+    const regionOf = (el) => {
+        const lm = el.closest(LANDMARKS);
+        return lm && regionIds.has(lm) ? regionIds.get(lm) : "page";
+    };
+"""
+
+# Walks the live DOM once, in document order, and returns one compact record per significant
+# visible element. Only an element's own direct text is captured, so nested containers no longer
+# repeat the text of all their descendants. Open shadow roots are walked as well.
+_EXTRACT_SCRIPT = """
+(maxText) => {
+""" + REGION_JS + """
+    const TAGS = new Set(["a", "button", "input", "textarea", "select", "h1", "h2", "h3", "label", "div", "span", "p"]);
+    const CONTAINERS = new Set(["div", "span", "p"]);
+    const SKIP = new Set(["script", "style", "meta", "link", "noscript", "template", "svg", "path", "head"]);
+    const ATTRS = ["id", "name", "placeholder", "aria-label", "data-testid", "role", "type", "href"];
+
+    const isRendered = (el) => {
+        if (typeof el.checkVisibility === "function") {
+            return el.checkVisibility({ checkOpacity: true, checkVisibilityCSS: true });
+        }
+        const style = getComputedStyle(el);
+        return style.display !== "none" && style.visibility !== "hidden" && style.opacity !== "0";
+    };
+
+    const ownText = (el) => {
+        let text = "";
+        for (const child of el.childNodes) {
+            if (child.nodeType === Node.TEXT_NODE) text += " " + child.nodeValue;
+        }
+        text = text.replace(/\\s+/g, " ").trim();
+        return text.length > maxText ? text.slice(0, maxText) + "..." : text;
+    };
+
+    const records = [];
+    const stack = [[document.body || document.documentElement, "page"]];
+    while (stack.length) {
+        const [el, parentRegion] = stack.pop();
+        const region = regionIds.get(el) || parentRegion;
+        const tag = el.tagName.toLowerCase();
+        if (SKIP.has(tag)) continue;
+        // display:none hides the whole subtree, so don't descend into it.
+        if (el.getClientRects().length === 0 && getComputedStyle(el).display === "none") continue;
+
+        if (TAGS.has(tag) && (tag === "input" ? el.type !== "hidden" : true) && isRendered(el)) {
+            const attrs = {};
+            for (const name of ATTRS) {
+                const value = el.getAttribute(name);
+                if (value) attrs[name] = value;
+            }
+            if (el.classList.length) attrs["class"] = Array.from(el.classList).slice(0, 4).join(" ");
+            const text = ownText(el);
+            // Plain layout containers without text or identifying attributes add noise, not signal.
+            const identifying = attrs.id || attrs["data-testid"] || attrs.role || attrs["aria-label"] || attrs.name;
+            if (!CONTAINERS.has(tag) || text || identifying) {
+                records.push({ tag, attrs, text, region });
+            }
+        }
+
+        const children = el.shadowRoot ? [...el.shadowRoot.children, ...el.children] : [...el.children];
+        for (let i = children.length - 1; i >= 0; i--) stack.push([children[i], region]);
+    }
+    return records;
+}
+"""
+
+# An element's explicit or implicit ARIA role. Shared by signal capture here and by the heal
+# script in smartElementFinder, so recorded roles and the roles candidates are scored on agree.
+ROLE_JS = """
+    const IMPLICIT_ROLES = { a: "link", button: "button", select: "combobox", textarea: "textbox", h1: "heading", h2: "heading", h3: "heading" };
+    const roleOf = (el) => {
+        const tag = el.tagName.toLowerCase();
+        if (el.getAttribute("role")) return el.getAttribute("role");
+        if (tag === "input") return ["checkbox", "radio", "button", "submit"].includes(el.type) ? (el.type === "submit" ? "button" : el.type) : "textbox";
+        return IMPLICIT_ROLES[tag] || null;
+    };
+"""
+
+# Captures the signals self-healing scores candidates against: identifying attributes,
+# the element's role and its position in the document.
+SIGNALS_JS = ROLE_JS + """
+    const SIGNAL_ATTRS = ["id", "name", "data-testid", "aria-label", "placeholder", "type", "href"];
+    const signalsOf = (el) => {
+        const attrs = {};
+        for (const name of SIGNAL_ATTRS) {
+            const value = el.getAttribute(name);
+            if (value) attrs[name] = value;
+        }
+        if (el.classList.length) attrs["class"] = Array.from(el.classList).join(" ");
+        const r = el.getBoundingClientRect();
+        return {
+            attrs,
+            role: roleOf(el),
+            rect: { x: Math.round(r.left + window.scrollX), y: Math.round(r.top + window.scrollY), width: Math.round(r.width), height: Math.round(r.height) }
+        };
+    };
+"""
+
+# Checks many CSS selectors in one round-trip: how many elements each matches, which region
+# the first match lives in, and its healing signals. Selectors the browser can't parse
+# (e.g. Playwright-only syntax) report a null count.
+_LOCATE_SCRIPT = """
+(selectors) => {
+""" + REGION_JS + SIGNALS_JS + """
+    return selectors.map((selector) => {
+        let matches;
+        try {
+            matches = document.querySelectorAll(selector);
+        } catch (e) {
+            return { count: null, region: null, signals: null };
+        }
+        const first = matches.length ? matches[0] : null;
+        return { count: matches.length, region: first ? regionOf(first) : null, signals: first ? signalsOf(first) : null };
+    });
+}
+"""
+
+def simplify_html_content(html_content: str) -> str:
     """
-    Strips HTML down to its essential interactive elements and their attributes.
+    Strips an HTML document down to its essential interactive elements and their attributes.
     This simplified version is easier for the LLM to process accurately.
     """
     try:
-        html_content = page.content()
         soup = BeautifulSoup(html_content, 'html.parser')
 
         # Remove tags that don't contain user-facing content.
@@ -35,12 +178,12 @@ def simplify_html(page: Page) -> str:
             tag_name = tag.name
             clean_attrs = {k: v for k, v in attrs.items() if v}
             attr_str = " ".join([f'{k}="{v}"' for k, v in clean_attrs.items()])
-            
+
             # Construct the simplified tag string.
             full_tag_str = f"<{tag_name} {attr_str}>"
             if text:
                 full_tag_str += f"{text}</{tag_name}>"
-            
+
             simplified_tags.append(full_tag_str)
 
         logger.info(f"Simplified HTML to {len(simplified_tags)} elements for AI context.")
@@ -48,3 +191,105 @@ def simplify_html(page: Page) -> str:
     except Exception as e:
         logger.error(f"An error occurred during HTML simplification: {e}")
         return ""
+
+def simplify_html(page: Page) -> str:
+    """
+    Strips the page's HTML down to its essential interactive elements and their attributes.
+    """
+    try:
+        html_content = page.content()
+    except Exception as e:
+        logger.error(f"An error occurred during HTML simplification: {e}")
+        return ""
+    return simplify_html_content(html_content)
+
+async def simplify_html_async(page: AsyncPage) -> str:
+    """
+    Async counterpart of simplify_html for pages driven by playwright.async_api.
+    Parsing runs in a worker thread so it doesn't stall the event loop.
+    """
+    try:
+        html_content = await page.content()
+    except Exception as e:
+        logger.error(f"An error occurred during HTML simplification: {e}")
+        return ""
+    return await asyncio.to_thread(simplify_html_content, html_content)
+
+def format_record(record: dict) -> str:
+    """Renders one DOM record in the same simplified-tag format simplify_html produces."""
+    tag_name = record["tag"]
+    attrs = record.get("attrs", {})
+    attr_str = " ".join([f'{k}="{attrs[k]}"' for k in _RECORD_ATTRS if attrs.get(k)])
+    full_tag_str = f"<{tag_name} {attr_str}>"
+    if record.get("text"):
+        full_tag_str += f"{record['text']}</{tag_name}>"
+    return full_tag_str
+
+def extract_dom_records(page: Page) -> list[dict]:
+    """Walks the live DOM in a single page.evaluate call and returns compact element records."""
+    return page.evaluate(_EXTRACT_SCRIPT, config.DOM_EXTRACTION_MAX_TEXT)
+
+async def extract_dom_records_async(page: AsyncPage) -> list[dict]:
+    """Async counterpart of extract_dom_records."""
+    return await page.evaluate(_EXTRACT_SCRIPT, config.DOM_EXTRACTION_MAX_TEXT)
+
+def structural_hash(records: list[dict]) -> str:
+    """
+    Hashes the structure of a region (tags and attributes, in order), ignoring text,
+    so clocks, counters and other changing copy don't mark a region as changed.
+    """
+    structure = [[record["tag"], record.get("attrs", {})] for record in records]
+    return hashlib.sha256(json.dumps(structure, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _regions_from_records(records: list[dict]) -> tuple[dict[str, list[str]], dict[str, str]]:
+    by_region = {}
+    for record in records:
+        by_region.setdefault(record.get("region", "page"), []).append(record)
+    regions = {region: [format_record(r) for r in region_records] for region, region_records in by_region.items()}
+    hashes = {region: structural_hash(region_records) for region, region_records in by_region.items()}
+    return regions, hashes
+
+def _regions_from_html(simplified_html: str) -> tuple[dict[str, list[str]], dict[str, str]]:
+    # Parsed HTML has no region information, so the whole page is one region hashed on its full text.
+    if not simplified_html:
+        return {}, {}
+    return {"page": simplified_html.splitlines()}, {"page": hashlib.sha256(simplified_html.encode("utf-8")).hexdigest()}
+
+def extract_page_regions(page: Page, mode: str | None = None) -> tuple[dict[str, list[str]], dict[str, str]]:
+    """
+    Returns the simplified page grouped by region, plus a structural hash per region.
+    Falls back to a single "page" region when in-browser extraction is off or fails.
+    """
+    mode = mode or config.DOM_EXTRACTION_MODE
+    if mode == "dom":
+        try:
+            records = extract_dom_records(page)
+            logger.info(f"Extracted {len(records)} elements from the live DOM for AI context.")
+            return _regions_from_records(records)
+        except Exception as e:
+            logger.warning(f"In-browser DOM extraction failed, falling back to HTML parsing: {e}")
+    return _regions_from_html(simplify_html(page))
+
+async def extract_page_regions_async(page: AsyncPage, mode: str | None = None) -> tuple[dict[str, list[str]], dict[str, str]]:
+    """Async counterpart of extract_page_regions."""
+    mode = mode or config.DOM_EXTRACTION_MODE
+    if mode == "dom":
+        try:
+            records = await extract_dom_records_async(page)
+            logger.info(f"Extracted {len(records)} elements from the live DOM for AI context.")
+            return _regions_from_records(records)
+        except Exception as e:
+            logger.warning(f"In-browser DOM extraction failed, falling back to HTML parsing: {e}")
+    return _regions_from_html(await simplify_html_async(page))
+
+def locate_selectors(page: Page, selectors: list[str]) -> list[dict]:
+    """Checks every selector in a single page.evaluate call. Returns [{count, region, signals}] in input order."""
+    if not selectors:
+        return []
+    return page.evaluate(_LOCATE_SCRIPT, selectors)
+
+async def locate_selectors_async(page: AsyncPage, selectors: list[str]) -> list[dict]:
+    """Async counterpart of locate_selectors."""
+    if not selectors:
+        return []
+    return await page.evaluate(_LOCATE_SCRIPT, selectors)
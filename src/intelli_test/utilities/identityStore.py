@@ -0,0 +1,321 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from . import authStatus, config, sqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Named login identities per base URL, so parallel workers can each use their own session instead of
+# sharing auth_state.json. Each identity's storage state lives in auth_states/<site>/<name>.json;
+# credentials, login settings and leases are kept in auth_states/identities.db.
+#
+# Two ways to get an identity:
+#   round robin - identities are handed out in turn and may be shared (fingerprinting, light test runs);
+#   exclusive   - a worker holds the identity alone until it releases it or the lease times out.
+ROUND_ROBIN = "round_robin"
+EXCLUSIVE = "exclusive"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS identities (
+    base_url TEXT NOT NULL,
+    name TEXT NOT NULL,
+    username TEXT,
+    password TEXT,
+    login_url TEXT,
+    login_instructions TEXT,
+    fingerprint_filename TEXT,
+    expires_at REAL,
+    refreshed_at REAL,
+    last_leased REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (base_url, name)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id TEXT PRIMARY KEY,
+    base_url TEXT NOT NULL,
+    name TEXT NOT NULL,
+    holder TEXT,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    FOREIGN KEY (base_url, name) REFERENCES identities (base_url, name) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_leases_identity ON leases (base_url, name, expires_at);
+"""
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# An identity can be leased once it has a stored state that hasn't expired.
+_USABLE = "refreshed_at IS NOT NULL AND (expires_at IS NULL OR expires_at > ?)"
+
+
+def _db_path() -> str:
+    return os.path.join(config.AUTH_IDENTITIES_PATH, "identities.db")
+
+
+_db = sqliteStore.SQLiteStore(_db_path, _SCHEMA, row_factory=sqlite3.Row, foreign_keys=True)
+_connect = _db.connect
+
+
+def normalize_base_url(url: str) -> str:
+    """Reduces a URL to scheme://host[:port], the key identities are grouped by."""
+    parsed = urlparse(url)
+    if not parsed.scheme or not parsed.netloc:
+        raise ValueError(f"Invalid base URL: '{url}'. Must be an absolute http(s) URL.")
+    return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}"
+
+
+def _validate_name(name: str):
+    if not _NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid identity name: '{name}'. Use up to 64 letters, digits, '.', '_' or '-'.")
+
+
+def state_path(base_url: str, name: str) -> str:
+    """Returns where an identity's storage state is kept."""
+    base_url = normalize_base_url(base_url)
+    _validate_name(name)
+    host = re.sub(r"[^a-z0-9.-]", "_", urlparse(base_url).netloc)
+    # The scheme is part of the key, so keep http and https sites apart.
+    site = f"{host}-{hashlib.sha256(base_url.encode('utf-8')).hexdigest()[:8]}"
+    return os.path.join(config.AUTH_IDENTITIES_PATH, site, f"{name}.json")
+
+
+def _public(row: sqlite3.Row) -> dict:
+    identity = {key: row[key] for key in row.keys() if key != "password"}
+    identity["state_path"] = state_path(row["base_url"], row["name"])
+    return identity
+
+
+def upsert_identity(base_url: str, name: str, username: str, password: str, login_url: str,
+                    login_instructions: str, fingerprint_filename: str | None = None) -> dict:
+    """Registers an identity, or updates its credentials and login settings. Its stored state is kept."""
+    base_url = normalize_base_url(base_url)
+    _validate_name(name)
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO identities (base_url, name, username, password, login_url, login_instructions, fingerprint_filename, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(base_url, name) DO UPDATE SET username = excluded.username, password = excluded.password,
+                login_url = excluded.login_url, login_instructions = excluded.login_instructions,
+                fingerprint_filename = excluded.fingerprint_filename
+            """,
+            (base_url, name, username, password, login_url, login_instructions, fingerprint_filename, time.time())
+        )
+        row = conn.execute("SELECT * FROM identities WHERE base_url = ? AND name = ?", (base_url, name)).fetchone()
+    return _public(row)
+
+
+def get_identity(base_url: str, name: str, with_credentials: bool = False) -> dict | None:
+    """Returns an identity; the password is only included with `with_credentials`."""
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM identities WHERE base_url = ? AND name = ?", (normalize_base_url(base_url), name)).fetchone()
+    if row is None:
+        return None
+    identity = _public(row)
+    if with_credentials:
+        identity["password"] = row["password"]
+    return identity
+
+
+def list_identities(base_url: str | None = None) -> list[dict]:
+    """Returns identities (without passwords), with the number of active exclusive leases on each."""
+    clauses, params = [], [time.time()]
+    if base_url:
+        clauses.append("i.base_url = ?")
+        params.append(normalize_base_url(base_url))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _connect() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT i.*, (SELECT COUNT(*) FROM leases l WHERE l.base_url = i.base_url AND l.name = i.name AND l.expires_at > ?) AS active_leases
+            FROM identities i {where} ORDER BY i.base_url, i.name
+            """,
+            params
+        ).fetchall()
+    return [_public(row) for row in rows]
+
+
+def remove_identity(base_url: str, name: str) -> bool:
+    """Deletes an identity, its leases and its stored state. Returns False if it didn't exist."""
+    base_url = normalize_base_url(base_url)
+    with _connect() as conn:
+        deleted = conn.execute("DELETE FROM identities WHERE base_url = ? AND name = ?", (base_url, name)).rowcount
+    if deleted:
+        try:
+            os.remove(state_path(base_url, name))
+        except FileNotFoundError:
+            pass
+        logger.info(f"Removed identity '{name}' for {base_url}.")
+    return bool(deleted)
+
+
+def mark_refreshed(base_url: str, name: str):
+    """Records that an identity's state file was just rewritten, along with its new expiry."""
+    path = state_path(base_url, name)
+    expires_at = authStatus.soonest_expiry(authStatus.load_state(path))
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE identities SET refreshed_at = ?, expires_at = ? WHERE base_url = ? AND name = ?",
+            (time.time(), expires_at, normalize_base_url(base_url), name)
+        )
+    logger.info(f"Identity '{name}' for {base_url} refreshed.")
+
+
+def _claim(base_url: str, mode: str, holder: str | None, ttl: float) -> dict | None:
+    """
+    Picks the least recently leased usable identity in one transaction, so concurrent workers in any
+    process get different identities. Returns None if there's nothing to lease right now.
+    """
+    now = time.time()
+    exclusive_filter = (
+        "AND NOT EXISTS (SELECT 1 FROM leases l WHERE l.base_url = i.base_url AND l.name = i.name AND l.expires_at > ?)"
+        if mode == EXCLUSIVE else ""
+    )
+    params = [base_url, now] + ([now] if mode == EXCLUSIVE else [])
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            row = conn.execute(
+                f"SELECT * FROM identities i WHERE base_url = ? AND {_USABLE} {exclusive_filter} ORDER BY last_leased, name LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE identities SET last_leased = ? WHERE base_url = ? AND name = ?", (now, base_url, row["name"]))
+            lease_id = None
+            if mode == EXCLUSIVE:
+                lease_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO leases (id, base_url, name, holder, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (lease_id, base_url, row["name"], holder, now, now + ttl)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return {"lease_id": lease_id, "mode": mode, "base_url": base_url, "name": row["name"], "state_path": state_path(base_url, row["name"]), "ttl": ttl}
+
+
+def lease(url: str, mode: str | None = None, holder: str | None = None, ttl: float | None = None,
+          timeout: float | None = None) -> dict | None:
+    """
+    Leases an identity for `url`'s site. Returns the lease (with the identity's `name` and
+    `state_path`), or None if the site has no identities registered, in which case callers fall back
+    to the global auth_state.json.
+    An exclusive lease waits up to `timeout` seconds for an identity to free up and raises
+    TimeoutError if none does; pass the lease to `release` when done, and hold it with `keep_alive`
+    if it may be needed for longer than `ttl`. Round robin raises LookupError
+    if every identity of the site is missing a valid state.
+    """
+    base_url = normalize_base_url(url)
+    mode = mode or config.AUTH_IDENTITY_LEASE_MODE
+    if mode not in (ROUND_ROBIN, EXCLUSIVE):
+        raise ValueError(f"Unknown lease mode: '{mode}'. Use '{ROUND_ROBIN}' or '{EXCLUSIVE}'.")
+    ttl = ttl or config.AUTH_IDENTITY_LEASE_TTL
+    timeout = config.AUTH_IDENTITY_LEASE_TIMEOUT if timeout is None else timeout
+
+    with _connect() as conn:
+        registered = conn.execute("SELECT COUNT(*) FROM identities WHERE base_url = ?", (base_url,)).fetchone()[0]
+    if not registered:
+        return None
+
+    deadline = time.monotonic() + timeout
+    while True:
+        claimed = _claim(base_url, mode, holder, ttl)
+        if claimed is not None:
+            logger.info(f"Leased identity '{claimed['name']}' for {base_url} ({mode}).")
+            return claimed
+        if mode == ROUND_ROBIN:
+            raise LookupError(f"None of the {registered} identities for {base_url} has a valid auth state. Refresh them first.")
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"All {registered} identities for {base_url} are leased or expired; none freed up within {timeout:g}s.")
+        time.sleep(config.JOB_POLL_INTERVAL)
+
+
+def release(lease_info: dict | None):
+    """Ends an exclusive lease. Round-robin leases (and None) need no release, so any lease can be passed."""
+    if not lease_info or not lease_info.get("lease_id"):
+        return
+    with _connect() as conn:
+        conn.execute("DELETE FROM leases WHERE id = ?", (lease_info["lease_id"],))
+    logger.info(f"Released identity '{lease_info['name']}' for {lease_info['base_url']}.")
+
+
+def renew(lease_info: dict | None, ttl: float | None = None) -> bool:
+    """
+    Extends an exclusive lease to `ttl` seconds from now (its original TTL by default).
+    Returns False if the lease already expired or was released, in which case the identity may
+    have been handed to someone else. Round-robin leases (and None) always renew.
+    """
+    if not lease_info or not lease_info.get("lease_id"):
+        return True
+    now = time.time()
+    ttl = ttl or lease_info.get("ttl") or config.AUTH_IDENTITY_LEASE_TTL
+    with _connect() as conn:
+        renewed = conn.execute(
+            "UPDATE leases SET expires_at = ? WHERE id = ? AND expires_at > ?",
+            (now + ttl, lease_info["lease_id"], now)
+        ).rowcount
+    return bool(renewed)
+
+
+class _LeaseHeartbeat(threading.Thread):
+    """Renews an exclusive lease every third of its TTL, so it outlives long test sessions."""
+
+    def __init__(self, lease_info: dict):
+        super().__init__(name=f"identity-lease-{lease_info['name']}", daemon=True)
+        self.lease_info = lease_info
+        self.interval = max(1.0, (lease_info.get("ttl") or config.AUTH_IDENTITY_LEASE_TTL) / 3)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if renew(self.lease_info):
+                    continue
+                logger.error(
+                    f"The lease on identity '{self.lease_info['name']}' for {self.lease_info['base_url']} expired before it "
+                    f"could be renewed; another worker may be using the identity now."
+                )
+                return
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew the lease on identity '{self.lease_info['name']}': {e}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self.join(timeout=timeout)
+
+
+@contextmanager
+def keep_alive(lease_info: dict | None):
+    """Holds a lease for the duration of the block: exclusive leases are renewed in the background and released on exit."""
+    heartbeat = None
+    if lease_info and lease_info.get("lease_id"):
+        heartbeat = _LeaseHeartbeat(lease_info)
+        heartbeat.start()
+    try:
+        yield lease_info
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        release(lease_info)
+
+
+@contextmanager
+def leased_state_path(url: str, mode: str | None = None, holder: str | None = None):
+    """
+    Yields the storage state file to log in to `url` with: a leased identity's state if the site
+    has identities, otherwise the global auth_state.json. Exclusive leases are kept alive while
+    the block runs and released on exit.
+    """
+    with keep_alive(lease(url, mode=mode, holder=holder)) as lease_info:
+        yield lease_info["state_path"] if lease_info else config.AUTH_STATE_PATH
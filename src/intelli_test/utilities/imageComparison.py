@@ -1,9 +1,12 @@
 from skimage.metrics import structural_similarity as ssim
 import cv2
+import hashlib
+import numpy as np
 import os
-import shutil
 import logging
+from typing import NamedTuple
 from playwright.sync_api import Page
+from . import baselineStore, config, fingerprintIndex, smartElementFinder
 
 logger = logging.getLogger(__name__)
 
@@ -12,21 +15,155 @@ logger = logging.getLogger(__name__)
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 IMAGES_FOLDER = os.path.join(PROJECT_ROOT, 'images')
 
-def compare_images(image1, image2):
-    ''' 
-    Compares two images and returns a score and a difference value.
+# skimage's default SSIM window; tiles smaller than this are compared by mean pixel difference instead.
+_MIN_SSIM_SIDE = 7
+
+
+class ComparisonResult(NamedTuple):
+    """
+    SSIM score (1.0 is a perfect match) and the (x, y, width, height) boxes of the regions that differ.
+    When a tiled comparison stops early, `score` is the highest the full score could have been; it's
+    below the threshold either way, so `score >= threshold` gives the same answer as a full run.
+    """
+    score: float
+    diff_boxes: list[tuple[int, int, int, int]]
+
+
+def load_grayscale(image) -> tuple[np.ndarray, bytes | None]:
+    """
+    Accepts a file path, encoded image bytes, or a decoded array (BGR, BGRA or grayscale).
+    Returns the grayscale pixels and, when available, the encoded bytes for the hash fast path.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return image, None
+        code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(image, code), None
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        encoded = bytes(image)
+    else:
+        with open(image, 'rb') as f:
+            encoded = f.read()
+    # Decoding straight to grayscale skips a full-size colour buffer and the conversion pass.
+    pixels = cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if pixels is None:
+        raise ValueError(f"Could not decode image: {image if isinstance(image, (str, os.PathLike)) else '<bytes>'}")
+    return pixels, encoded
+
+
+def _pad_to(pixels: np.ndarray, height: int, width: int) -> np.ndarray:
+    if pixels.shape == (height, width):
+        return pixels
+    return cv2.copyMakeBorder(pixels, 0, height - pixels.shape[0], 0, width - pixels.shape[1], cv2.BORDER_CONSTANT, value=0)
+
+
+def _size_mismatch_boxes(shape1: tuple, shape2: tuple) -> list[tuple[int, int, int, int]]:
+    """Boxes covering the area only one of the two images has."""
+    (h1, w1), (h2, w2) = shape1, shape2
+    height, width = max(h1, h2), max(w1, w2)
+    common_h, common_w = min(h1, h2), min(w1, w2)
+    boxes = []
+    if common_w < width:
+        boxes.append((common_w, 0, width - common_w, height))
+    if common_h < height:
+        boxes.append((0, common_h, common_w, height - common_h))
+    return boxes
+
+
+def _diff_boxes(baseline: np.ndarray, current: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """Bounding boxes of the clusters of pixels that differ noticeably between two same-sized images."""
+    delta = cv2.absdiff(baseline, current)
+    _, mask = cv2.threshold(delta, config.VISUAL_DIFF_PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)
+    # Dilate so nearby changed pixels (e.g. the glyphs of one changed word) merge into one box.
+    mask = cv2.dilate(mask, np.ones((5, 5), np.uint8), iterations=2)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = [cv2.boundingRect(c) for c in contours]
+    return sorted(
+        (tuple(int(v) for v in box) for box in boxes if box[2] * box[3] >= config.VISUAL_MIN_DIFF_AREA),
+        key=lambda box: (box[1], box[0])
+    )
+
+
+def _tile_score(baseline_tile: np.ndarray, current_tile: np.ndarray) -> float:
+    if min(baseline_tile.shape) < _MIN_SSIM_SIDE:
+        return 1.0 - float(cv2.absdiff(baseline_tile, current_tile).mean()) / 255.0
+    return float(ssim(baseline_tile, current_tile, data_range=255))
+
+
+def _tiled_ssim(baseline: np.ndarray, current: np.ndarray, tile_size: int, threshold: float | None) -> float:
+    """
+    Area-weighted SSIM over square tiles. Tiles with identical pixels score 1.0 without any SSIM work.
+    With a `threshold`, stops as soon as the score can no longer reach it, even if every tile left
+    scored 1.0, and returns that best possible score. It is still below the threshold, so the
+    comparison passes or fails exactly as it would after scoring every tile.
+    """
+    height, width = baseline.shape
+    weighted_total = 0.0
+    # Area-weighted score lost so far; once it exceeds this budget the threshold is out of reach.
+    budget = (1.0 - threshold) * baseline.size if threshold is not None else None
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            baseline_tile = baseline[y:y + tile_size, x:x + tile_size]
+            current_tile = current[y:y + tile_size, x:x + tile_size]
+            if np.array_equal(baseline_tile, current_tile):
+                score = 1.0
+            else:
+                score = _tile_score(baseline_tile, current_tile)
+                if budget is not None:
+                    budget -= (1.0 - score) * baseline_tile.size
+                    if budget < 0:
+                        best_possible = threshold + budget / baseline.size
+                        logger.info(f"Tile at ({x}, {y}) scored {score:.4f}; the image can score at most {best_possible:.4f}, below the threshold of {threshold}. Stopping early.")
+                        return best_possible
+            weighted_total += score * baseline_tile.size
+    return weighted_total / baseline.size
+
+
+def compare_images(image1, image2, threshold: float | None = None, scale: float | None = None,
+                   tile_size: int | None = None) -> ComparisonResult:
+    '''
+    Compares two images and returns a score and the boxes of the regions that differ.
     A score of 1.0 indicates a perfect match.
+    Images can be file paths, encoded bytes, or decoded arrays, and don't need to be the same size:
+    the smaller one is padded and the area only one image covers is reported as a difference.
+    `scale` downsamples before SSIM, `tile_size` sets the SSIM tile edge (0 scores the image in one
+    pass), and `threshold` enables the early exit once the score can no longer reach it.
     '''
-    baseline = cv2.imread(image1)
-    current = cv2.imread(image2)
+    scale = config.VISUAL_SSIM_SCALE if scale is None else scale
+    tile_size = config.VISUAL_TILE_SIZE if tile_size is None else tile_size
+
+    baseline, baseline_bytes = load_grayscale(image1)
+    current, current_bytes = load_grayscale(image2)
+
+    # Fast path: byte-identical files need no SSIM work.
+    if baseline_bytes is not None and current_bytes is not None and \
+            hashlib.blake2b(baseline_bytes).digest() == hashlib.blake2b(current_bytes).digest():
+        return ComparisonResult(1.0, [])
 
-    baseline_grayscale = cv2.cvtColor(baseline, cv2.COLOR_BGR2GRAY)
-    current_grayscale = cv2.cvtColor(current, cv2.COLOR_BGR2GRAY)
+    common_h, common_w = min(baseline.shape[0], current.shape[0]), min(baseline.shape[1], current.shape[1])
+    mismatch_boxes = []
+    if baseline.shape != current.shape:
+        logger.warning(f"Image sizes differ ({baseline.shape[1]}x{baseline.shape[0]} vs {current.shape[1]}x{current.shape[0]}). Padding to compare.")
+        mismatch_boxes = _size_mismatch_boxes(baseline.shape, current.shape)
+        height, width = max(baseline.shape[0], current.shape[0]), max(baseline.shape[1], current.shape[1])
+        baseline, current = _pad_to(baseline, height, width), _pad_to(current, height, width)
+    elif np.array_equal(baseline, current):
+        # Fast path: different encodings of the same pixels.
+        return ComparisonResult(1.0, [])
 
-    (score, diff) = ssim(baseline_grayscale, current_grayscale, full=True)
-    diff = (diff * 255).astype("uint8")
+    diff_boxes = mismatch_boxes + _diff_boxes(baseline[:common_h, :common_w], current[:common_h, :common_w])
 
-    return score, diff
+    if scale and scale != 1.0:
+        size = (max(_MIN_SSIM_SIDE, round(baseline.shape[1] * scale)), max(_MIN_SSIM_SIDE, round(baseline.shape[0] * scale)))
+        baseline = cv2.resize(baseline, size, interpolation=cv2.INTER_AREA)
+        current = cv2.resize(current, size, interpolation=cv2.INTER_AREA)
+
+    if tile_size:
+        score = _tiled_ssim(baseline, current, tile_size, threshold)
+    else:
+        score = _tile_score(baseline, current)
+    return ComparisonResult(score, diff_boxes)
 
 def take_screenshot(page: Page, test_name: str):
     '''
@@ -38,20 +175,74 @@ def take_screenshot(page: Page, test_name: str):
     logger.info(f"Screenshot saved to: {screenshot_path}")
 
 
-def compare_test_run_images(page: Page, test_name: str):
+def _compare_with_baseline(baseline_name: str, screenshot: bytes, threshold: float | None) -> ComparisonResult:
+    """Compares in-memory screenshot bytes against a stored baseline, creating the baseline if there isn't one."""
+    current = baselineStore.decode(screenshot)
+    current_hash = baselineStore.pixel_hash(current)
+
+    entry = baselineStore.get_entry(baseline_name)
+    if entry is None and baselineStore.migrate_legacy(baseline_name):
+        entry = baselineStore.get_entry(baseline_name)
+    if entry is None:
+        logger.info(f"Baseline image for '{baseline_name}' not found. Creating...")
+        baselineStore.set_baseline(baseline_name, current, current_hash)
+        return ComparisonResult(1.0, [])
+
+    # Fast path: identical pixels hash the same, so the baseline doesn't even need decoding.
+    if entry["baseline"]["hash"] == current_hash:
+        result = ComparisonResult(1.0, [])
+    else:
+        result = compare_images(baselineStore.get(entry["baseline"]), current, threshold=threshold)
+
+    matched = result.score >= threshold if threshold is not None else not result.diff_boxes
+    baselineStore.record_current(baseline_name, None if matched else current, current_hash)
+    return result
+
+
+def _resolve_selector(elements_category: str | None, name: str) -> str:
+    """Treats `name` as an element key of the fingerprint file when it is one, and as a CSS selector otherwise."""
+    if elements_category:
+        try:
+            return fingerprintIndex.get_element(elements_category, name)["primary_selector"]
+        except KeyError:
+            pass
+    return name
+
+
+def compare_test_run_images(page: Page, test_name: str, threshold: float | None = None,
+                            regions: list[str] | None = None, masks: list[str] | None = None,
+                            elements_category: str | None = None) -> ComparisonResult:
     '''
-    Compares a baseline images with the current image generated
-    by a test. If no baseline image exists, it creates one.
+    Compares a screenshot of the page against the test's stored baseline.
+    If no baseline exists, the screenshot becomes the baseline.
+    The screenshot is decoded in memory; it's only written to the baseline store when it's a new
+    baseline or doesn't match, so it can be reviewed and promoted later.
+
+    `regions` limits the check to element screenshots of those element keys from `elements_category`,
+    each with its own baseline. The result carries the lowest region score and every region's diff
+    boxes in page coordinates. `masks` are element keys or CSS selectors painted over with a solid
+    colour before comparing, for dynamic content such as clocks or ad slots.
     '''
-    baseline = os.path.join(IMAGES_FOLDER, f"{test_name}_baseline.png")
-    current = os.path.join(IMAGES_FOLDER, f"{test_name}_current.png")
-
-    if not os.path.exists(current):
-        logger.info("Current image not found. Taking screenshot of current state...")
-        take_screenshot(page, test_name)
-
-    if not os.path.exists(baseline):
-        logger.info(f"Baseline image not found. Creating...")
-        shutil.copy(current, baseline)
-        return (1, 0)
-    return (compare_images(baseline, current))
\ No newline at end of file
+    mask_locators = [page.locator(_resolve_selector(elements_category, mask)) for mask in masks or []]
+
+    if not regions:
+        return _compare_with_baseline(test_name, page.screenshot(mask=mask_locators), threshold)
+
+    if not elements_category:
+        raise ValueError("Region-scoped comparison needs the elements_category the region keys belong to.")
+
+    score = 1.0
+    diff_boxes = []
+    for region in regions:
+        locator = smartElementFinder.find_element_smart(page, elements_category, region)
+        screenshot = locator.screenshot(mask=mask_locators)
+        result = _compare_with_baseline(f"{test_name}[{region}]", screenshot, threshold)
+        logger.info(f"Region '{region}' of '{test_name}' scored {result.score:.4f}.")
+        score = min(score, result.score)
+        if result.diff_boxes:
+            # Element screenshots are in the element's own coordinates; shift them onto the page.
+            box = locator.bounding_box() or {"x": 0, "y": 0}
+            scroll_x, scroll_y = page.evaluate("() => [window.scrollX, window.scrollY]")
+            offset_x, offset_y = round(box["x"] + scroll_x), round(box["y"] + scroll_y)
+            diff_boxes.extend((x + offset_x, y + offset_y, w, h) for x, y, w, h in result.diff_boxes)
+    return ComparisonResult(score, diff_boxes)
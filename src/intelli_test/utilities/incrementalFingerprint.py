@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Keys whose selector couldn't be tied to a region (no match, or non-CSS syntax) are tracked here.
+UNASSIGNED_REGION = "_unassigned"
+
+
+def load_previous(output_path: str) -> dict | None:
+    """Returns the existing fingerprint file if it carries region hashes, otherwise None."""
+    if not os.path.exists(output_path):
+        return None
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Could not read previous fingerprint file at {output_path}: {e}. Regenerating from scratch.")
+        return None
+    if not isinstance(previous, dict) or not previous.get("regions") or not isinstance(previous.get("elements"), dict):
+        logger.info(f"Previous fingerprint file at {output_path} has no region hashes. Regenerating from scratch.")
+        return None
+    return previous
+
+
+def plan_refresh(previous: dict, hashes: dict[str, str]) -> tuple[set[str], dict]:
+    """
+    Diffs the stored region hashes against the current ones.
+    Returns the regions that are new or changed, and the previous locators from unchanged
+    regions (plus unassigned ones) as {key: (stored_region, locator)}. Those are candidates
+    to keep once they've been checked in-page.
+    """
+    stored = previous["regions"]
+    elements = previous["elements"]
+    changed = {region for region, digest in hashes.items() if stored.get(region, {}).get("hash") != digest}
+
+    candidates = {}
+    for region, entry in stored.items():
+        if region != UNASSIGNED_REGION and (region in changed or region not in hashes):
+            continue
+        for key in entry.get("keys", []):
+            if key in elements:
+                candidates[key] = (region, elements[key])
+    return changed, candidates
+
+
+def keep_verified(candidates: dict, checks: list[dict], changed: set[str], hashes: dict[str, str]) -> tuple[dict, dict]:
+    """
+    Keeps candidate locators whose selector still resolves to exactly one element.
+    When a selector is broken, its region is added to `changed` so it gets re-queried. A broken
+    selector with no region to re-query (it was unassigned and matches nothing, or several elements
+    outside any region) sends the whole page back to the model instead.
+    Selectors the browser can't evaluate as CSS are kept as-is.
+    Returns the kept locators and the broken ones as {key: locator}, so keys the model doesn't
+    return again can be restored with `restore_missing`.
+    """
+    kept, broken = {}, {}
+    for (key, (stored_region, locator)), check in zip(candidates.items(), checks):
+        if check["count"] is None or check["count"] == 1:
+            kept[key] = locator
+            continue
+        broken[key] = locator
+        regions = {region for region in (stored_region, check.get("region")) if region and region != UNASSIGNED_REGION}
+        if regions:
+            logger.info(f"Selector for '{key}' now matches {check['count']} element(s). Re-querying its region.")
+            changed.update(regions)
+        else:
+            logger.info(f"Selector for '{key}' now matches {check['count']} element(s) outside any region. Re-querying the whole page.")
+            changed.update(hashes)
+    return kept, broken
+
+
+def restore_missing(locators: dict, broken: dict) -> dict:
+    """
+    Puts back broken locators whose key the model didn't return, so tests that use the key fail on
+    the selector (and can self-heal) instead of with a KeyError.
+    """
+    for key, locator in broken.items():
+        if key not in locators:
+            logger.warning(f"The regenerated fingerprint has no locator for '{key}'. Keeping its previous, broken selector.")
+            locators[key] = locator
+    return locators
+
+
+def changed_region_keys(previous: dict, changed: set[str], candidates: dict) -> dict:
+    """
+    Returns the previous locators from regions that are going back to the model, as {key: locator},
+    leaving out the candidates `keep_verified` has already dealt with.
+    """
+    elements = previous["elements"]
+    return {
+        key: elements[key]
+        for region in changed
+        for key in previous["regions"].get(region, {}).get("keys", [])
+        if key in elements and key not in candidates
+    }
+
+
+def still_unique(locators: dict, checks: list[dict]) -> dict:
+    """Returns the locators whose selector resolves to exactly one element, as {key: locator}."""
+    return {key: locator for (key, locator), check in zip(locators.items(), checks) if check["count"] == 1}
+
+
+def restore_reusable(locators: dict, reusable: dict) -> dict:
+    """
+    Puts back locators from changed regions that still resolve to one element but that the model
+    didn't return, unless a returned locator already uses the same selector under a new key.
+    """
+    in_use = set(selectors_for(locators))
+    for key, locator in reusable.items():
+        if key not in locators and _selector(locator) not in in_use:
+            logger.info(f"The model didn't return '{key}', but its selector still matches one element. Keeping it.")
+            locators[key] = locator
+    return locators
+
+
+def warn_dropped(previous: dict, locators: dict, hashes: dict[str, str]):
+    """Logs every key of the previous fingerprint that the refreshed one no longer has."""
+    removed = {
+        key for region, entry in previous["regions"].items()
+        if region != UNASSIGNED_REGION and region not in hashes
+        for key in entry.get("keys", [])
+    }
+    for key in previous["elements"]:
+        if key in locators:
+            continue
+        reason = "its page region is gone" if key in removed else "the model didn't return it for its changed region"
+        logger.warning(f"Dropping '{key}' from the fingerprint: {reason}. Tests that use it will fail with a KeyError.")
+
+
+def build_region_index(locators: dict, checks: list[dict], hashes: dict[str, str]) -> dict:
+    """Maps each region to its structural hash and the locator keys that live in it."""
+    index = {region: {"hash": digest, "keys": []} for region, digest in hashes.items()}
+    for key, check in zip(locators, checks):
+        region = check.get("region")
+        if region not in index:
+            region = UNASSIGNED_REGION
+            index.setdefault(UNASSIGNED_REGION, {"hash": None, "keys": []})
+        index[region]["keys"].append(key)
+    return index
+
+
+def selectors_for(locators: dict) -> list[str]:
+    """Returns each locator's primary selector, in the same order as the locators."""
+    return [_selector(locator) for locator in locators.values()]
+
+
+def candidate_selectors(candidates: dict) -> list[str]:
+    """Returns each candidate's primary selector, in the same order as the candidates."""
+    return [_selector(locator) for _, locator in candidates.values()]
+
+
+def previous_keys(previous: dict, regions: set[str], broken: dict | None = None) -> list[str]:
+    """
+    Returns the locator keys previously generated for the given regions, plus any broken keys,
+    so the model can reuse their names.
+    """
+    keys = [key for region in regions for key in previous["regions"].get(region, {}).get("keys", [])]
+    return keys + [key for key in (broken or {}) if key not in keys]
+
+
+def _selector(locator) -> str:
+    return locator.get("primary_selector", "") if isinstance(locator, dict) else ""
@@ -0,0 +1,176 @@
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from . import config, sqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Responses are cached on disk keyed by a hash of (model, generation config, prompt),
+# so identical requests from any generator or process skip the model round-trip.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses (last_accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_db = sqliteStore.SQLiteStore(lambda: config.LLM_CACHE_PATH, _SCHEMA)
+_connect = _db.connect
+
+
+def _model_name(model) -> str:
+    return getattr(model, "model_name", None) or str(model)
+
+
+def _config_to_dict(generation_config):
+    """Normalises a GenerationConfig (dataclass, dict or None) into something JSON-serialisable."""
+    if generation_config is None:
+        return None
+    if isinstance(generation_config, dict):
+        return generation_config
+    if dataclasses.is_dataclass(generation_config):
+        return dataclasses.asdict(generation_config)
+    return getattr(generation_config, "__dict__", str(generation_config))
+
+
+def cache_key(model_name: str, prompt: str, generation_config=None) -> str:
+    """Returns the content address for a request: a SHA-256 of the model, config and prompt."""
+    material = json.dumps(
+        {"model": model_name, "generation_config": _config_to_dict(generation_config), "prompt": prompt},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _bump(conn: sqlite3.Connection, counter: str):
+    conn.execute(
+        "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (counter,)
+    )
+
+
+def _lookup(key: str) -> str | None:
+    now = time.time()
+    with _connect() as conn:
+        row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] > config.LLM_CACHE_TTL_SECONDS:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            _bump(conn, "misses")
+            return None
+        conn.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+        _bump(conn, "hits")
+        return row[0]
+
+
+def _store(key: str, model_name: str, response: str):
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model_name, response, size, now, now)
+        )
+        # Drop expired entries, then evict least recently used ones until we're under the size budget.
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - config.LLM_CACHE_TTL_SECONDS,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > config.LLM_CACHE_MAX_BYTES:
+            evicted = 0
+            for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY last_accessed").fetchall():
+                if total <= config.LLM_CACHE_MAX_BYTES:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= old_size
+                evicted += 1
+            logger.info(f"Evicted {evicted} LLM cache entr{'y' if evicted == 1 else 'ies'} to stay under {config.LLM_CACHE_MAX_BYTES} bytes.")
+        conn.execute("COMMIT")
+
+
+def generate_text(model, prompt: str, generation_config=None, bypass_cache: bool = False) -> str:
+    """
+    Returns the model's text response for a prompt, serving it from the cache when possible.
+    With `bypass_cache` the model is always called and the fresh response replaces any cached one.
+    """
+    model_name = _model_name(model)
+    key = cache_key(model_name, prompt, generation_config)
+    if not bypass_cache and config.LLM_CACHE_ENABLED:
+        cached = _lookup(key)
+        if cached is not None:
+            logger.info(f"LLM cache hit ({key[:12]}). Skipping model request.")
+            return cached
+
+    response = model.generate_content(prompt, generation_config=generation_config)
+    text = response.text
+    if config.LLM_CACHE_ENABLED:
+        _store(key, model_name, text)
+    return text
+
+
+async def generate_text_async(model, prompt: str, generation_config=None, bypass_cache: bool = False) -> str:
+    """Async counterpart of generate_text. Cache I/O runs in a worker thread."""
+    model_name = _model_name(model)
+    key = cache_key(model_name, prompt, generation_config)
+    if not bypass_cache and config.LLM_CACHE_ENABLED:
+        cached = await asyncio.to_thread(_lookup, key)
+        if cached is not None:
+            logger.info(f"LLM cache hit ({key[:12]}). Skipping model request.")
+            return cached
+
+    response = await model.generate_content_async(prompt, generation_config=generation_config)
+    text = response.text
+    if config.LLM_CACHE_ENABLED:
+        await asyncio.to_thread(_store, key, model_name, text)
+    return text
+
+
+def discard(model, prompt: str, generation_config=None):
+    """
+    Removes a cached response, e.g. once a caller finds it unusable, so the next
+    identical request goes back to the model instead of replaying the bad answer.
+    """
+    key = cache_key(_model_name(model), prompt, generation_config)
+    with _connect() as conn:
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+def get_stats() -> dict:
+    """Returns hit/miss counters and the current size of the cache."""
+    with _connect() as conn:
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    hits = counters.get("hits", 0)
+    misses = counters.get("misses", 0)
+    return {
+        "enabled": config.LLM_CACHE_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "entries": entries,
+        "size_bytes": size,
+        "max_bytes": config.LLM_CACHE_MAX_BYTES,
+        "ttl_seconds": config.LLM_CACHE_TTL_SECONDS
+    }
+
+
+def clear():
+    """Deletes every cached response and resets the counters."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM responses")
+        conn.execute("DELETE FROM counters")
+    logger.info("LLM response cache cleared.")
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import time
+from . import config, sqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Login scripts that actually logged in are kept here, keyed by everything that shaped them: the
+# login URL, the instructions, the fingerprint elements, the model and the credentials. Re-running
+# the same login replays the stored script in the browser without asking the model again. Unlike the
+# LLM response cache, entries are only written after a successful login and are never evicted by
+# size or age; they go away when a replay fails or the cache is cleared.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scripts (
+    key TEXT PRIMARY KEY,
+    login_url TEXT NOT NULL,
+    model TEXT NOT NULL,
+    script TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_db = sqliteStore.SQLiteStore(lambda: config.LOGIN_SCRIPT_CACHE_PATH, _SCHEMA)
+_connect = _db.connect
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def script_key(login_url: str, login_instructions: str, elements: dict, model_name: str,
+               username: str | None = None, password: str | None = None) -> str:
+    """
+    Returns the cache key for a login. Literal credentials end up in the generated script, so they're
+    part of the key (hashed); without them the script reads config.TEST_USER/PASSWORD at run time.
+    """
+    credentials = _digest([username, password]) if username and password else None
+    return _digest({
+        "login_url": login_url,
+        "instructions": _digest(login_instructions),
+        "elements": _digest(elements),
+        "model": model_name,
+        "credentials": credentials
+    })
+
+
+def lookup(key: str) -> str | None:
+    """Returns the stored script body for a login, or None."""
+    with _connect() as conn:
+        row = conn.execute("SELECT script FROM scripts WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def record_use(key: str):
+    """Marks a stored script as having just logged in again."""
+    with _connect() as conn:
+        conn.execute("UPDATE scripts SET uses = uses + 1, last_used = ? WHERE key = ?", (time.time(), key))
+
+
+def store(key: str, login_url: str, model_name: str, script: str):
+    """Stores a script body that just logged in successfully."""
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO scripts (key, login_url, model, script, created_at, last_used, uses) VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(key) DO UPDATE SET script = excluded.script, created_at = excluded.created_at,
+                last_used = excluded.last_used, uses = 1
+            """,
+            (key, login_url, model_name, script, now, now)
+        )
+    logger.info(f"Stored login script for {login_url} ({key[:12]}).")
+
+
+def discard(key: str):
+    """Removes a stored script, e.g. after it failed to log in."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM scripts WHERE key = ?", (key,))
+
+
+def list_scripts() -> list[dict]:
+    """Returns metadata (not the scripts) for every stored login, most recently used first."""
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT key, login_url, model, created_at, last_used, uses FROM scripts ORDER BY last_used DESC"
+        ).fetchall()
+    return [dict(zip(("key", "login_url", "model", "created_at", "last_used", "uses"), row)) for row in rows]
+
+
+def clear():
+    """Deletes every stored login script."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM scripts")
+    logger.info("Login script cache cleared.")
@@ -0,0 +1,313 @@
+import json
+import logging
+import os
+import sqlite3
+import uuid
+import zlib
+from pathlib import Path
+from . import config, sqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Every pytest JSON report is ingested here, so history survives report files being overwritten
+# and queries by test, outcome or time range hit an index instead of re-reading report files.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    created REAL NOT NULL,
+    duration REAL,
+    exitcode INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    passed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    report BLOB NOT NULL,
+    UNIQUE (source, created)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_source ON runs (source, created DESC);
+CREATE TABLE IF NOT EXISTS test_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL NOT NULL,
+    setup_duration REAL NOT NULL DEFAULT 0,
+    call_duration REAL NOT NULL DEFAULT 0,
+    teardown_duration REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    longrepr TEXT,
+    UNIQUE (run_id, nodeid)
+);
+CREATE INDEX IF NOT EXISTS idx_results_nodeid ON test_results (nodeid, created DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_results_outcome ON test_results (outcome, created DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_results_created ON test_results (created DESC, id DESC);
+"""
+
+_PHASES = ("setup", "call", "teardown")
+
+# Tests a shard never reached are recorded with this longrepr prefix (see testSharding.merge_reports).
+# They carry no real duration, so duration queries leave them out.
+NOT_RUN_PREFIX = "Not run:"
+
+_db = sqliteStore.SQLiteStore(lambda: config.REPORT_HISTORY_PATH, _SCHEMA, row_factory=sqlite3.Row, foreign_keys=True)
+_connect = _db.connect
+
+
+def _phase_duration(test: dict, phase: str) -> float:
+    return (test.get(phase) or {}).get("duration", 0.0)
+
+
+def _test_longrepr(test: dict) -> str | None:
+    for phase in _PHASES:
+        longrepr = (test.get(phase) or {}).get("longrepr")
+        if longrepr:
+            return str(longrepr)
+    return None
+
+
+def ingest_report(report: dict, source: str) -> int | None:
+    """
+    Stores a pytest-json-report dict as a run. `source` is the report's file name.
+    Returns the new run id, or None if this exact run (same source and timestamp) is already stored.
+    """
+    created = report.get("created")
+    if created is None:
+        raise ValueError(f"Report '{source}' has no 'created' timestamp.")
+    summary = report.get("summary", {})
+    tests = report.get("tests", [])
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO runs (source, created, duration, exitcode, total, passed, failed, error, skipped, report)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    source, created, report.get("duration"), report.get("exitcode"),
+                    summary.get("total", len(tests)), summary.get("passed", 0), summary.get("failed", 0),
+                    summary.get("error", 0), summary.get("skipped", 0),
+                    zlib.compress(json.dumps(report).encode("utf-8"))
+                )
+            )
+            if cursor.rowcount == 0:
+                conn.execute("ROLLBACK")
+                return None
+            run_id = cursor.lastrowid
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO test_results
+                    (run_id, nodeid, outcome, duration, setup_duration, call_duration, teardown_duration, created, longrepr)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        run_id, test["nodeid"], test.get("outcome", "unknown"),
+                        sum(_phase_duration(test, phase) for phase in _PHASES),
+                        *(_phase_duration(test, phase) for phase in _PHASES),
+                        created, _test_longrepr(test)
+                    )
+                    for test in tests if "nodeid" in test
+                ]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    logger.info(f"Ingested report '{source}' as run {run_id} ({len(tests)} test(s)).")
+    return run_id
+
+
+def ingest_file(report_path: Path) -> int | None:
+    """Ingests a report file. Returns the run id, or None if it was already stored."""
+    report = json.loads(Path(report_path).read_text(encoding="utf-8"))
+    return ingest_report(report, Path(report_path).name)
+
+
+def ingest_quietly(report_path: Path) -> int | None:
+    """Ingests a report file, logging rather than raising on failure, for use right after a test run."""
+    try:
+        return ingest_file(report_path)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.error(f"Could not ingest report '{report_path}' into the history store: {e}", exc_info=True)
+        return None
+
+
+def _reports_dir() -> Path:
+    return config.PROJECT_ROOT.parent / "reports"
+
+
+def run_report_path(report_name: str) -> Path:
+    """
+    Returns a fresh path for one run's pytest report under reports/runs/, so concurrent runs of the
+    same tests never write, delete or read each other's report. Hand it to `publish_run_report` after the run.
+    """
+    run_dir = _reports_dir() / "runs"
+    run_dir.mkdir(parents=True, exist_ok=True)
+    return run_dir / f"{Path(report_name).stem}-{uuid.uuid4().hex}.json"
+
+
+def publish_run_report(run_path: Path, report_name: str) -> int | None:
+    """
+    Ingests a run's report as `report_name`, then moves it to reports/<report_name> for the
+    dashboard, replacing the previous run's. Returns the run id, or None if it couldn't be ingested.
+    """
+    run_id = None
+    try:
+        run_id = ingest_report(json.loads(run_path.read_text(encoding="utf-8")), report_name)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.error(f"Could not ingest report '{run_path}' into the history store: {e}", exc_info=True)
+    os.replace(run_path, _reports_dir() / report_name)
+    return run_id
+
+
+def backfill(report_dir: Path | None = None) -> int:
+    """Ingests every report file in the reports folder that isn't stored yet. Returns how many were added."""
+    report_dir = Path(report_dir or _reports_dir())
+    if not report_dir.is_dir():
+        return 0
+    added = 0
+    for report_path in report_dir.glob("*.json"):
+        try:
+            if ingest_file(report_path) is not None:
+                added += 1
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping unreadable report '{report_path}': {e}")
+    logger.info(f"Report history backfill added {added} run(s).")
+    return added
+
+
+def _page(rows: list[sqlite3.Row], limit: int) -> dict:
+    """Wraps a keyset-paginated result. Rows were fetched with limit + 1 to detect a next page."""
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = f"{last['created']!r}:{last['id']}"
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _parse_cursor(cursor: str | None) -> tuple[float, int] | None:
+    if not cursor:
+        return None
+    try:
+        created, row_id = cursor.rsplit(":", 1)
+        return float(created), int(row_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: '{cursor}'") from e
+
+
+def list_runs(source: str | None = None, since: float | None = None, until: float | None = None,
+              limit: int = 50, cursor: str | None = None) -> dict:
+    """Returns run summaries, newest first, one page at a time. Pass `next_cursor` back as `cursor` for the next page."""
+    clauses, params = [], []
+    if source:
+        clauses.append("source = ?")
+        params.append(source)
+    if since is not None:
+        clauses.append("created >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created < ?")
+        params.append(until)
+    position = _parse_cursor(cursor)
+    if position:
+        clauses.append("(created < ? OR (created = ? AND id < ?))")
+        params.extend([position[0], position[0], position[1]])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _connect() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT id, source, created, duration, exitcode, total, passed, failed, error, skipped
+            FROM runs {where} ORDER BY created DESC, id DESC LIMIT ?
+            """,
+            (*params, limit + 1)
+        ).fetchall()
+    return _page(rows, limit)
+
+
+def get_run(run_id: int) -> dict | None:
+    """Returns a run's summary and its full original report."""
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+    if row is None:
+        return None
+    run = dict(row)
+    run["report"] = json.loads(zlib.decompress(run["report"]))
+    return run
+
+
+def list_test_results(nodeid: str | None = None, outcome: str | None = None, since: float | None = None,
+                      until: float | None = None, limit: int = 50, cursor: str | None = None) -> dict:
+    """Returns individual test results across runs, newest first, one page at a time."""
+    clauses, params = [], []
+    if nodeid:
+        clauses.append("nodeid = ?")
+        params.append(nodeid)
+    if outcome:
+        clauses.append("outcome = ?")
+        params.append(outcome)
+    if since is not None:
+        clauses.append("created >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created < ?")
+        params.append(until)
+    position = _parse_cursor(cursor)
+    if position:
+        clauses.append("(created < ? OR (created = ? AND id < ?))")
+        params.extend([position[0], position[0], position[1]])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _connect() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT id, run_id, nodeid, outcome, duration, created, longrepr
+            FROM test_results {where} ORDER BY created DESC, id DESC LIMIT ?
+            """,
+            (*params, limit + 1)
+        ).fetchall()
+    return _page(rows, limit)
+
+
+def latest_durations() -> dict[str, float]:
+    """Returns each test's duration in its most recent run that actually ran it, keyed by pytest node id."""
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT nodeid, duration FROM (
+                SELECT nodeid, duration, ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY created DESC) AS position
+                FROM test_results WHERE longrepr IS NULL OR longrepr NOT LIKE ? || '%'
+            ) WHERE position = 1
+            """,
+            (NOT_RUN_PREFIX,)
+        ).fetchall()
+    return {row["nodeid"]: row["duration"] for row in rows}
+
+
+def duration_rows(since: float | None = None, until: float | None = None, nodeid: str | None = None) -> list[tuple]:
+    """
+    Returns (nodeid, created, duration, setup, call, teardown) for every passed result, ordered by
+    test and then by time, for duration analytics. Failures are left out: a test that starts failing
+    on a timeout, or that a shard never reached, says nothing about how fast it runs.
+    """
+    clauses, params = ["outcome = 'passed'"], []
+    if nodeid:
+        clauses.append("nodeid = ?")
+        params.append(nodeid)
+    if since is not None:
+        clauses.append("created >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created < ?")
+        params.append(until)
+    with _connect() as conn:
+        return conn.execute(
+            f"""
+            SELECT nodeid, created, duration, setup_duration, call_duration, teardown_duration
+            FROM test_results WHERE {' AND '.join(clauses)} ORDER BY nodeid, created
+            """,
+            params
+        ).fetchall()
@@ -0,0 +1,66 @@
+import json
+import os
+
+# A small pytest plugin that reports test progress as JSON lines on an inherited file descriptor.
+# Load it with `-p intelli_test.utilities.resultStream` and set INTELLI_TEST_EVENT_FD to the write
+# end of a pipe; without the variable it does nothing. It imports nothing from the rest of the
+# package, so it can load before any project conftest has run.
+
+EVENT_FD_ENV_VAR = "INTELLI_TEST_EVENT_FD"
+
+# Tracebacks are cut down to this many characters; the full text is in the JSON report.
+_MAX_LONGREPR = 4000
+
+_stream = None
+
+
+def _emit(event: str, **data):
+    if _stream is None:
+        return
+    try:
+        _stream.write(json.dumps({"event": event, **data}, default=str) + "\n")
+        _stream.flush()
+    except (BrokenPipeError, OSError):
+        # The reader went away (e.g. the client disconnected). Keep the run going without events.
+        _close()
+
+
+def _close():
+    global _stream
+    if _stream is not None:
+        try:
+            _stream.close()
+        except OSError:
+            pass
+        _stream = None
+
+
+def pytest_configure(config):
+    global _stream
+    fd = os.environ.get(EVENT_FD_ENV_VAR)
+    if fd and _stream is None:
+        _stream = os.fdopen(int(fd), "w", buffering=1, encoding="utf-8")
+
+
+def pytest_collection_finish(session):
+    _emit("collected", count=len(session.items), tests=[item.nodeid for item in session.items])
+
+
+def pytest_runtest_logstart(nodeid, location):
+    _emit("started", nodeid=nodeid)
+
+
+def pytest_runtest_logreport(report):
+    # One result per test: the call phase, or whichever setup/teardown phase went wrong.
+    if report.when == "call" or (report.when == "setup" and not report.passed) or (report.when == "teardown" and report.failed):
+        outcome = report.outcome if report.when == "call" or report.skipped else "error"
+        longrepr = str(report.longrepr)[-_MAX_LONGREPR:] if report.longrepr else None
+        _emit("result", nodeid=report.nodeid, when=report.when, outcome=outcome, duration=report.duration, longrepr=longrepr)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    _emit("finished", exitstatus=int(exitstatus), failed=session.testsfailed, collected=session.testscollected)
+
+
+def pytest_unconfigure(config):
+    _close()
@@ -1,57 +1,169 @@
-import json
-import os
+import re
 import logging
+import sqlite3
 from playwright.sync_api import Page, Locator, TimeoutError
-
-# Correctly determine the project root, which is three levels up from this file's directory.
-PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
-FINGERPRINTS_FOLDER = os.path.join(PROJECT_ROOT, 'elements')
+from . import config, fingerprintIndex, healJournal, htmlSimplifier
 
 logger = logging.getLogger(__name__)
 
-# --- Fingerprint Caching ---
-FINGERPRINTS_CACHE = {}
+# --- Self-Healing ---
+# Scores every candidate of the fingerprinted tag in a single page.evaluate call and returns a
+# unique, stable CSS selector for the best one. Signals: own-text similarity, identifying
+# attributes, role, and distance from the element's recorded position. A perfect match scores 190.
+_HEAL_SCRIPT = """
+(fp) => {
+    const WEIGHTS = { "data-testid": 30, "id": 25, "name": 20, "aria-label": 15, "placeholder": 10, "href": 10, "type": 5 };
+""" + htmlSimplifier.ROLE_JS + """
+    const normalize = (text) => (text || "").replace(/\\s+/g, " ").trim().toLowerCase().slice(0, 200);
+    const bigrams = (text) => {
+        const grams = new Map();
+        for (let i = 0; i < text.length - 1; i++) {
+            const gram = text.slice(i, i + 2);
+            grams.set(gram, (grams.get(gram) || 0) + 1);
+        }
+        return grams;
+    };
+    // Dice coefficient over character bigrams: 1.0 for identical strings, 0.0 for nothing in common.
+    const similarity = (a, b) => {
+        if (a === b) return 1;
+        if (a.length < 2 || b.length < 2) return 0;
+        const ga = bigrams(a), gb = bigrams(b);
+        let overlap = 0;
+        for (const [gram, count] of ga) overlap += Math.min(count, gb.get(gram) || 0);
+        return (2 * overlap) / (a.length - 1 + b.length - 1);
+    };
+    const isUnique = (selector) => {
+        try { return document.querySelectorAll(selector).length === 1; } catch (e) { return false; }
+    };
+    const stableSelector = (el) => {
+        const tag = el.tagName.toLowerCase();
+        if (el.id && isUnique(`#${CSS.escape(el.id)}`)) return `#${CSS.escape(el.id)}`;
+        for (const attr of ["data-testid", "name", "aria-label", "placeholder"]) {
+            const value = el.getAttribute(attr);
+            if (value) {
+                const selector = `${tag}[${attr}="${CSS.escape(value)}"]`;
+                if (isUnique(selector)) return selector;
+            }
+        }
+        // Fall back to a structural path anchored at the nearest ancestor with a unique id.
+        const parts = [];
+        let node = el;
+        while (node && node.nodeType === Node.ELEMENT_NODE && node !== document.documentElement) {
+            if (node !== el && node.id && isUnique(`#${CSS.escape(node.id)}`)) {
+                parts.unshift(`#${CSS.escape(node.id)}`);
+                break;
+            }
+            const name = node.tagName.toLowerCase();
+            const siblings = node.parentElement ? Array.from(node.parentElement.children).filter((c) => c.tagName === node.tagName) : [];
+            parts.unshift(siblings.length > 1 ? `${name}:nth-of-type(${siblings.indexOf(node) + 1})` : name);
+            node = node.parentElement;
+        }
+        return parts.join(" > ");
+    };
+
+    const wantedText = normalize(fp.text);
+    const wantedClasses = new Set((fp.attrs["class"] || "").split(/\\s+/).filter(Boolean));
+    const diagonal = Math.hypot(document.documentElement.scrollWidth, document.documentElement.scrollHeight) || 1;
+
+    let best = null;
+    const candidates = document.querySelectorAll(fp.tag || "*");
+    for (let i = 0; i < candidates.length && i < fp.maxCandidates; i++) {
+        const el = candidates[i];
+        const rect = el.getBoundingClientRect();
+        if (rect.width === 0 && rect.height === 0) continue;
+
+        let score = 0;
+        const text = normalize(el.innerText || el.value || "");
+        score += wantedText ? 40 * similarity(wantedText, text) : (text ? 0 : 5);
+        for (const [attr, weight] of Object.entries(WEIGHTS)) {
+            if (fp.attrs[attr] && el.getAttribute(attr) === fp.attrs[attr]) score += weight;
+        }
+        if (wantedClasses.size && el.classList.length) {
+            let shared = 0;
+            for (const c of el.classList) if (wantedClasses.has(c)) shared++;
+            score += 10 * shared / (wantedClasses.size + el.classList.length - shared);
+        }
+        if (fp.role && roleOf(el) === fp.role) score += 10;
+        if (fp.rect) {
+            const dx = (rect.left + window.scrollX + rect.width / 2) - (fp.rect.x + fp.rect.width / 2);
+            const dy = (rect.top + window.scrollY + rect.height / 2) - (fp.rect.y + fp.rect.height / 2);
+            score += 15 * (1 - Math.min(1, Math.hypot(dx, dy) / diagonal));
+        }
+        if (!best || score > best.score) best = { el, score };
+    }
+    if (!best || best.score < fp.minScore) return best ? { selector: null, score: best.score } : null;
+    return { selector: stableSelector(best.el), score: best.score };
+}
+"""
+
+# Pulls identifying attributes out of a CSS selector, for fingerprints recorded before signals were stored.
+_SELECTOR_ATTR_PATTERN = re.compile(r"""\[([\w-]+)\s*=\s*['"]?([^'"\]]+)['"]?\]""")
+_SELECTOR_ID_PATTERN = re.compile(r"#([\w-]+)")
+
 
-def _load_fingerprints(category: str):
-    """Loads and caches element definitions from a JSON file to avoid re-reading."""
-    if category in FINGERPRINTS_CACHE:
-        return FINGERPRINTS_CACHE[category]
+def _healing_signals(fingerprint: dict) -> dict:
+    """Builds the signals the heal script scores against from a fingerprint entry."""
+    signals = fingerprint.get("signals") or {}
+    attrs = dict(signals.get("attrs") or {})
+    if not attrs:
+        selector = fingerprint.get("primary_selector", "")
+        attrs = {name: value for name, value in _SELECTOR_ATTR_PATTERN.findall(selector)}
+        id_match = _SELECTOR_ID_PATTERN.search(selector)
+        if id_match and "id" not in attrs:
+            attrs["id"] = id_match.group(1)
+    return {
+        "tag": fingerprint.get("tag"),
+        "text": fingerprint.get("text") or "",
+        "attrs": attrs,
+        "role": signals.get("role"),
+        "rect": signals.get("rect"),
+        "minScore": config.HEAL_MIN_SCORE,
+        "maxCandidates": config.HEAL_MAX_CANDIDATES
+    }
 
-    fingerprints_file = os.path.join(FINGERPRINTS_FOLDER, f"{category}.json")
-    logger.info(f"Loading element definitions from: {fingerprints_file}")
+
+def _journal_call(func, *args):
+    """Runs a heal journal operation. A journal failure must never fail the test that triggered it."""
     try:
-        with open(fingerprints_file, 'r') as f:
-            fingerprints = json.load(f)
-            FINGERPRINTS_CACHE[category] = fingerprints
-            return fingerprints
-    except FileNotFoundError as e:
-        error_msg = f"The element definition file was not found at: {fingerprints_file}"
-        logger.error(error_msg, exc_info=True)
-        raise FileNotFoundError(error_msg) from e
-    except json.JSONDecodeError as e:
-        error_msg = f"The definition file at {fingerprints_file} is not a valid JSON file."
-        logger.error(error_msg, exc_info=True)
-        raise ValueError(error_msg) from e
+        return func(*args)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Heal journal unavailable ({e}). Continuing without it.")
+        return None
+
 
 def find_element_smart(page: Page, elements_category: str, element_key: str) -> Locator:
     """
     Finds a Playwright Locator using a primary selector, with a self-healing
     fallback that logs its actions.
     """
-    FINGERPRINTS = _load_fingerprints(elements_category)
+    # Records come from a shared, memory-mapped index that is rebuilt whenever a fingerprint file changes.
     try:
-        # The fingerprint file now has a root 'elements' key.
-        elements = FINGERPRINTS.get("elements", {})
-        if not elements:
-            raise KeyError(f"No 'elements' found in fingerprint file for '{elements_category}'. The file might be malformed.")
-        fingerprint = elements[element_key]
+        fingerprint = fingerprintIndex.get_element(elements_category, element_key)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(str(e), exc_info=True)
+        raise
     except KeyError as e:
         error_msg = f"Element key '{element_key}' not found within the 'elements' of category '{elements_category}'."
         logger.error(error_msg)
         raise KeyError(error_msg) from e
 
-    # 1. Try the primary selector first.
-    primary_locator = page.locator(fingerprint["primary_selector"])
+    primary_selector = fingerprint["primary_selector"]
+
+    # 1. A selector healed on an earlier run goes first; the primary one is known to be broken.
+    healed_selector = _journal_call(healJournal.lookup, elements_category, element_key, primary_selector)
+    if healed_selector:
+        healed_locator = page.locator(healed_selector)
+        try:
+            healed_locator.wait_for(state="attached", timeout=2000)
+            logger.info(f"Found element '{element_key}' using previously healed selector: {healed_selector}")
+            _journal_call(healJournal.record_hit, elements_category, element_key)
+            return healed_locator
+        except TimeoutError:
+            logger.warning(f"Previously healed selector for '{element_key}' no longer matches. Dropping it from the heal journal.")
+            _journal_call(healJournal.discard, elements_category, element_key)
+
+    # 2. Try the primary selector.
+    primary_locator = page.locator(primary_selector)
     try:
         primary_locator.wait_for(state="attached", timeout=2000)
         logger.info(f"Found element '{element_key}' using primary selector.")
@@ -59,23 +171,15 @@ def find_element_smart(page: Page, elements_category: str, element_key: str) ->
     except TimeoutError:
         logger.warning(f"Primary locator for '{element_key}' failed. Attempting self-healing search (smart matching).")
 
-    # 2. If it fails, search for candidates using locators and score them.
-    candidates_locator = page.locator(fingerprint["tag"])
-    best_candidate_locator = None
-    highest_score = -1
-
-    for i in range(candidates_locator.count()):
-        candidate_locator = candidates_locator.nth(i)
-        # Scoring based on text match.
-        score = 10 if candidate_locator.inner_text().strip() == fingerprint.get("text") else 0
-        if score > highest_score:
-            highest_score = score
-            best_candidate_locator = candidate_locator
-
-    if best_candidate_locator:
-        logger.info(f"Self-healed! Found locator for '{element_key}' using fallback search: ${best_candidate_locator}")
-        return best_candidate_locator
+    # 3. If it fails, score every candidate in-page in a single round-trip.
+    result = page.evaluate(_HEAL_SCRIPT, _healing_signals(fingerprint))
+    if result and result.get("selector"):
+        logger.info(f"Self-healed! Found locator for '{element_key}' using fallback search: {result['selector']} (score {result['score']:.1f})")
+        _journal_call(healJournal.record, elements_category, element_key, primary_selector, result["selector"], result["score"])
+        return page.locator(result["selector"])
 
+    if result:
+        logger.warning(f"Best healing candidate for '{element_key}' scored {result['score']:.1f}, below the minimum of {config.HEAL_MIN_SCORE}.")
     error_msg = f"Could not find or heal locator for element: '{element_key}'"
     logger.error(error_msg)
-    raise TimeoutError(error_msg)
\ No newline at end of file
+    raise TimeoutError(error_msg)
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable
+
+
+class SQLiteStore:
+    """
+    A SQLite database shared by every API process and worker: created with its schema on first
+    use, in WAL mode so reads proceed while another process writes, and opened per operation in
+    autocommit mode. Use BEGIN IMMEDIATE for read-modify-write transactions.
+    `path` is called on each connection, so the location follows config changes.
+    """
+
+    def __init__(self, path: Callable[[], str], schema: str, row_factory=None, foreign_keys: bool = False):
+        self._path = path
+        self._schema = schema
+        self._row_factory = row_factory
+        self._foreign_keys = foreign_keys
+        self._ready: set[str] = set()
+
+    def init(self):
+        """Creates the database file, its folder and its tables if needed."""
+        path = self._path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self._schema)
+        finally:
+            conn.close()
+        self._ready.add(path)
+
+    @contextmanager
+    def connect(self):
+        """Opens a connection, initialising the database on first use."""
+        path = self._path()
+        if path not in self._ready:
+            self.init()
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        if self._row_factory is not None:
+            conn.row_factory = self._row_factory
+        if self._foreign_keys:
+            conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,324 @@
+import argparse
+import ast
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from . import config, fingerprintIndex, testSharding
+
+logger = logging.getLogger(__name__)
+
+# Generated tests locate every element through smartElementFinder.find_element_smart(page, '<category>', '<key>'),
+# and region-scoped visual checks name element keys too, so which fingerprints a test file depends on can be
+# read from its source without running it. Dependencies are tracked per test file, the unit pytest is given.
+_FINDER = "find_element_smart"
+_VISUAL = "compare_test_run_images"
+# Positional indexes of (elements_category, regions, masks) in compare_test_run_images.
+_VISUAL_ARGS = {"elements_category": 5, "regions": 3, "masks": 4}
+
+
+@dataclass
+class Dependencies:
+    # Element keys used per category; None means any key of that category (the key isn't a literal).
+    elements: dict[str, set[str] | None] = field(default_factory=dict)
+    # Set when a category can't be resolved statically. Such tests are always selected.
+    dynamic: bool = False
+
+    def add(self, category: str, key: str | None):
+        keys = self.elements.setdefault(category, set())
+        if keys is None:
+            return
+        if key is None:
+            self.elements[category] = None
+        else:
+            keys.add(key)
+
+    def to_dict(self) -> dict:
+        return {
+            "elements": {category: sorted(keys) if keys is not None else None for category, keys in sorted(self.elements.items())},
+            "dynamic": self.dynamic
+        }
+
+
+@dataclass
+class Selection:
+    tests: list[str]
+    # Changed element keys per category since the snapshot; None for a category means all of it.
+    # None overall means there's no snapshot yet, so every test is selected.
+    changes: dict[str, set[str] | None] | None
+    reasons: dict[str, list[str]]
+    digests: dict = field(default_factory=dict, repr=False)
+    # False when the changes were given explicitly rather than measured against the snapshot.
+    from_snapshot: bool = True
+
+    def to_dict(self) -> dict:
+        return {
+            "tests": self.tests,
+            "full_run": self.changes is None,
+            "changes": None if self.changes is None else {
+                category: sorted(keys) if keys is not None else None for category, keys in sorted(self.changes.items())
+            },
+            "reasons": self.reasons
+        }
+
+
+_cache_lock = threading.Lock()
+_cache: dict[str, tuple[tuple[int, int], Dependencies]] = {}
+
+
+def _tests_dir() -> Path:
+    return config.PROJECT_ROOT.parent / "tests"
+
+
+def _literal(node: ast.AST | None, constants: dict[str, str]) -> str | None:
+    """Resolves a string literal, or a module-level name bound to one."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    return None
+
+
+def _argument(call: ast.Call, name: str, position: int) -> ast.AST | None:
+    for keyword in call.keywords:
+        if keyword.arg == name:
+            return keyword.value
+    return call.args[position] if len(call.args) > position else None
+
+
+def _called_name(call: ast.Call) -> str | None:
+    if isinstance(call.func, ast.Attribute):
+        return call.func.attr
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    return None
+
+
+def parse_dependencies(source: str, filename: str = "<test>") -> Dependencies:
+    """Finds the fingerprint categories and element keys a test module uses."""
+    dependencies = Dependencies()
+    try:
+        tree = ast.parse(source, filename=filename)
+    except SyntaxError as e:
+        logger.warning(f"Could not parse {filename} ({e}). It will always be selected.")
+        dependencies.dynamic = True
+        return dependencies
+
+    constants = {
+        node.targets[0].id: node.value.value
+        for node in tree.body
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+        and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+    }
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        name = _called_name(node)
+        if name == _FINDER:
+            category_node = _argument(node, "elements_category", 1)
+            category = _literal(category_node, constants)
+            if category is None:
+                dependencies.dynamic = True
+                continue
+            dependencies.add(category, _literal(_argument(node, "element_key", 2), constants))
+        elif name == _VISUAL:
+            category_node = _argument(node, "elements_category", _VISUAL_ARGS["elements_category"])
+            if category_node is None or (isinstance(category_node, ast.Constant) and category_node.value is None):
+                continue  # Whole-page check with CSS-selector masks only.
+            category = _literal(category_node, constants)
+            if category is None:
+                dependencies.dynamic = True
+                continue
+            for argument in ("regions", "masks"):
+                value = _argument(node, argument, _VISUAL_ARGS[argument])
+                if value is None:
+                    continue
+                if isinstance(value, (ast.List, ast.Tuple)):
+                    # Masks may also be CSS selectors; treating them as keys only over-selects.
+                    for element in value.elts:
+                        dependencies.add(category, _literal(element, constants))
+                else:
+                    dependencies.add(category, None)
+    return dependencies
+
+
+def _file_dependencies(path: Path) -> Dependencies:
+    """Parses a test file, reusing the previous result while the file is unchanged."""
+    stat = path.stat()
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(str(path))
+        if cached and cached[0] == stat_key:
+            return cached[1]
+    try:
+        dependencies = parse_dependencies(path.read_text(encoding="utf-8"), path.name)
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Could not read {path} ({e}). It will always be selected.")
+        dependencies = Dependencies(dynamic=True)
+    with _cache_lock:
+        _cache[str(path)] = (stat_key, dependencies)
+    return dependencies
+
+
+def dependency_index(tests_dir: Path | None = None) -> dict[str, Dependencies]:
+    """Maps each test file (relative to the tests folder) to the fingerprints it depends on."""
+    tests_dir = Path(tests_dir or _tests_dir())
+    if not tests_dir.is_dir():
+        return {}
+    return {
+        path.relative_to(tests_dir).as_posix(): _file_dependencies(path)
+        for path in sorted(tests_dir.rglob("test_*.py"))
+    }
+
+
+def load_snapshot() -> dict | None:
+    """Returns the element hashes recorded by the last affected run, or None if there's no snapshot yet."""
+    try:
+        with open(config.TEST_IMPACT_SNAPSHOT_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f).get("categories")
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, AttributeError) as e:
+        logger.warning(f"Ignoring unreadable impact snapshot at {config.TEST_IMPACT_SNAPSHOT_PATH}: {e}")
+        return None
+
+
+def save_snapshot(digests: dict):
+    """Records `digests` (from fingerprintIndex.element_digests) as the new baseline for change detection."""
+    path = config.TEST_IMPACT_SNAPSHOT_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"created": time.time(), "categories": digests}, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def diff_digests(previous: dict, current: dict) -> dict[str, set[str] | None]:
+    """
+    Compares two element hash snapshots. Returns the changed (added, removed or modified) keys per
+    category; a category that was added, removed or is unreadable maps to None.
+    """
+    changes = {}
+    for category in previous.keys() | current.keys():
+        old, new = previous.get(category), current.get(category)
+        if old is None or new is None:
+            changes[category] = None
+            continue
+        changed = {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+        if changed:
+            changes[category] = changed
+    return changes
+
+
+def _reasons(dependencies: Dependencies, changes: dict[str, set[str] | None]) -> list[str]:
+    if not changes:
+        return []
+    if dependencies.dynamic:
+        return ["uses element categories that can't be resolved statically"]
+    reasons = []
+    for category, keys in dependencies.elements.items():
+        if category not in changes:
+            continue
+        changed = changes[category]
+        if changed is None:
+            reasons.append(f"{category} changed")
+        elif keys is None:
+            reasons.append(f"{category}: {', '.join(sorted(changed))} changed")
+        elif hit := keys & changed:
+            reasons.append(f"{category}: {', '.join(sorted(hit))} changed")
+    return reasons
+
+
+def plan_affected(categories: list[str] | None = None) -> Selection:
+    """
+    Selects the test files affected by fingerprint changes. By default the changes are measured
+    against the snapshot of the last affected run; with `categories`, those fingerprint files are
+    treated as entirely changed instead. Without a snapshot, every test is selected.
+    """
+    digests = fingerprintIndex.element_digests()
+    if categories:
+        changes = {category: None for category in categories}
+    else:
+        previous = load_snapshot()
+        changes = None if previous is None else diff_digests(previous, digests)
+
+    index = dependency_index()
+    if changes is None:
+        logger.info("No fingerprint snapshot yet. Selecting every test.")
+        return Selection(tests=list(index), changes=None, reasons={}, digests=digests)
+
+    reasons = {}
+    for test_file, dependencies in index.items():
+        test_reasons = _reasons(dependencies, changes)
+        if test_reasons:
+            reasons[test_file] = test_reasons
+    logger.info(f"{len(changes)} changed fingerprint file(s) affect {len(reasons)} of {len(index)} test file(s).")
+    return Selection(tests=list(reasons), changes=changes, reasons=reasons, digests=digests, from_snapshot=not categories)
+
+
+def run_affected(selection: Selection | None = None, shard_count: int | None = None, timeout: int | None = None,
+                 update_snapshot: bool = True) -> dict:
+    """
+    Runs the selected test files through the sharded runner and writes the merged report to
+    reports/report-affected-tests.json. When the selection was measured against the snapshot and
+    every selected test passed, the snapshot then moves forward to the fingerprints the selection
+    was planned from. After failures, errors or tests a shard never reached, it stays put, so the
+    next affected run selects the same tests again.
+    """
+    selection = selection or plan_affected()
+    report = None
+    if selection.tests:
+        tests_dir = _tests_dir()
+        report = testSharding.run_sharded(
+            shard_count=shard_count,
+            timeout=timeout,
+            report_path=config.PROJECT_ROOT.parent / "reports" / "report-affected-tests.json",
+            test_paths=[tests_dir / test_file for test_file in selection.tests]
+        )
+    else:
+        logger.info("No tests are affected by the fingerprint changes.")
+
+    summary = report["summary"] if report else None
+    # 5 means no tests were collected, which is fine when the selected files hold none.
+    passed = report is None or (not summary.get("failed") and not summary.get("error") and report["exitcode"] in (0, 5))
+    # An explicit category list doesn't validate the other pending changes, so it leaves the snapshot alone.
+    snapshot_updated = update_snapshot and selection.from_snapshot and passed
+    if snapshot_updated:
+        save_snapshot(selection.digests)
+    elif update_snapshot and selection.from_snapshot:
+        logger.warning("Some affected tests failed or didn't run. Keeping the fingerprint snapshot so they're selected again next time.")
+    return selection.to_dict() | {"summary": summary, "snapshot_updated": snapshot_updated}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run only the tests affected by changed fingerprint files.")
+    parser.add_argument("--category", action="append", dest="categories", default=None,
+                        help="Treat this fingerprint file as changed (repeatable). Defaults to changes since the last affected run")
+    parser.add_argument("--shards", type=int, default=None, help=f"Parallel pytest processes. Defaults to {config.TEST_SHARDS}")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the affected tests")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    selection = plan_affected(args.categories)
+    for test_file in selection.tests:
+        print(f"{test_file}: {'; '.join(selection.reasons.get(test_file, ['full run']))}")
+    if args.dry_run:
+        return 0
+    result = run_affected(selection, shard_count=args.shards)
+    summary = result["summary"] or {}
+    print(f"Ran {len(result['tests'])} affected test file(s): {summary or 'nothing to run'}")
+    return 1 if summary.get("failed") or summary.get("error") else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
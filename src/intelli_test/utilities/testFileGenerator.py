@@ -1,7 +1,7 @@
 import google.generativeai as genai
 import logging
 import os
-from . import config
+from . import config, fingerprintIndex, llmCache
 import json
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
@@ -12,11 +12,8 @@ model = genai.GenerativeModel(model_name=config.MODEL_NAME)
 logger = logging.getLogger(__name__)
 
 def get_available_page_objects():
-    """Scans the elements directory to find available page object models."""
-    elements_dir = os.path.join(PROJECT_ROOT, 'elements')
-    if not os.path.isdir(elements_dir):
-        return []
-    return [f.removesuffix('.json') for f in os.listdir(elements_dir) if f.endswith('.json')]
+    """Returns the available page object models, as listed in the shared fingerprint index."""
+    return fingerprintIndex.list_categories()
 
 def build_test_file_prompt(description: str, fingerprint_filename: str | None = None, requires_login: bool = False) -> str:
     """Constructs the prompt for generating a complete Python test file."""
@@ -49,6 +46,8 @@ def build_test_file_prompt(description: str, fingerprint_filename: str | None =
                 navigation_instruction = f"5.  The test MUST begin by navigating to the page's specific URL. Use `{fixture_name}.goto('{page_url}')`."
 
             
+            # Healing signals are only for the in-page fallback; they'd just add noise to the prompt.
+            elements = {key: {k: v for k, v in value.items() if k != "signals"} if isinstance(value, dict) else value for key, value in elements.items()}
             elements_str = json.dumps(elements, indent=2)
             page_object_name = fingerprint_filename.removesuffix('.json')
 
@@ -89,16 +88,18 @@ You are an expert Python test automation engineer specializing in Playwright and
 **Generated Python Code:**
 """
 
-def generate_test_file(description: str, file_name: str, fingerprint_filename: str | None = None, requires_login: bool = False):
-    """Generates a test file from a description and saves it."""
+def generate_test_file(description: str, file_name: str, fingerprint_filename: str | None = None, requires_login: bool = False, bypass_cache: bool = False):
+    """
+    Generates a test file from a description and saves it.
+    Set `bypass_cache` to force a fresh model response even if the prompt was seen before.
+    """
     logger.info(f"Starting test file generation for: {file_name}")
     
     prompt = build_test_file_prompt(description, fingerprint_filename=fingerprint_filename, requires_login=requires_login)
     
     try:
         logger.info("Sending request to generative AI for test file generation...")
-        response = model.generate_content(prompt)
-        generated_code = response.text.strip()
+        generated_code = llmCache.generate_text(model, prompt, bypass_cache=bypass_cache).strip()
 
         # Clean the response to remove markdown fences, which the model sometimes adds despite instructions.
         if generated_code.startswith("```python"):
@@ -107,6 +108,7 @@ def generate_test_file(description: str, file_name: str, fingerprint_filename: s
             generated_code = generated_code.removesuffix("```").strip()
 
         if not generated_code.startswith("import"):
+            llmCache.discard(model, prompt)
             raise ValueError("Generated response does not appear to be valid Python code.")
 
         output_path = os.path.join(PROJECT_ROOT, 'tests', file_name)
@@ -121,4 +123,5 @@ def generate_test_file(description: str, file_name: str, fingerprint_filename: s
         logger.info(f"Successfully generated and saved test file to {output_path}")
 
     except Exception as e:
-        logger.error(f"Failed to generate test file '{file_name}': {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Failed to generate test file '{file_name}': {e}", exc_info=True)
+        raise
\ No newline at end of file
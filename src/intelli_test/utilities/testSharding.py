@@ -0,0 +1,188 @@
+import heapq
+import json
+import logging
+import os
+import signal
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from . import config, reportHistory
+
+logger = logging.getLogger(__name__)
+
+# Environment variable telling a pytest process which shard it is (used e.g. to keep shard logs apart).
+SHARD_ENV_VAR = "INTELLI_TEST_SHARD"
+
+
+def _project_root() -> Path:
+    return config.PROJECT_ROOT.parent
+
+
+def _reports_dir() -> Path:
+    return _project_root() / "reports"
+
+
+def collect_test_ids(paths: Path | list[Path], timeout: int = 120) -> list[str]:
+    """Lists the node ids of every test under `paths` (a directory or test files) without running them."""
+    paths = [paths] if isinstance(paths, Path) else paths
+    result = subprocess.run(
+        ["pytest", *map(str, paths), "--collect-only", "-q", "-p", "no:cacheprovider"],
+        capture_output=True,
+        text=True,
+        cwd=_project_root(),
+        timeout=timeout
+    )
+    test_ids = [line.strip() for line in result.stdout.splitlines() if "::" in line and not line.startswith(" ")]
+    if not test_ids and result.returncode not in (0, 5):  # 5: no tests collected
+        raise RuntimeError(f"Test collection failed with exit code {result.returncode}: {result.stdout[-2000:]}{result.stderr[-2000:]}")
+    return test_ids
+
+
+def plan_shards(test_ids: list[str], durations: dict[str, float], shard_count: int) -> list[list[str]]:
+    """
+    Splits tests into `shard_count` shards with roughly equal expected run time, using the
+    longest-processing-time-first heuristic: tests are taken longest first and each goes to the
+    currently lightest shard. Tests with no history are assumed to take the median known duration;
+    so are 0s durations, which would otherwise pile onto one shard without ever adding to its load.
+    """
+    durations = {test_id: duration for test_id, duration in durations.items() if duration and duration > 0}
+    known = [durations[t] for t in test_ids if t in durations]
+    default = statistics.median(known) if known else config.TEST_SHARD_DEFAULT_DURATION
+    shard_count = max(1, min(shard_count, len(test_ids)))
+
+    ordered = sorted(test_ids, key=lambda t: durations.get(t, default), reverse=True)
+    shards = [[] for _ in range(shard_count)]
+    loads = [(0.0, index) for index in range(shard_count)]
+    for test_id in ordered:
+        load, index = heapq.heappop(loads)
+        shards[index].append(test_id)
+        heapq.heappush(loads, (load + durations.get(test_id, default), index))
+
+    for index, shard in enumerate(shards):
+        expected = sum(durations.get(t, default) for t in shard)
+        logger.info(f"Shard {index}: {len(shard)} test(s), ~{expected:.1f}s expected.")
+    return shards
+
+
+def run_shard(index: int, test_ids: list[str], report_path: Path, timeout: int) -> dict:
+    """
+    Runs one shard in its own pytest process. On timeout the process is interrupted first, so pytest
+    still writes a report for the tests that finished, and killed only if it doesn't stop in time.
+    """
+    command = [
+        "pytest",
+        *test_ids,
+        "--json-report",
+        f"--json-report-file={report_path}",
+        "--tb=short",
+    ]
+    env = {**os.environ, SHARD_ENV_VAR: str(index)}
+    started = time.time()
+    timed_out = False
+    logger.info(f"Starting shard {index} with {len(test_ids)} test(s).")
+    process = subprocess.Popen(command, cwd=_project_root(), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        exitcode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        logger.error(f"Shard {index} exceeded its {timeout}s timeout. Interrupting it.")
+        process.send_signal(signal.SIGINT)
+        try:
+            exitcode = process.wait(timeout=config.TEST_SHARD_INTERRUPT_GRACE)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            exitcode = process.wait()
+    duration = time.time() - started
+    logger.info(f"Shard {index} finished with exit code {exitcode} in {duration:.1f}s.")
+    return {"index": index, "tests": test_ids, "exitcode": exitcode, "duration": duration, "timed_out": timed_out, "report_path": report_path}
+
+
+def merge_reports(shard_results: list[dict]) -> dict:
+    """
+    Merges per-shard pytest-json-report files into one report in the same format.
+    Tests a shard never reported (because it timed out or crashed) are included as errors whose
+    longrepr starts with reportHistory.NOT_RUN_PREFIX, so their 0s duration isn't taken as history.
+    """
+    tests = []
+    collectors = []
+    for shard in shard_results:
+        report = {}
+        report_path = shard["report_path"]
+        if report_path.is_file():
+            try:
+                report = json.loads(report_path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError) as e:
+                logger.error(f"Could not read the report of shard {shard['index']}: {e}")
+        shard_tests = report.get("tests", [])
+        tests.extend(shard_tests)
+        collectors.extend(report.get("collectors", []))
+
+        reported = {test["nodeid"] for test in shard_tests}
+        reason = "timed out" if shard["timed_out"] else f"exited with code {shard['exitcode']}"
+        for test_id in shard["tests"]:
+            if test_id not in reported:
+                tests.append({
+                    "nodeid": test_id,
+                    "outcome": "error",
+                    "setup": {"duration": 0.0, "outcome": "error", "longrepr": f"{reportHistory.NOT_RUN_PREFIX} shard {shard['index']} {reason} before reaching this test."}
+                })
+
+    summary = {"total": len(tests), "collected": len(tests)}
+    for test in tests:
+        summary[test["outcome"]] = summary.get(test["outcome"], 0) + 1
+
+    return {
+        "created": time.time(),
+        # Shards run side by side, so the run takes as long as the slowest one.
+        "duration": max((shard["duration"] for shard in shard_results), default=0.0),
+        "exitcode": max((shard["exitcode"] for shard in shard_results), default=0),
+        "root": str(_project_root()),
+        "summary": summary,
+        "collectors": collectors,
+        "tests": tests,
+        "shards": [
+            {key: value for key, value in shard.items() if key not in ("tests", "report_path")} | {"test_count": len(shard["tests"])}
+            for shard in shard_results
+        ]
+    }
+
+
+def run_sharded(shard_count: int | None = None, timeout: int | None = None, report_path: Path | None = None,
+                test_paths: list[Path] | None = None) -> dict:
+    """
+    Runs the whole suite, or only the test files in `test_paths`, as balanced shards in parallel
+    pytest processes and writes the merged report to `report_path` (reports/report-all-tests.json
+    by default). Returns the merged report.
+    """
+    shard_count = shard_count or config.TEST_SHARDS
+    timeout = timeout or config.TEST_SHARD_TIMEOUT
+    report_path = report_path or _reports_dir() / "report-all-tests.json"
+    # Keep shard reports of concurrent runs (e.g. "run all" and "run affected") apart.
+    shard_dir = _reports_dir() / "shards" / report_path.stem
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = _project_root() / "tests" if test_paths is None else test_paths
+    test_ids = collect_test_ids(paths) if paths else []
+    if not test_ids:
+        logger.warning("No tests collected. Nothing to run.")
+    shards = plan_shards(test_ids, reportHistory.latest_durations(), shard_count) if test_ids else []
+
+    shard_results = []
+    if shards:
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [
+                executor.submit(run_shard, index, shard, shard_dir / f"shard-{index}.json", timeout)
+                for index, shard in enumerate(shards)
+            ]
+            shard_results = [future.result() for future in futures]
+
+    merged = merge_reports(shard_results)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(merged, indent=2), encoding="utf-8")
+    reportHistory.ingest_quietly(report_path)
+    for shard in shard_results:
+        shard["report_path"].unlink(missing_ok=True)
+    logger.info(f"Merged {len(shard_results)} shard report(s) into {report_path}: {merged['summary']}")
+    return merged
@@ -0,0 +1,120 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import baselineStore, config, imageComparison
+
+logger = logging.getLogger(__name__)
+
+
+def collect_pairs() -> dict[str, list[tuple[str, str]]]:
+    """
+    Finds every baseline/current pair to re-check, grouped by baseline image path so each baseline
+    is decoded once per batch. Pairs come from the baseline store manifest (tests whose last run
+    recorded a mismatching screenshot) and from legacy `{test}_baseline.png` / `{test}_current.png`
+    files still in the images folder.
+    """
+    groups: dict[str, list[tuple[str, str]]] = {}
+    for test_name, entry in baselineStore.load_manifest()["tests"].items():
+        if entry.get("baseline") and entry.get("current"):
+            baseline_path = baselineStore.object_path(entry["baseline"])
+            groups.setdefault(baseline_path, []).append((test_name, baselineStore.object_path(entry["current"])))
+
+    images_dir = config.IMAGES_PATH
+    if os.path.isdir(images_dir):
+        for name in os.listdir(images_dir):
+            if not name.endswith("_baseline.png"):
+                continue
+            test_name = name.removesuffix("_baseline.png")
+            current_path = os.path.join(images_dir, f"{test_name}_current.png")
+            if os.path.exists(current_path):
+                groups.setdefault(os.path.join(images_dir, name), []).append((test_name, current_path))
+    return groups
+
+
+def _compare_group(baseline_path: str, pairs: list[tuple[str, str]], threshold: float) -> list[dict]:
+    """Worker entry point: decodes the baseline once and compares every current image against it."""
+    results = []
+    try:
+        baseline, _ = imageComparison.load_grayscale(baseline_path)
+    except (OSError, ValueError) as e:
+        return [{"test_name": name, "baseline": baseline_path, "current": path, "score": None,
+                 "diff_boxes": [], "passed": False, "error": str(e)} for name, path in pairs]
+
+    for test_name, current_path in pairs:
+        entry = {"test_name": test_name, "baseline": baseline_path, "current": current_path}
+        try:
+            current, _ = imageComparison.load_grayscale(current_path)
+            # No early exit: the report should carry the real score and every diff location.
+            score, diff_boxes = imageComparison.compare_images(baseline, current)
+            entry.update(score=score, diff_boxes=[list(box) for box in diff_boxes], passed=score >= threshold, error=None)
+        except (OSError, ValueError) as e:
+            entry.update(score=None, diff_boxes=[], passed=False, error=str(e))
+        results.append(entry)
+    return results
+
+
+def run_batch(threshold: float | None = None, max_workers: int | None = None, output_path: str | None = None,
+              on_progress=None) -> dict:
+    """
+    Re-checks every baseline/current pair across a process pool and writes a single JSON report.
+    `on_progress(key, entry)` is called as each baseline group finishes. Returns the report.
+    """
+    threshold = config.VISUAL_BATCH_THRESHOLD if threshold is None else threshold
+    max_workers = max_workers or config.VISUAL_BATCH_WORKERS or os.cpu_count()
+    groups = collect_pairs()
+    total = sum(len(pairs) for pairs in groups.values())
+    logger.info(f"Re-checking {total} visual pair(s) against {len(groups)} baseline(s) with {max_workers} worker(s).")
+
+    started = time.time()
+    results = []
+    if groups:
+        # Spawn rather than fork: this also runs inside the API's threaded job workers.
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(_compare_group, path, pairs, threshold): path for path, pairs in groups.items()}
+            for future in as_completed(futures):
+                group_results = future.result()
+                results.extend(group_results)
+                if on_progress:
+                    on_progress("compared", {"done": len(results), "total": total})
+
+    results.sort(key=lambda r: (r["passed"], r["score"] if r["score"] is not None else -1.0, r["test_name"]))
+    report = {
+        "generated_at": time.time(),
+        "duration_seconds": round(time.time() - started, 3),
+        "threshold": threshold,
+        "total": total,
+        "passed": sum(1 for r in results if r["passed"]),
+        "failed": sum(1 for r in results if not r["passed"] and not r["error"]),
+        "errors": sum(1 for r in results if r["error"]),
+        "results": results
+    }
+
+    output_path = output_path or os.path.join(config.VISUAL_REPORTS_PATH, f"visual-report-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    report["report_path"] = output_path
+    logger.info(f"Visual batch report saved to {output_path}: {report['passed']} passed, {report['failed']} failed, {report['errors']} error(s).")
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-check every visual baseline/current pair in parallel.")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help=f"Minimum SSIM score for a pair to pass. Defaults to {config.VISUAL_BATCH_THRESHOLD}")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Defaults to one per CPU core")
+    parser.add_argument("--output", default=None, help="Where to write the JSON report. Defaults to reports/visual/")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_batch(threshold=args.threshold, max_workers=args.workers, output_path=args.output)
+    print(f"{report['passed']}/{report['total']} passed, {report['failed']} failed, {report['errors']} error(s). Report: {report['report_path']}")
+    return 0 if report["passed"] == report["total"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())